@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-16
+#
+
+"""allchars.py [options]
+
+Time the `MATCH_ALLCHARS` rule on worst-case keys: long runs of
+repeated characters that contain every character of the query, but
+not (or only just) in order. The `.*?a.*?b.*?c` regular expression
+the rule used to use backtracks on them. `allchars_score()` doesn't.
+
+Also checks that both give the same score.
+
+Usage:
+    allchars.py [-r <n>]
+    allchars.py -h | --help
+
+Options:
+    -r <n>, --repeat=<n>     Report fastest of this many runs [default: 3].
+    -h, --help               Show this message and exit.
+
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import re
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import docopt
+from workflow.search import allchars_score
+
+# `(query, description, function that returns key of size n, sizes)`
+CASES = (
+    ('abc', "'c' + 'b'*n + 'a'*n", lambda n: 'c' + 'b' * n + 'a' * n,
+     (100, 200, 400, 800)),
+    ('aaab', "'b' + 'a'*n", lambda n: 'b' + 'a' * n, (25, 50, 100)),
+    ('aaab', "'a'*n + 'b'", lambda n: 'a' * n + 'b', (25, 50, 100)),
+    ('doc', "'x/'*n + 'documents'", lambda n: 'x/' * n + 'documents',
+     (100, 1000, 10000)),
+)
+
+
+def regex_score(query, text):
+    """Return score of the old regular expression-based rule."""
+    pattern = ''.join(['.*?' + re.escape(c) for c in query])
+    match = re.compile(pattern, re.IGNORECASE).search(text)
+    if not match:
+        return 0
+    return 100.0 / ((1 + match.start()) * (match.end() - match.start() + 1))
+
+
+def timed(func, repeat):
+    """Return `(result, fastest time)` of `repeat` calls to `func`."""
+    best = None
+    for _ in range(repeat):
+        start = time()
+        result = func()
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return result, best
+
+
+def main():
+    """Run benchmark."""
+    args = docopt.docopt(__doc__)
+    repeat = int(args['--repeat'])
+
+    print('{0:<5}  {1:<22}  {2:>6}  {3:>11}  {4:>11}  {5}'.format(
+          'query', 'key', 'n', 'regex ms', 'matcher ms', 'score'))
+    for query, desc, make_key, sizes in CASES:
+        for n in sizes:
+            text = make_key(n)
+            old, t1 = timed(lambda: regex_score(query, text), 1)
+            new, t2 = timed(lambda: allchars_score(query, text), repeat)
+            assert new == old, (query, n, old, new)
+            print('{0:<5}  {1:<22}  {2:>6}  {3:>11.2f}  {4:>11.3f}  '
+                  '{5:0.4f}'.format(query, desc, n, t1 * 1000, t2 * 1000,
+                                    new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-13
+#
+
+"""compare_filter.py [options]
+
+Check that `Workflow.filter()` returns the same results with a
+`KeyIndex` as without one.
+
+Random keys (with capitals, delimiters, digits and accented letters)
+are filtered with random queries, every combination of `MATCH_*`
+rules, with and without diacritic folding, and with random
+`min_score`, `max_results` and `ascending`. Each query is run
+item by item, with a `KeyIndex`, with a `KeyIndex` that has trigram
+posting lists, and with both indices and a (distant) deadline.
+The results, including scores and rules, must be identical.
+
+Exits with status 1 if any results differ. `tests/test_filter.py`
+compares all of them with the original implementation.
+
+Usage:
+    compare_filter.py [-n <n>] [-q <n>] [-s <seed>]
+    compare_filter.py -h | --help
+
+Options:
+    -n <n>, --keys=<n>       Number of keys [default: 2000].
+    -q <n>, --queries=<n>    Number of queries per combination of
+                             rules [default: 10].
+    -s <seed>, --seed=<seed>  Random seed [default: 1].
+    -h, --help               Show this message and exit.
+
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import random
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import docopt
+from workflow import Workflow3, MATCH_ALL
+from workflow.search import KeyIndex
+
+# Characters keys and queries are made of
+KEY_CHARS = 'abcdexyzABCDEX  ._-/19éüßÆøŁ'
+QUERY_CHARS = 'abcdexyzABé ü.1'
+
+
+def make_key(rnd):
+    """Return a random search key."""
+    return ''.join([rnd.choice(KEY_CHARS)
+                    for _ in range(rnd.randint(0, 30))])
+
+
+def make_query(rnd):
+    """Return a random query of one or more words."""
+    while True:
+        words = [''.join([rnd.choice(QUERY_CHARS)
+                          for _ in range(rnd.randint(1, 5))])
+                 for _ in range(rnd.randint(1, 3))]
+        query = ' '.join(words)
+        if query.strip():
+            return query
+
+
+def main():
+    """Run comparison."""
+    args = docopt.docopt(__doc__)
+    n = int(args['--keys'])
+    queries = int(args['--queries'])
+    rnd = random.Random(int(args['--seed']))
+
+    wf = Workflow3()
+    keys = [make_key(rnd) for _ in range(n)]
+    items = [(k, i) for i, k in enumerate(keys)]
+    index = KeyIndex(keys)
+    trigram_index = KeyIndex(keys).build(trigrams=True)
+
+    runs = mismatches = 0
+    start = time()
+    for match_on in range(1, MATCH_ALL + 1):
+        for _ in range(queries):
+            query = make_query(rnd)
+            opts = dict(
+                match_on=match_on,
+                fold_diacritics=rnd.choice([True, False]),
+                min_score=rnd.choice([0, 0, 30, 80]),
+                max_results=rnd.choice([0, 0, 1, 10]),
+                ascending=rnd.choice([True, False]),
+                include_score=True,
+            )
+            expected = wf.filter(query, items, lambda x: x[0], **opts)
+            variants = (
+                ('index', dict(index=index)),
+                ('trigrams', dict(index=trigram_index)),
+                ('index+deadline', dict(index=index,
+                                        deadline=time() + 3600)),
+                ('trigrams+deadline', dict(index=trigram_index,
+                                           deadline=time() + 3600)),
+            )
+            for name, extra in variants:
+                kwargs = dict(opts, **extra)
+                results = wf.filter(query, items, lambda x: x[0], **kwargs)
+                runs += 1
+                if results != expected:
+                    mismatches += 1
+                    print('MISMATCH ({0}) query={1!r} options={2!r} : {3} '
+                          'results, expected {4}'.format(
+                              name, query, opts, len(results),
+                              len(expected)))
+
+    print('{0} comparisons of {1} keys in {2:0.1f}s, {3} mismatches'.format(
+          runs, n, time() - start, mismatches))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-27
+#
+
+"""concurrent_fetch.py [options]
+
+Time fetching URLs from a local server one at a time with `web.get()`
+and concurrently with `web.get_many()`. The server waits <delay>
+seconds before answering each request, like a slow API would.
+
+Usage:
+    concurrent_fetch.py [-n <n>] [-d <delay>] [-w <n>]
+    concurrent_fetch.py -h | --help
+
+Options:
+    -n <n>, --urls=<n>       Number of URLs to fetch [default: 20].
+    -d <delay>, --delay=<delay>  Seconds server waits before each
+                             response [default: 0.1].
+    -w <n>, --workers=<n>    Comma-separated numbers of threads
+                             [default: 2,4,8].
+    -h, --help               Show this message and exit.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import os
+import sys
+import threading
+from time import sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import docopt
+from workflow import web
+
+
+class SlowServer(ThreadingMixIn, HTTPServer):
+    """Server that answers each request in its own thread."""
+
+    daemon_threads = True
+    delay = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answer every GET with the request path after `server.delay`."""
+
+    def do_GET(self):
+        sleep(self.server.delay)
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    """Run benchmark."""
+    args = docopt.docopt(__doc__)
+    n = int(args['--urls'])
+    workers = [int(s) for s in args['--workers'].split(',')]
+
+    server = SlowServer(('127.0.0.1', 0), Handler)
+    server.delay = float(args['--delay'])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    urls = ['http://127.0.0.1:{0}/{1}'.format(server.server_port, i)
+            for i in range(n)]
+    expected = ['/{0}'.format(i) for i in range(n)]
+
+    start = time()
+    results = [web.get(url).content for url in urls]
+    base = time() - start
+    assert results == expected
+    print('{0:>10}  {1:>8}  {2:>7}'.format('workers', 'seconds', 'speedup'))
+    print('{0:>10}  {1:>8.3f}  {2:>6.2f}x'.format('sequential', base, 1))
+
+    for w in workers:
+        start = time()
+        results = [r.content for r in web.get_many(urls, workers=w)]
+        elapsed = time() - start
+        assert results == expected
+        print('{0:>10}  {1:>8.3f}  {2:>6.2f}x'.format(w, elapsed,
+                                                      base / elapsed))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
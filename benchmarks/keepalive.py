@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-27
+#
+
+"""keepalive.py [options]
+
+Time requests to a local HTTP/1.1 server with `web.get()`, which opens
+a new connection for every request, and with a `web.Session`, which
+re-uses connections.
+
+Usage:
+    keepalive.py [-n <n>] [-s <size>]
+    keepalive.py -h | --help
+
+Options:
+    -n <n>, --requests=<n>   Number of requests [default: 500].
+    -s <size>, --size=<size>  Size of response body in bytes
+                             [default: 1000].
+    -h, --help               Show this message and exit.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import os
+import sys
+import threading
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import docopt
+from workflow import web
+
+
+class KeepAliveServer(ThreadingMixIn, HTTPServer):
+    """Server that answers each connection in its own thread."""
+
+    daemon_threads = True
+    body = b''
+    connections = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answer every GET with `server.body` and keep connection open."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body together, not in separate packets
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = self.server.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(server, func, n):
+    """Return `(ms per request, connections opened)` of `n` calls."""
+    server.connections = 0
+    start = time()
+    for _ in range(n):
+        assert func() == server.body
+    return (time() - start) * 1000 / n, server.connections
+
+
+def main():
+    """Run benchmark."""
+    args = docopt.docopt(__doc__)
+    n = int(args['--requests'])
+
+    server = KeepAliveServer(('127.0.0.1', 0), Handler)
+    server.body = b'x' * int(args['--size'])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{0}/'.format(server.server_port)
+
+    print('{0:>10}  {1:>10}  {2:>11}'.format('', 'ms/request', 'connections'))
+
+    ms, conns = timed(server, lambda: web.get(url).content, n)
+    print('{0:>10}  {1:>10.3f}  {2:>11}'.format('no pool', ms, conns))
+
+    with web.Session() as session:
+        ms, conns = timed(server, lambda: session.get(url).content, n)
+    print('{0:>10}  {1:>10.3f}  {2:>11}'.format('session', ms, conns))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-21
+#
+
+"""parallel_filter.py [options]
+
+Time `Workflow.filter()` with 1 to N worker processes.
+
+Usage:
+    parallel_filter.py [-p <n>] [-s <sizes>] [-q <query>] [-r <n>]
+    parallel_filter.py -h | --help
+
+Options:
+    -p <n>, --processes=<n>  Maximum number of processes [default: 4].
+    -s <sizes>, --sizes=<sizes>  Comma-separated numbers of keys
+                             [default: 100000,500000,1000000].
+    -q <query>, --query=<query>  Query to filter keys with [default: doc].
+    -r <n>, --repeat=<n>     Report fastest of this many runs [default: 3].
+    -h, --help               Show this message and exit.
+
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import random
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import docopt
+from workflow import Workflow3, MATCH_ALL, MATCH_ALLCHARS
+from workflow.search import KeyIndex
+
+WORDS = ['Documents', 'Projects', 'alfred', 'Résumé', 'invoice', 'Photos',
+         'backup', 'dfx', 'notes', '2016', 'src', 'Downloads', 'Library']
+
+
+def make_keys(n):
+    """Return `n` random filenames."""
+    rnd = random.Random(n)
+    return ['{0}-{1}.txt'.format(
+            '_'.join([rnd.choice(WORDS) for _ in range(rnd.randint(1, 4))]), i)
+            for i in range(n)]
+
+
+def timed(func, repeat):
+    """Return fastest time of `repeat` calls to `func`."""
+    best = None
+    for _ in range(repeat):
+        start = time()
+        func()
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    """Run benchmark."""
+    args = docopt.docopt(__doc__)
+    processes = int(args['--processes'])
+    sizes = [int(s) for s in args['--sizes'].split(',')]
+    query = args['--query'].decode('utf-8')
+    repeat = int(args['--repeat'])
+
+    wf = Workflow3()
+    match_on = MATCH_ALL ^ MATCH_ALLCHARS
+
+    print('{0:>9}  {1:>9}  {2:>9}  {3:>7}'.format(
+          'keys', 'processes', 'seconds', 'speedup'))
+    for n in sizes:
+        keys = make_keys(n)
+        index = KeyIndex(keys).build()
+        serial = wf.filter(query, keys, index=index, match_on=match_on,
+                           max_results=50)
+        base = None
+        for p in range(1, processes + 1):
+            def run():
+                results = wf.filter(query, keys, index=index,
+                                    match_on=match_on, max_results=50,
+                                    processes=p)
+                assert results == serial
+
+            elapsed = timed(run, repeat)
+            if base is None:
+                base = elapsed
+            print('{0:>9}  {1:>9}  {2:>9.3f}  {3:>6.2f}x'.format(
+                  n, p, elapsed, base / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,9 @@
 Usage:
     dfx.py [-t <type>...] [<query>]
     dfx.py -u
+    dfx.py -w
+    dfx.py -i
+    dfx.py -o <path>
     dfx.py -h | --help
     dfx.py --version
 
@@ -20,6 +23,10 @@ Options:
     -t <TYPE>, --type=<TYPE>  Show only items of type. May be "fav", "rfile",
                               "rfolder" or "all" [default: all].
     -u, --update              Update cached data.
+    -w, --watch               Update cached data when DFX's data change.
+    -i, --index               Index files in favourite folders.
+    -o <path>, --opened=<path>
+                              Record that <path> was opened.
     -h, --help                Show this message and exit.
     --version                 Show version number and exit.
 
@@ -28,19 +35,92 @@ Options:
 from __future__ import print_function, unicode_literals, absolute_import
 
 from collections import namedtuple
+import heapq
+from itertools import islice
+import math
 import os
 from subprocess import check_output
 import sys
 from time import time
 
+from outputcache import OutputCache
+
+# Options that run something other than the Script Filter
+COMMAND_OPTIONS = ('-u', '--update', '-w', '--watch', '-i', '--index',
+                   '-o', '--opened', '-h', '--help', '--version')
+
+# The Script Filter updates the mtime of this file in the cache
+# directory every time it's run (see `WATCH_IDLE_TIME`)
+LAST_RUN_FILE = 'last-run'
+
+# Set for the re-run that completes a search that ran out of time
+# (see `FILTER_TIME_BUDGET`)
+CONTINUE_VAR = 'dfx_continue'
+
+# Environment variables that change the Script Filter's response, so
+# are part of the output cache's key
+OUTPUT_VARIABLES = (CONTINUE_VAR, 'HOME')
+
+
+def touch(path):
+    """Create file at `path` or update its mtime."""
+    with open(path, 'ab'):
+        os.utime(path, None)
+
+
+# Repeated Script Filter runs with the same arguments are answered from
+# the output cache before the (comparatively slow) imports below
+if __name__ == '__main__':
+    _cache = OutputCache.from_env(OUTPUT_VARIABLES)
+    if (_cache is not None and
+            not [a for a in sys.argv[1:] if a.startswith(COMMAND_OPTIONS)]):
+        # Keep the watcher running
+        try:
+            touch(os.path.join(os.path.dirname(_cache.dirpath),
+                               LAST_RUN_FILE))
+        except (IOError, OSError):  # cache directory doesn't exist yet
+            pass
+        _cache.serve(sys.argv[1:])
+
 import docopt
 from workflow import Workflow3, ICON_WARNING
-from workflow.background import is_running, run_in_background
+from workflow.background import (
+    get_watcher,
+    is_running,
+    lower_priority,
+    run_in_background,
+)
+from workflow.search import KeyIndex
+
+import dfxfiles
+from listing import ListingCache
+from pathcache import PathCache
+from store import EntryStore, FileIndex
+from usage import UsageTable
 
 log = None
 
+# Cache engines. `pickle` caches all entries in one file with
+# `Workflow.cache_data()`, `sqlite` in an `EntryStore` database.
+# `sqlite` only loads and scores the entries whose search keys contain
+# every query word (at most `MAX_STORE_CANDIDATES`), so unlike
+# `pickle`, it doesn't find entries that only match via
+# `MATCH_ALLCHARS`
+ENGINE_PICKLE = 'pickle'
+ENGINE_SQLITE = 'sqlite'
+# Maximum number of entries the `sqlite` engine scores. The ones with
+# the shortest names are scored
+MAX_STORE_CANDIDATES = 500
+
+# Files and folders the indexer skips (glob patterns)
+INDEX_IGNORE = ['.*', '*.pyc', '__pycache__', 'node_modules']
+
 # Initial values for `settings.json`
-DEFAULT_SETTINGS = {}
+DEFAULT_SETTINGS = {
+    'cache_engine': ENGINE_PICKLE,
+    'index_favorites': False,
+    'index_ignore': INDEX_IGNORE,
+}
 
 # Auto-update from GitHub releases
 UPDATE_SETTINGS = {
@@ -49,12 +129,86 @@ UPDATE_SETTINGS = {
 
 HELP_URL = 'https://github.com/deanishe/alfred-default-folder-x/issues'
 
-# Where data will be cached by `update.py`
+# Where data will be cached by `update.py`. Entries are partitioned
+# by type: the partition of entries whose type is `mask` is cached
+# under `<DFX_CACHE_KEY>-<mask>` and the list of masks under
+# `DFX_CACHE_KEY`
 DFX_CACHE_KEY = 'dfx-entries'
+STORE_FILENAME = 'dfx.sqlite'
+# Where paths read from DFX's plist files are cached
+PLIST_CACHE_KEY = 'dfx-plists'
+# Where the types of the lists that had to be fetched via AppleScript
+# (because they aren't in DFX's files) are cached
+SCRIPTED_CACHE_KEY = 'dfx-scripted'
+# Where `PathCache` data are cached
+PATH_CACHE_KEY = 'dfx-paths'
 MAX_CACHE_AGE = 10  # seconds
 
-# Data model. `type` is one of 'fav', 'rfolder' or 'rfile'
-# ("favorite", "recent folder" and "recent file" respectively)
+# The watcher (`dfx.py --watch`) updates the cache when DFX's files
+# change. Lists that had to be fetched via AppleScript can't be
+# watched, so the Script Filter updates them on demand when they're
+# older than `MAX_CACHE_AGE`. The watcher exits when the Script Filter
+# hasn't been run for `WATCH_IDLE_TIME` (see `LAST_RUN_FILE`)
+WATCH_IDLE_TIME = 600  # seconds
+# Watch at most this many favourite folders
+MAX_WATCHED_FOLDERS = 100
+
+# Queries that start with one of these are paths of folders to browse.
+# Folder entries autocomplete to their path
+BROWSE_PREFIXES = ('/', '~/')
+# Maximum number of folder contents to show
+MAX_BROWSE_RESULTS = 200
+
+# If the `index_favorites` setting is on, the indexer (`dfx.py --index`)
+# saves the files under favourite folders in a `FileIndex` in the cache
+# directory. The Script Filter searches the index and starts the
+# indexer if the index is older than `INDEX_MAX_AGE`. The watcher also
+# starts it when a favourite folder changes
+INDEX_FILENAME = 'files.sqlite'
+INDEX_MAX_AGE = 3600  # seconds
+# Maximum number of indexed files to show
+MAX_INDEX_RESULTS = 50
+
+# How often each path is opened is saved in a `UsageTable` in the data
+# directory. When searching, `USAGE_BOOST` is added to a result's score
+# for every doubling of its (decayed) usage count
+USAGE_FILENAME = 'usage.dat'
+USAGE_BOOST = 5.0
+
+# Maximum number of search results to show
+MAX_RESULTS = 50
+
+# Build trigram index for this many entries or more. `MATCH_ALLCHARS`
+# can't use it, so it's still applied to every entry (within
+# `FILTER_TIME_BUDGET`)
+TRIGRAM_MIN_ENTRIES = 2000
+
+# Time allowed for filtering partitions. If the slower rules haven't
+# been applied to every entry by then, the results so far are shown and
+# the Script Filter is re-run without a time limit. `CONTINUE_VAR` is
+# set to `continue_token()` for the re-run.
+FILTER_TIME_BUDGET = 0.25  # seconds
+
+# Types of entry ("favorite", "recent folder" and "recent file")
+TYPE_FAV = 1
+TYPE_RFOLDER = 2
+TYPE_RFILE = 4
+TYPE_ALL = TYPE_FAV | TYPE_RFOLDER | TYPE_RFILE
+# Files found under favourite folders by the indexer. `TYPE_FOLDER`
+# is also set on indexed folders
+TYPE_INDEXED = 8
+TYPE_FOLDER = 16
+
+# Type names used by DFX and the `--type` option
+TYPE_BITS = {
+    'fav': TYPE_FAV,
+    'rfolder': TYPE_RFOLDER,
+    'rfile': TYPE_RFILE,
+}
+
+# Data model. `type` is a bitmask of `TYPE_*` constants. A path
+# that is, e.g., both a favourite and a recent folder is one entry
+# with type `TYPE_FAV | TYPE_RFOLDER`.
 # `name` is the basename of `path` and `pretty_path` is `path` with
 # $HOME replaced with ~
 DfxEntry = namedtuple('DfxEntry', ['type', 'path', 'name', 'pretty_path'])
@@ -63,27 +217,41 @@ DfxEntry = namedtuple('DfxEntry', ['type', 'path', 'name', 'pretty_path'])
 def get_dfx_data():
     """Return DFX favourites and recent items.
 
+    The lists are read from DFX's files if possible. Lists that aren't
+    in the files (or contain no paths that can be read) are fetched
+    from DFX via AppleScript.
+
     Returns:
-        list: Sequence of `DfxEntry` objects.
+        tuple: `(entries, scripted)`. `entries` is a list of `DfxEntry`
+            objects in DFX order. Each entry has a single type bit set.
+            Paths may appear more than once. `scripted` is a list of
+            the types (e.g. `rfile`) that were fetched via AppleScript.
     """
     st = time()
-    script = wf.workflowfile('DFX Files.scpt')
-    output = wf.decode(check_output(['/usr/bin/osascript', script]))
+    rows = read_dfx_files()
+    found = set([typ for typ, _ in rows])
+    missing = [typ for typ in sorted(TYPE_BITS, key=TYPE_BITS.get)
+               if typ not in found]
+    if missing:
+        log.warning('No %s paths in DFX files. Asking DFX...',
+                    '/'.join(missing))
+        # The script returns all lists, so keep only the missing ones
+        rows += [row for row in run_dfx_script() if row[0] in missing]
+        # Restore DFX order: favourites, recent folders, recent files
+        rows.sort(key=lambda row: TYPE_BITS.get(row[0], 0))
     log.debug('DFX files updated in %0.3fs', time() - st)
 
     entries = []
 
     home = os.getenv('HOME')
-    for line in [s.strip() for s in output.split('\n') if s.strip()]:
-        row = line.split('\t')
-        if len(row) != 2:
-            log.warning('Invalid output from DFX : %r', line)
+    for typ, path in rows:
+        if typ not in TYPE_BITS:
+            log.warning('Unknown type : %r', typ)
             continue
-        typ, path = row
         # Remove trailing slash from path or things go wrong...
-        path = path.rstrip('/')
+        path = wf.decode(path).rstrip('/')
         e = DfxEntry(
-            typ,
+            TYPE_BITS[typ],
             path,
             os.path.basename(path),
             path.replace(home, '~'),
@@ -91,14 +259,683 @@ def get_dfx_data():
         log.debug('entry=%r', e)
         entries.append(e)
 
-    return entries
+    wf.metrics.count('entries', len(entries))
+    return entries, missing
+
+
+def read_dfx_files():
+    """Read DFX favourites and recent items from DFX's plist files.
+
+    The files and keys the lists are read from can be changed with
+    the `dfx_sources` setting (see `dfxfiles.SOURCES`).
+
+    Returns:
+        list: `(type, path)` tuples in DFX order. Empty if the files
+            couldn't be read or contain no paths.
+    """
+    sources = wf.settings.get('dfx_sources') or dfxfiles.SOURCES
+    # Paths found in each file, so unchanged files aren't parsed again
+    cache = wf.cached_data(PLIST_CACHE_KEY, max_age=0) or {}
+    try:
+        with wf.metrics.span('plists'):
+            rows = dfxfiles.read_sources(sources, cache)
+    except (dfxfiles.PlistError, IOError, OSError) as err:
+        log.warning("Couldn't read DFX files : %s", err)
+        return []
+
+    if rows is None:
+        log.debug('No DFX files')
+        return []
+
+    wf.cache_data(PLIST_CACHE_KEY, cache)
+    return rows
+
+
+def run_dfx_script():
+    """Get DFX favourites and recent items via AppleScript.
+
+    Returns:
+        list: `(type, path)` tuples in DFX order.
+    """
+    script = wf.workflowfile('DFX Files.scpt')
+    with wf.metrics.span('osascript'):
+        output = wf.decode(check_output(['/usr/bin/osascript', script]))
+
+    rows = []
+    for line in [s.strip() for s in output.split('\n') if s.strip()]:
+        row = line.split('\t')
+        if len(row) != 2:
+            log.warning('Invalid output from DFX : %r', line)
+            continue
+        rows.append(tuple(row))
+
+    return rows
+
+
+def merge_entries(entries):
+    """Merge entries with the same path.
+
+    Args:
+        entries (list): `DfxEntry` objects.
+
+    Returns:
+        list: One `DfxEntry` per path, in order of first appearance,
+            with the types of all entries for the path.
+    """
+    merged = []
+    rows = {}
+    for e in entries:
+        i = rows.get(e.path)
+        if i is None:
+            rows[e.path] = len(merged)
+            merged.append(e)
+        else:
+            merged[i] = merged[i]._replace(type=merged[i].type | e.type)
+
+    return merged
+
+
+def build_index(entries):
+    """Return search index of `entries`' names.
+
+    Args:
+        entries (list): `DfxEntry` objects.
+
+    Returns:
+        KeyIndex: Search keys with columns (incl. character
+            signatures) already built. Trigram posting lists are
+            built, too, if there are `TRIGRAM_MIN_ENTRIES` or more.
+    """
+    trigrams = len(entries) >= TRIGRAM_MIN_ENTRIES
+    return KeyIndex([e.name for e in entries]).build(trigrams=trigrams)
+
+
+def get_output_cache():
+    """Return cache of Script Filter responses.
+
+    Returns:
+        OutputCache: Cache in workflow's cache directory.
+    """
+    return OutputCache(wf.cachefile('output'), max_age=MAX_CACHE_AGE,
+                       variables=OUTPUT_VARIABLES)
+
+
+def get_store():
+    """Return `EntryStore` if it's the selected cache engine.
+
+    Returns:
+        EntryStore: Store in cache directory or `None` if entries
+            are cached with `Workflow.cache_data()`.
+    """
+    if wf.settings.get('cache_engine', ENGINE_PICKLE) != ENGINE_SQLITE:
+        return None
+    return EntryStore(wf.cachefile(STORE_FILENAME))
+
+
+def index_enabled():
+    """Return `True` if files under favourite folders are indexed."""
+    return bool(wf.settings.get('index_favorites', False))
+
+
+def get_index(create=False):
+    """Return index of files under favourite folders.
+
+    Args:
+        create (bool, optional): Create the index if it doesn't exist.
+
+    Returns:
+        FileIndex: Index in cache directory or `None` if indexing is
+            turned off or (unless `create` is `True`) the index
+            doesn't exist yet.
+    """
+    if not index_enabled():
+        return None
+    filepath = wf.cachefile(INDEX_FILENAME)
+    if not create and not os.path.exists(filepath):
+        return None
+    return FileIndex(filepath)
+
+
+def start_indexer():
+    """Index files under favourite folders in the background."""
+    run_in_background(
+        'index',
+        ['/usr/bin/python', wf.workflowfile('dfx.py'), '--index']
+    )
+
+
+def get_usage():
+    """Return usage counts of paths.
+
+    Returns:
+        UsageTable: Table in data directory.
+    """
+    return UsageTable(wf.datafile(USAGE_FILENAME))
+
+
+def usage_boost(usage):
+    """Return function that boosts entries' scores by usage.
+
+    Args:
+        usage (UsageTable): Usage counts of paths.
+
+    Returns:
+        callable: Function that returns the amount to add to an
+            entry's score, or `None` if no paths have been used.
+    """
+    if not usage.records:
+        return None
+
+    now = time()
+
+    def boost(entry):
+        count = usage.count(entry.path, now)
+        if not count:
+            return 0
+        return USAGE_BOOST * math.log(1 + count, 2)
+
+    return boost
+
+
+def partition_key(mask):
+    """Return cache key for entries whose type is `mask`."""
+    return '{0}-{1}'.format(DFX_CACHE_KEY, mask)
+
+
+def type_mask(types):
+    """Return bitmask of types of entries to show.
+
+    Args:
+        types (list): Types passed with `-t`.
+
+    Returns:
+        int: Bitmask of `TYPE_*` constants.
+    """
+    if types == ['all']:
+        return TYPE_ALL
+
+    mask = 0
+    for typ in types:
+        mask |= TYPE_BITS.get(typ, 0)
+    return mask
 
 
 def do_update():
-    """Update cached DFX files and folders."""
+    """Update cached DFX files and folders.
+
+    Entries are merged, so each path appears only once, and cached in
+    partitions by type, so the Script Filter only has to load the types
+    it shows. The search index for each partition is built here, too,
+    so the Script Filter doesn't have to.
+
+    The types of the lists that had to be fetched via AppleScript are
+    cached, too, so the Script Filter knows which lists the watcher
+    can't keep up to date.
+
+    Returns:
+        tuple: `(entries, scripted)`. `entries` is a list of merged
+            `DfxEntry` objects, `scripted` the types fetched via
+            AppleScript.
+    """
     log.info('Updating DFX data...')
-    data = get_dfx_data()
-    wf.cache_data(DFX_CACHE_KEY, data)
+    entries, scripted = get_dfx_data()
+    entries = merge_entries(entries)
+    store = get_store()
+    if store is not None:
+        added, removed = store.update(entries)
+        log.debug('%d entries added to store, %d removed', added, removed)
+    else:
+        cache_partitions(entries)
+
+    refresh_paths(entries)
+
+    wf.cache_data(SCRIPTED_CACHE_KEY, scripted)
+
+    # Cached responses are out of date
+    get_output_cache().bump()
+
+    return entries, scripted
+
+
+def get_path_cache():
+    """Return cache of which paths exist.
+
+    Returns:
+        PathCache: Cache loaded from `PATH_CACHE_KEY`.
+    """
+    return PathCache(wf.cached_data(PATH_CACHE_KEY, max_age=0))
+
+
+def save_path_cache(paths):
+    """Save `PathCache` if it has changed.
+
+    Args:
+        paths (PathCache): Cache returned by `get_path_cache()`.
+    """
+    if paths.changed:
+        wf.cache_data(PATH_CACHE_KEY, paths.data)
+
+
+def refresh_paths(entries, margin=0):
+    """Check the paths of `entries` whose cached results have expired.
+
+    Args:
+        entries (list): Current `DfxEntry` objects.
+        margin (int, optional): Also check paths whose cached results
+            expire within this many seconds.
+    """
+    paths = get_path_cache()
+    with wf.metrics.span('refresh_paths'):
+        n = paths.refresh([e.path for e in entries], margin=margin)
+    log.debug('%d/%d paths checked', n, len(entries))
+    save_path_cache(paths)
+
+
+def touch_last_run():
+    """Record that the Script Filter is being run."""
+    touch(wf.cachefile(LAST_RUN_FILE))
+
+
+def last_run():
+    """Return time the Script Filter was last run.
+
+    Returns:
+        float: UNIX timestamp. 0 if it hasn't been run.
+    """
+    try:
+        return os.path.getmtime(wf.cachefile(LAST_RUN_FILE))
+    except OSError:
+        return 0
+
+
+def watched_paths(entries):
+    """Return the paths the watcher should watch.
+
+    Args:
+        entries (list): Current `DfxEntry` objects.
+
+    Returns:
+        tuple: `(files, folders)`. `files` are DFX's files (which may
+            not exist), `folders` are favourite folders. `folders` is
+            empty if indexing is turned off.
+    """
+    files = []
+    for _, filepath, _ in wf.settings.get('dfx_sources') or dfxfiles.SOURCES:
+        filepath = os.path.expanduser(filepath)
+        if filepath not in files:
+            files.append(filepath)
+
+    folders = []
+    if index_enabled():
+        folders = [e.path for e in entries
+                   if e.type & TYPE_FAV and os.path.isdir(e.path)]
+
+    return files, folders[:MAX_WATCHED_FOLDERS]
+
+
+def do_watch():
+    """Update cached data whenever DFX's files change.
+
+    Watches DFX's files and only updates the cache if one of them
+    changes. Lists that aren't in the files and had to be fetched via
+    AppleScript can't be watched. The Script Filter updates them on
+    demand instead (see `main()`). If none of DFX's files exist, they
+    are watched all the same, so the watcher notices when DFX creates
+    them.
+
+    If indexing is turned on, favourite folders are watched, too, and
+    the indexer is started when one changes. That doesn't change DFX's
+    lists, so the cache isn't updated. (Browsed folders needn't be
+    refreshed: `ListingCache` notices that their mtime has changed.)
+
+    Runs until the Script Filter hasn't been used for `WATCH_IDLE_TIME`.
+    """
+    entries, scripted = do_update()
+    while True:
+        files, folders = watched_paths(entries)
+        with get_watcher(files + folders) as watcher:
+            log.info('Watching %d files and %d folders with %s ...',
+                     len(files), len(folders), watcher.backend)
+            if scripted:
+                log.info('Not watching %s lists (fetched via AppleScript)',
+                         '/'.join(scripted))
+            while True:
+                if time() - last_run() > WATCH_IDLE_TIME:
+                    log.info('Script Filter not used for %ds. Exiting.',
+                             WATCH_IDLE_TIME)
+                    return
+
+                changed = watcher.wait(MAX_CACHE_AGE)
+                if changed:
+                    log.info('Changed : %s', ', '.join(changed))
+                    if set(changed) & set(folders):
+                        start_indexer()
+                    if set(changed) & set(files):
+                        break
+
+                # Re-check paths whose cached results expire before
+                # the next refresh, so the Script Filter doesn't have to
+                refresh_paths(entries, margin=MAX_CACHE_AGE)
+
+        entries, scripted = do_update()
+
+
+def favourite_folders():
+    """Return paths of cached favourite folders.
+
+    Returns:
+        list: Paths in DFX order.
+    """
+    store = get_store()
+    if store is not None:
+        entries = [DfxEntry._make(row) for row in store.all(TYPE_FAV)]
+    else:
+        entries = merge_partitions(load_data(TYPE_FAV) or [])
+
+    return [e.path for e in entries
+            if e.type & TYPE_FAV and os.path.isdir(e.path)]
+
+
+def do_index():
+    """Index files under favourite folders.
+
+    Runs with lowered CPU and I/O priority. Only folders that have
+    changed since the last run are listed.
+
+    Returns:
+        dict: Statistics returned by `FileIndex.scan()`.
+    """
+    index = get_index(create=True)
+    if index is None:
+        log.info('Indexing is turned off')
+        return None
+
+    lower_priority()
+    roots = favourite_folders()
+    ignore = wf.settings.get('index_ignore', INDEX_IGNORE)
+    log.info('Indexing %d favourite folders...', len(roots))
+
+    def progress(stats):
+        log.debug('%d folders listed, %d unchanged, %d files read '
+                  '(%0.0f files/s)', stats['listed'], stats['skipped'],
+                  stats['files'], stats['files'] / (stats['duration'] or 1))
+
+    with wf.metrics.span('index'):
+        stats = index.scan(roots, ignore, progress)
+
+    folders = stats['listed'] + stats['skipped']
+    log.info('%d folders (%d listed) and %d files indexed in %0.2fs '
+             '(%0.0f files/s)', folders, stats['listed'], stats['total'],
+             stats['duration'], stats['files'] / (stats['duration'] or 1))
+    wf.metrics.count('index_folders', folders)
+    wf.metrics.count('index_listed', stats['listed'])
+    wf.metrics.count('index_files', stats['total'])
+
+    # Cached responses don't contain the new files
+    get_output_cache().bump()
+
+    return stats
+
+
+def search_index(index, query, exclude, boost=None):
+    """Return indexed files and folders that match `query`.
+
+    Only the index is searched. The files aren't checked.
+
+    Args:
+        index (FileIndex): Index to search.
+        query (unicode): Search query.
+        exclude (list): Paths not to return, e.g. of DFX entries
+            that are already shown.
+        boost (callable, optional): Passed to `Workflow.filter()`.
+
+    Returns:
+        list: `DfxEntry` objects of type `TYPE_INDEXED`.
+    """
+    exclude = set(exclude)
+    home = os.getenv('HOME')
+    entries = []
+    for path, name, is_dir in index.search(query):
+        if path in exclude:
+            continue
+        typ = TYPE_INDEXED | TYPE_FOLDER if is_dir else TYPE_INDEXED
+        entries.append(DfxEntry(typ, path, name, path.replace(home, '~')))
+
+    total = len(entries)
+    entries = wf.filter(query, entries, lambda e: e.name, min_score=30,
+                        max_results=MAX_INDEX_RESULTS, boost=boost)
+    log.info('%d/%d indexed files match `%s`', len(entries), total, query)
+    return entries
+
+
+def cache_partitions(entries):
+    """Cache `entries` partitioned by type, with a search index each.
+
+    Args:
+        entries (list): Merged `DfxEntry` objects.
+    """
+    partitions = {}
+    for rank, e in enumerate(entries):
+        data = partitions.setdefault(e.type, {'entries': [], 'ranks': []})
+        data['entries'].append(e)
+        data['ranks'].append(rank)
+
+    for mask, data in partitions.items():
+        data['index'] = build_index(data['entries'])
+        wf.cache_data(partition_key(mask), data)
+
+    # Save list of partitions last, so the Script Filter doesn't try
+    # to load partitions that haven't been saved yet
+    wf.cache_data(DFX_CACHE_KEY, sorted(partitions))
+
+
+def load_data(mask):
+    """Load cached entries whose type matches `mask`.
+
+    Args:
+        mask (int): Bitmask of types to load.
+
+    Returns:
+        list: One `{'entries': [...], 'ranks': [...], 'index': KeyIndex}`
+            dict per partition or `None` if the cache is empty. `ranks`
+            are the entries' positions in the DFX list.
+    """
+    masks = wf.cached_data(DFX_CACHE_KEY, max_age=0)
+    # No data or cache from before entries were partitioned
+    if not isinstance(masks, list):
+        return None
+
+    partitions = []
+    for m in masks:
+        if not m & mask:
+            continue
+        data = wf.cached_data(partition_key(m), max_age=0)
+        if data is None:
+            return None
+        partitions.append(data)
+
+    return partitions
+
+
+def search_partitions(query, partitions, deadline=None, boost=None,
+                      valid=None):
+    """Filter each partition with its index and merge the results.
+
+    Each partition's results are sorted by (boosted) score and name,
+    like `Workflow.filter()` sorts them, so merging them gives the
+    same order as filtering all entries at once. At most `MAX_RESULTS`
+    entries are returned.
+
+    Args:
+        query (unicode): Search query.
+        partitions (list): Partitions returned by `load_data()`.
+        deadline (float, optional): Passed to `Workflow.filter()`.
+        boost (callable, optional): Passed to `Workflow.filter()`.
+        valid (callable, optional): Passed to `Workflow.filter()`.
+
+    Returns:
+        tuple: `(entries, complete)`. `entries` is a list of `DfxEntry`
+            objects that match `query`. `complete` is `False` if
+            `deadline` passed before all entries were checked.
+    """
+    results = []
+    complete = True
+    for data in partitions:
+        matches = wf.filter(query, data['entries'], lambda e: e.name,
+                            min_score=30, max_results=MAX_RESULTS,
+                            index=data['index'],
+                            include_score=True, deadline=deadline,
+                            boost=boost, valid=valid)
+        complete = complete and wf.filter_complete
+        results.append([((100.0 / t[1], t[0].name.strip().lower(), t[1]),
+                         t) for t in matches])
+
+    merged = islice(heapq.merge(*results), MAX_RESULTS)
+    return [r[1][0] for r in merged], complete
+
+
+def continue_token(query, mask):
+    """Return value of `CONTINUE_VAR` for an incomplete search.
+
+    Args:
+        query (unicode): Search query.
+        mask (int): Bitmask of types searched.
+
+    Returns:
+        unicode: Token identifying the search.
+    """
+    return '{0}:{1}'.format(mask, query)
+
+
+def merge_partitions(partitions):
+    """Generate entries of all partitions in DFX order.
+
+    Args:
+        partitions (list): Partitions returned by `load_data()`.
+
+    Yields:
+        DfxEntry: Entries ordered by rank.
+    """
+    ranked = [zip(data['ranks'], data['entries']) for data in partitions]
+    for _, e in heapq.merge(*ranked):
+        yield e
+
+
+def search_store(store, query, mask, boost=None, valid=None):
+    """Search entries in `store` for `query`.
+
+    Only the entries whose search keys contain every word of `query`
+    are loaded (at most `MAX_STORE_CANDIDATES`) and scored. Entries
+    that only match via `MATCH_ALLCHARS` aren't found.
+
+    Args:
+        store (EntryStore): Store to load entries from.
+        query (unicode): Search query.
+        mask (int): Bitmask of types to load.
+        boost (callable, optional): Passed to `Workflow.filter()`.
+        valid (callable, optional): Passed to `Workflow.filter()`.
+
+    Returns:
+        list: `DfxEntry` objects that match `query`.
+    """
+    candidates = [DfxEntry._make(row) for row
+                  in store.search(query, mask, MAX_STORE_CANDIDATES)]
+    entries, _ = search_partitions(
+        query, [{'entries': candidates, 'index': None}], boost=boost,
+        valid=valid)
+    log.info('%d/%d candidates match `%s`', len(entries), len(candidates),
+             query)
+    return entries
+
+
+def record_use(path):
+    """Increment usage count of `path`.
+
+    Args:
+        path (unicode): Path that was opened.
+    """
+    count = get_usage().add(path)
+    log.debug('usage of %r : %0.2f', path, count)
+    # Cached responses are ranked by the old counts
+    get_output_cache().bump()
+
+
+def filter_entries(entries, paths):
+    """Remove entries whose files don't exist.
+
+    Args:
+        entries (iterable): `DfxEntry` objects.
+        paths (PathCache): Cache of which paths exist.
+
+    Returns:
+        list: `DfxEntry` objects in the same order.
+    """
+    return [e for e in entries if paths.exists(e.path)]
+
+
+def browse(query):
+    """Show contents of the folder `query` is in.
+
+    The last component of `query` is used to filter the folder's
+    contents, e.g. `~/Documents/inv` shows the contents of `~/Documents`
+    that match `inv`. Hidden files are only shown if the last component
+    starts with a dot.
+
+    Args:
+        query (unicode): Path starting with one of `BROWSE_PREFIXES`.
+    """
+    parent, partial = query.rsplit('/', 1)
+    parent += '/'
+    dirpath = os.path.expanduser(parent)
+    listings = ListingCache(wf.cachefile('listings'))
+
+    try:
+        entries = listings.listing(dirpath)
+        if not partial.startswith('.'):
+            entries = (e for e in entries if not e.name.startswith('.'))
+
+        if partial:
+            entries = wf.filter(partial, entries,
+                                lambda e: wf.decode(e.name),
+                                min_score=30, max_results=MAX_BROWSE_RESULTS)
+        else:
+            entries = heapq.nsmallest(MAX_BROWSE_RESULTS, entries,
+                                      key=lambda e: e.name.lower())
+    except OSError as err:
+        log.warning("Couldn't list %r : %s", dirpath, err)
+        wf.add_item("Can't open folder",
+                    err.strerror or unicode(err),
+                    icon=ICON_WARNING)
+        wf.send_feedback()
+        return
+
+    if not entries:
+        wf.add_item('Nothing found',
+                    'Try a different query?',
+                    icon=ICON_WARNING)
+
+    home = os.getenv('HOME')
+    for e in entries:
+        name = wf.decode(e.name)
+        path = wf.decode(e.path)
+        autocomplete = None
+        if e.is_dir:
+            autocomplete = parent + name + '/'
+
+        wf.add_item(
+            name,
+            path.replace(home, '~'),
+            arg=path,
+            uid=path,
+            autocomplete=autocomplete,
+            copytext=path,
+            largetext=path,
+            type='file',
+            valid=True,
+            icon=path,
+            icontype='fileicon')
+
+    wf.send_feedback()
 
 
 def prefix_name(entry):
@@ -111,8 +948,10 @@ def prefix_name(entry):
     Returns:
         unicode: `entry.name` with Unicode icon prefix.
     """
-    if entry.type == 'fav':
+    if entry.type & TYPE_FAV:
         prefix = '\U00002764'  # HEAVY BLACK HEART
+    elif entry.type & TYPE_INDEXED:
+        prefix = '\U0001F4C2'  # OPEN FILE FOLDER
     else:
         prefix = '\U0001F55E'  # CLOCK FACE THREE-THIRTY
 
@@ -127,53 +966,141 @@ def main(wf):
     query = args.get('<query>') or b''
     query = wf.decode(query).strip()
     types = args.get('--type')
+    mask = type_mask(types)
     log.debug('args=%r', args)
 
     # -----------------------------------------------------------------
     # Update cached DFX data
 
     if args.get('--update'):
-        return do_update()
+        do_update()
+        return
+
+    if args.get('--watch'):
+        return do_watch()
+
+    if args.get('--index'):
+        do_index()
+        return
+
+    if args.get('--opened'):
+        record_use(wf.decode(args['--opened']))
+        return
 
     # -----------------------------------------------------------------
     # Script Filter
 
+    if query.startswith(BROWSE_PREFIXES):
+        return browse(query)
+
+    # Search without a time limit if this is a re-run to complete
+    # a search that ran out of time
+    token = continue_token(query, mask)
+    deadline = time() + FILTER_TIME_BUDGET
+    if wf.decode(os.getenv(CONTINUE_VAR, b'')) == token:
+        log.debug('completing search for `%s`', query)
+        deadline = None
+
+    # Key for caching the response. Calculated before loading the
+    # data, so the response isn't cached under a newer generation.
+    output_cache = get_output_cache()
+    output_key = output_cache.key(sys.argv[1:])
+
     # Load cached entries first and start update if they've
     # expired (or don't exist)
-    entries = wf.cached_data(DFX_CACHE_KEY, max_age=0)
-    if not entries or not wf.cached_data_fresh(DFX_CACHE_KEY, MAX_CACHE_AGE):
-        if not is_running('update'):
-            run_in_background(
-                'update',
-                ['/usr/bin/python', wf.workflowfile('dfx.py'), '--update']
-            )
-
-    # Tell Alfred to re-run the Script Filter if cache is being updated
-    if is_running('update'):
+    store = get_store()
+    if store is not None:
+        updated = store.updated
+        loaded = updated is not None
+        fresh = loaded and time() - updated < MAX_CACHE_AGE
+    else:
+        partitions = load_data(mask)
+        loaded = partitions is not None
+        fresh = loaded and wf.cached_data_fresh(DFX_CACHE_KEY, MAX_CACHE_AGE)
+
+    # The watcher keeps the cache up to date, unless some lists had
+    # to be fetched via AppleScript. It exits when the Script Filter
+    # hasn't been run for a while, so tell it the Script Filter is
+    # in use.
+    touch_last_run()
+    watching = is_running('watch')
+    if watching and wf.cached_data(SCRIPTED_CACHE_KEY, max_age=0) == []:
+        fresh = loaded
+
+    if not watching:
+        run_in_background(
+            'watch',
+            ['/usr/bin/python', wf.workflowfile('dfx.py'), '--watch']
+        )
+    elif not fresh and not is_running('update'):
+        run_in_background(
+            'update',
+            ['/usr/bin/python', wf.workflowfile('dfx.py'), '--update']
+        )
+
+    # Show the updated data when the cache has been updated
+    if not fresh:
         wf.rerun = 1
 
+    # Keep the index of files under favourite folders up to date
+    index = None
+    if mask & TYPE_FAV and index_enabled():
+        index = get_index()
+        updated = index.updated if index is not None else None
+        if updated is None or time() - updated > INDEX_MAX_AGE:
+            start_indexer()
+
     # No data in cache yet. Show warning and exit.
-    if entries is None:
+    if not loaded:
         wf.add_item('Waiting for Default Folder X data…',
                     'Please try again in a second or two',
                     icon=ICON_WARNING)
         wf.send_feedback()
         return
 
-    # Filter entries
     if types != ['all']:
         log.debug('Filtering for types : %r', types)
-        entries = [e for e in entries if e.type in types]
 
-    # Remove duplicates and non-existent files
-    entries = [e for e in set(entries) if os.path.exists(e.path)]
+    # Filter data against query if there is one. Non-existent files
+    # are removed while the best matches are selected, so the whole
+    # (cached) search index can be used and only the best matching
+    # files have to be checked.
+    # Rank often-used paths higher
+    boost = usage_boost(get_usage()) if query else None
+    paths = get_path_cache()
+
+    def exists(entry):
+        return paths.exists(entry.path)
 
-    # Filter data against query if there is one
-    if query:
-        total = len(entries)
-        entries = wf.filter(query, entries, lambda e: e.name, min_score=30)
+    complete = True
+    if not query:
+        if store is not None:
+            entries = [DfxEntry._make(row) for row in store.all(mask)]
+        else:
+            entries = merge_partitions(partitions)
+        entries = filter_entries(entries, paths)
+    elif store is not None:
+        entries = search_store(store, query, mask, boost, exists)
+    else:
+        total = sum([len(data['entries']) for data in partitions])
+        entries, complete = search_partitions(query, partitions, deadline,
+                                              boost, exists)
         log.info('%d/%d entries match `%s`', len(entries), total, query)
 
+    save_path_cache(paths)
+
+    # Show results so far and finish the search on a re-run
+    if not complete:
+        log.info('search for `%s` ran out of time', query)
+        wf.rerun = 0.1
+        wf.setvar(CONTINUE_VAR, token)
+
+    # Files under favourite folders. They come from the index, so
+    # there's no need to check them
+    if query and index is not None:
+        entries += search_index(index, query, [e.path for e in entries],
+                                boost)
+
     # Prepare Alfred results
     if not entries:
         wf.add_item(
@@ -188,11 +1115,17 @@ def main(wf):
         else:
             title = e.name
 
+        # Folders can be browsed (DFX favourites are folders)
+        autocomplete = None
+        if e.type & (TYPE_FAV | TYPE_RFOLDER | TYPE_FOLDER):
+            autocomplete = e.pretty_path + '/'
+
         wf.add_item(
             title,
             e.pretty_path,
             arg=e.path,
             uid=e.path,
+            autocomplete=autocomplete,
             copytext=e.path,
             largetext=e.path,
             type='file',
@@ -200,7 +1133,13 @@ def main(wf):
             icon=e.path,
             icontype='fileicon')
 
-    wf.send_feedback()
+    # Responses that tell Alfred to re-run the Script Filter (for
+    # updated data or the rest of the results) mustn't be served from
+    # the cache, or the re-run would get the same response
+    output = wf.send_feedback()
+    if not wf.rerun:
+        output_cache.put(output_key, output)
+    log.debug('output cache : %r', output_cache.stats)
 
     return 0
 
@@ -0,0 +1,311 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-22
+#
+
+"""Read Default Folder X's favourites and recent items from its files.
+
+Asking DFX for its lists via AppleScript means starting `osascript`
+and sending DFX three Apple Events. This module reads the same lists
+from the property list files DFX saves them in instead.
+
+`SOURCES` says where each list is: the type name (as used by
+`dfx.py`), the plist file and the key the list is stored under.
+Paths are found in the list's strings (POSIX paths or `file://`
+URLs) and in `path`/`url` keys of dictionaries. Aliases and bookmarks
+(binary data) can't be resolved without macOS APIs and are skipped.
+
+DFX doesn't document its files, so the keys in `SOURCES` may be wrong
+for some versions, and a list may be stored as bookmarks only. Either
+way, the list yields no paths, and `dfx.py` fetches it via
+AppleScript instead.
+
+Both XML and binary plists can be read. The paths found in each file
+are cached with the file's mtime, so unchanged files aren't parsed
+again.
+
+This module only uses the standard library, so it can be tested on
+any platform with fixture plist files.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from datetime import datetime, timedelta
+import os
+import plistlib
+import struct
+
+try:
+    from urllib import unquote
+except ImportError:  # Python 3
+    from urllib.parse import unquote
+
+# Where DFX 5 keeps its lists
+PREFS_FILE = '~/Library/Preferences/com.stclairsoft.DefaultFolderX5.plist'
+RECENTS_FILE = ('~/Library/Application Support/'
+                'com.stclairsoft.DefaultFolderX5/RecentItems.plist')
+
+# `(type, file, key)` of each list in DFX order. Can be overridden with
+# the `dfx_sources` setting
+SOURCES = (
+    ('fav', PREFS_FILE, 'favorites'),
+    ('rfolder', RECENTS_FILE, 'recentFolders'),
+    ('rfile', RECENTS_FILE, 'recentFiles'),
+)
+
+# Dictionary keys that may hold a path or file URL
+PATH_KEYS = ('path', 'Path', 'url', 'URL')
+
+# Start of binary plists' dates
+_EPOCH = datetime(2001, 1, 1)
+
+
+class PlistError(Exception):
+    """Raised if a file isn't a valid plist."""
+
+
+def read_plist(filepath):
+    """Parse XML or binary plist.
+
+    Args:
+        filepath (unicode): Path to plist file.
+
+    Returns:
+        object: Top-level object of the plist.
+
+    Raises:
+        PlistError: Raised if the file isn't a valid plist.
+    """
+    with open(filepath, 'rb') as fp:
+        data = fp.read()
+
+    if data.startswith(b'bplist00'):
+        return BinaryPlist(data).parse()
+
+    try:
+        return plistlib.readPlistFromString(data)
+    except Exception as err:  # expat raises several different errors
+        raise PlistError('invalid plist {0!r}: {1}'.format(filepath, err))
+
+
+class BinaryPlist(object):
+    """Parser for binary (`bplist00`) property lists.
+
+    Attributes:
+        data (str): Contents of the plist file.
+    """
+
+    def __init__(self, data):
+        """Create new `BinaryPlist`.
+
+        Args:
+            data (str): Contents of plist file.
+        """
+        self.data = data
+        self._bytes = bytearray(data)
+        self._offsets = []
+        self._ref_size = 0
+
+    def parse(self):
+        """Return top-level object.
+
+        Returns:
+            object: Parsed object.
+
+        Raises:
+            PlistError: Raised if the data isn't a valid binary plist.
+        """
+        if len(self.data) < 40:
+            raise PlistError('binary plist is too short')
+
+        try:
+            (offset_size, self._ref_size, count, top,
+             table) = struct.unpack(b'>6xBBQQQ', self.data[-32:])
+            if table + count * offset_size > len(self.data) - 32:
+                raise ValueError('offset table out of range')
+            if top >= count:
+                raise ValueError('top object out of range')
+            self._offsets = [self._int(table + i * offset_size, offset_size)
+                             for i in range(count)]
+            return self._object(top, set())
+        except (struct.error, IndexError, TypeError, ValueError) as err:
+            raise PlistError('invalid binary plist: {0}'.format(err))
+
+    def _int(self, offset, size):
+        """Read big-endian unsigned int of `size` bytes at `offset`."""
+        if offset + size > len(self._bytes):
+            raise IndexError('offset {0} out of range'.format(offset))
+        n = 0
+        for b in self._bytes[offset:offset + size]:
+            n = (n << 8) | b
+        return n
+
+    def _length(self, offset, info):
+        """Return `(length, start)` of object at `offset`."""
+        if info != 0xF:
+            return info, offset + 1
+        # Length is an int object following the marker
+        size = 1 << (self._bytes[offset + 1] & 0xF)
+        return self._int(offset + 2, size), offset + 2 + size
+
+    def _refs(self, start, count):
+        """Return `count` object references starting at `start`."""
+        size = self._ref_size
+        return [self._int(start + i * size, size) for i in range(count)]
+
+    def _object(self, ref, parents):
+        """Parse object number `ref`.
+
+        `parents` are the references of the containers being parsed,
+        which mustn't be contained in themselves.
+        """
+        if ref in parents:
+            raise ValueError('object {0} contains itself'.format(ref))
+
+        offset = self._offsets[ref]
+        marker = self._bytes[offset]
+        kind, info = marker >> 4, marker & 0xF
+
+        if marker == 0x00:
+            return None
+        if marker == 0x08:
+            return False
+        if marker == 0x09:
+            return True
+
+        if kind == 0x1:  # int
+            size = 1 << info
+            n = self._int(offset + 1, size)
+            if size == 8 and n & (1 << 63):  # only 8-byte ints are signed
+                n -= 1 << 64
+            return n
+
+        if kind == 0x2:  # real
+            size = 1 << info
+            fmt = b'>f' if size == 4 else b'>d'
+            data = self.data[offset + 1:offset + 1 + size]
+            return struct.unpack(fmt, data)[0]
+
+        if marker == 0x33:  # date
+            secs = struct.unpack(b'>d', self.data[offset + 1:offset + 9])[0]
+            return _EPOCH + timedelta(seconds=secs)
+
+        if kind == 0x8:  # UID
+            return self._int(offset + 1, info + 1)
+
+        length, start = self._length(offset, info)
+
+        if kind == 0x4:  # data
+            return plistlib.Data(self.data[start:start + length])
+
+        if kind == 0x5:  # ASCII string
+            return self.data[start:start + length].decode('ascii')
+
+        if kind == 0x6:  # UTF-16 string
+            return self.data[start:start + length * 2].decode('utf-16-be')
+
+        parents = parents | set([ref])
+
+        if kind == 0xA:  # array
+            return [self._object(r, parents)
+                    for r in self._refs(start, length)]
+
+        if kind == 0xD:  # dict
+            keys = self._refs(start, length)
+            values = self._refs(start + length * self._ref_size, length)
+            return dict((self._object(k, parents), self._object(v, parents))
+                        for k, v in zip(keys, values))
+
+        raise ValueError('unknown object type 0x{0:02x}'.format(marker))
+
+
+def find_paths(obj):
+    """Return the paths in a list (or other plist object).
+
+    Args:
+        obj (object): Parsed plist object.
+
+    Returns:
+        list: Absolute paths (unicode) in the order they appear.
+    """
+    paths = []
+
+    if isinstance(obj, bytes):
+        obj = obj.decode('utf-8')
+
+    if isinstance(obj, unicode):
+        if obj.startswith('file://'):
+            path = unquote(obj[7:].encode('utf-8'))
+            # `localhost` is the only host allowed in file URLs
+            if path.startswith(b'localhost/'):
+                path = path[9:]
+            paths.append(path.decode('utf-8'))
+        elif obj.startswith('/'):
+            paths.append(obj)
+
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            paths.extend(find_paths(value))
+
+    elif isinstance(obj, dict):
+        for key in PATH_KEYS:
+            if key in obj:
+                paths.extend(find_paths(obj[key]))
+                break
+
+    return paths
+
+
+def read_sources(sources=SOURCES, cache=None):
+    """Return the favourites and recent items in DFX's files.
+
+    Args:
+        sources (list, optional): `(type, file, key)` tuples. `~` in
+            `file` is expanded.
+        cache (dict, optional): Paths found in each file. Pass the
+            same dict (e.g. saved with `Workflow.cache_data()`) to
+            avoid parsing files again that haven't changed. It is
+            updated in place.
+
+    Returns:
+        list: `(type, path)` tuples in the same order as `sources`, or
+            `None` if none of the files exist. Lists that don't exist
+            or only contain aliases or bookmarks add no tuples.
+
+    Raises:
+        PlistError: Raised if a file can't be parsed.
+    """
+    if cache is None:
+        cache = {}
+
+    found = False
+    rows = []
+    for typ, filepath, key in sources:
+        filepath = os.path.expanduser(filepath)
+        try:
+            mtime = os.stat(filepath).st_mtime
+        except OSError:  # file doesn't exist
+            continue
+
+        found = True
+        cached = cache.get(filepath)
+        if cached is None or cached[0] != mtime or key not in cached[1]:
+            top = read_plist(filepath)
+            if not isinstance(top, dict):
+                top = {}
+            # Read all the lists in this file
+            keys = [k for _, f, k in sources
+                    if os.path.expanduser(f) == filepath]
+            cached = cache[filepath] = (
+                mtime, dict((k, find_paths(top.get(k))) for k in keys))
+
+        rows.extend([(typ, path) for path in cached[1][key]])
+
+    if not found:
+        return None
+
+    return rows
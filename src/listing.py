@@ -0,0 +1,177 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-24
+#
+
+"""Cached directory listings.
+
+`ListingCache` saves the contents of each directory it lists,
+together with the directory's mtime. Adding, removing or renaming an
+entry changes a directory's mtime, so an unchanged directory is never
+listed again.
+
+Listings are generated entry by entry, so a long listing can be fed
+straight into `Workflow.filter()`. Directories are read with
+`os.scandir()` (or the `scandir` backport), which knows whether each
+entry is a directory without calling `stat()`. `os.listdir()` is used
+if neither is available.
+
+This module only uses the standard library.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from collections import namedtuple
+from hashlib import sha1
+import os
+from time import time
+
+try:
+    import cPickle as pickle
+except ImportError:  # Python 3
+    import pickle
+
+try:
+    from os import scandir
+except ImportError:  # Python 2
+    try:
+        from scandir import scandir
+    except ImportError:  # backport not installed
+        scandir = None
+
+# Maximum number of listings to keep
+MAX_LISTINGS = 100
+
+# Extension of cached listings
+SUFFIX = '.listing'
+
+# Entry in a directory. `is_dir` is `True` for directories and
+# symlinks to directories
+Entry = namedtuple('Entry', ['name', 'path', 'is_dir'])
+
+
+def scan(dirpath, follow_symlinks=True):
+    """Generate the entries in a directory.
+
+    Args:
+        dirpath (unicode): Path to directory.
+        follow_symlinks (bool, optional): Whether symlinks to
+            directories count as directories.
+
+    Yields:
+        Entry: Entries in the order the filesystem returns them.
+
+    Raises:
+        OSError: Raised if `dirpath` can't be listed.
+    """
+    if scandir is not None:
+        for e in scandir(dirpath):
+            try:
+                is_dir = e.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:  # e.g. broken symlink
+                is_dir = False
+            yield Entry(e.name, e.path, is_dir)
+        return
+
+    for name in os.listdir(dirpath):
+        path = os.path.join(dirpath, name)
+        is_dir = os.path.isdir(path)
+        if is_dir and not follow_symlinks:
+            is_dir = not os.path.islink(path)
+        yield Entry(name, path, is_dir)
+
+
+class ListingCache(object):
+    """Directory listings cached in a directory.
+
+    Attributes:
+        dirpath (unicode): Directory listings are saved in.
+        max_entries (int): Number of listings to keep.
+    """
+
+    def __init__(self, dirpath, max_entries=MAX_LISTINGS):
+        """Create new `ListingCache`.
+
+        Args:
+            dirpath (unicode): Directory to save listings in. Created
+                if it doesn't exist.
+            max_entries (int, optional): Number of listings to keep.
+        """
+        self.dirpath = dirpath
+        self.max_entries = max_entries
+
+    def listing(self, dirpath):
+        """Generate the entries in a directory.
+
+        The cached listing is used if the directory hasn't changed.
+        Otherwise, it's listed and the listing is cached once all
+        entries have been generated.
+
+        Args:
+            dirpath (unicode): Path to directory.
+
+        Yields:
+            Entry: Entries in the directory.
+
+        Raises:
+            OSError: Raised if `dirpath` can't be listed.
+        """
+        mtime = os.stat(dirpath).st_mtime
+        path = self._path(dirpath)
+        cached = self._load(path)
+        # The directory may have changed again in the same tick as
+        # it was listed without its mtime changing, so don't trust
+        # listings made then
+        if (cached is not None and cached['mtime'] == mtime and
+                cached['listed'] - mtime >= 1):
+            os.utime(path, None)  # Update mtime, which eviction is based on
+            for name, is_dir in cached['entries']:
+                yield Entry(name, os.path.join(dirpath, name), is_dir)
+            return
+
+        listed = time()
+        entries = []
+        for e in scan(dirpath):
+            entries.append((e.name, e.is_dir))
+            yield e
+
+        self._save(path, {'mtime': mtime, 'listed': listed,
+                          'entries': entries})
+
+    def _path(self, dirpath):
+        """Return path of cached listing of `dirpath`."""
+        key = sha1(dirpath.encode('utf-8')).hexdigest()
+        return os.path.join(self.dirpath, key + SUFFIX)
+
+    def _load(self, path):
+        """Load cached listing or return `None`."""
+        try:
+            with open(path, 'rb') as fp:
+                return pickle.load(fp)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _save(self, path, data):
+        """Atomically save listing and evict old ones."""
+        if not os.path.exists(self.dirpath):
+            os.makedirs(self.dirpath)
+
+        temp = path + '.temp'
+        with open(temp, 'wb') as fp:
+            pickle.dump(data, fp, protocol=-1)
+        os.rename(temp, path)
+
+        paths = [os.path.join(self.dirpath, name)
+                 for name in os.listdir(self.dirpath)
+                 if name.endswith(SUFFIX)]
+        if len(paths) > self.max_entries:
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:-self.max_entries]:
+                try:
+                    os.unlink(path)
+                except OSError:  # deleted by another process
+                    pass
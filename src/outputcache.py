@@ -0,0 +1,262 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-20
+#
+
+"""Cache of complete Script Filter responses.
+
+Alfred runs the Script Filter every time the query changes, so the
+same query is often searched again within seconds (e.g. when the user
+deletes a character). `OutputCache` stores the JSON sent to Alfred,
+keyed by the script's arguments, the given environment variables, the
+generation of the cached DFX data and the workflow version, so such
+a run can write the same response straight to stdout.
+
+Don't cache responses that tell Alfred to re-run the Script Filter:
+the re-run would get the same response.
+
+This module only uses the standard library, so `dfx.py` can check
+the cache before importing docopt and Alfred-Workflow.
+
+Responses are only re-used for `MAX_AGE` seconds, as files may have
+been deleted since. The `MAX_ENTRIES` most-recently used responses
+are kept. Each lookup appends one byte (`HIT` or `MISS`) to
+`stats.log` in the cache directory, so concurrent runs don't lose
+counts and a lookup never rewrites a file.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from hashlib import sha1
+import os
+import sys
+from time import time
+
+# Maximum age of re-usable responses in seconds
+MAX_AGE = 10
+
+# Maximum number of responses to keep
+MAX_ENTRIES = 50
+
+# Extension of cached responses
+SUFFIX = '.out'
+
+# Written to the stats log for each hit and miss
+HIT = b'+'
+MISS = b'-'
+
+# Size in bytes at which the stats log is rolled over
+MAX_STATS_SIZE = 64 * 1024
+
+
+def _write(path, data):
+    """Atomically write bytestring `data` to `path`."""
+    temp = path + '.temp'
+    with open(temp, 'wb') as fp:
+        fp.write(data)
+    os.rename(temp, path)
+
+
+class OutputCache(object):
+    """Cached Script Filter responses in a directory.
+
+    Attributes:
+        dirpath (unicode): Directory responses are saved in.
+        max_age (int): Maximum age of re-usable responses in seconds.
+        max_entries (int): Number of responses to keep.
+        variables (tuple): Names of environment variables that are
+            part of the key.
+    """
+
+    def __init__(self, dirpath, max_age=MAX_AGE, max_entries=MAX_ENTRIES,
+                 variables=()):
+        """Create new `OutputCache`.
+
+        Args:
+            dirpath (unicode): Directory to save responses in. Created
+                if it doesn't exist.
+            max_age (int, optional): Maximum age of re-usable responses
+                in seconds.
+            max_entries (int, optional): Number of responses to keep.
+            variables (tuple, optional): Names of environment variables
+                that change the response, so are part of the key.
+        """
+        self.dirpath = dirpath
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.variables = variables
+
+    @classmethod
+    def from_env(cls, variables=()):
+        """Return `OutputCache` in the workflow's cache directory.
+
+        Args:
+            variables (tuple, optional): Names of environment variables
+                that change the response, so are part of the key.
+
+        Returns:
+            OutputCache: Cache or `None` if Alfred didn't set
+                `alfred_workflow_cache`.
+        """
+        cachedir = os.getenv('alfred_workflow_cache')
+        if not cachedir:
+            return None
+        return cls(os.path.join(cachedir, 'output'), variables=variables)
+
+    @property
+    def generation(self):
+        """ID of the current cached data. Changed by `bump()`.
+
+        Returns:
+            str: Generation or empty string if not set.
+        """
+        try:
+            with open(os.path.join(self.dirpath, 'generation'), 'rb') as fp:
+                return fp.read()
+        except (IOError, OSError):
+            return b''
+
+    @property
+    def stats(self):
+        """Number of hits and misses in the current and previous log.
+
+        Returns:
+            dict: `{'hits': int, 'misses': int}`
+        """
+        path = os.path.join(self.dirpath, 'stats.log')
+        data = b''
+        for p in (path + '.1', path):
+            try:
+                with open(p, 'rb') as fp:
+                    data += fp.read()
+            except (IOError, OSError):
+                pass
+
+        return {'hits': data.count(HIT), 'misses': data.count(MISS)}
+
+    def bump(self):
+        """Start a new generation, so existing responses aren't re-used.
+
+        Call when the cached data change.
+        """
+        self._makedir()
+        _write(os.path.join(self.dirpath, 'generation'),
+               repr(time()).encode('utf-8'))
+
+    def key(self, args):
+        """Return key for Script Filter arguments.
+
+        Args:
+            args (list): Script arguments (bytestrings), i.e.
+                `sys.argv[1:]`.
+
+        Returns:
+            str: Key based on `args`, the values of `variables`, the
+                generation and the workflow version.
+        """
+        version = os.getenv('alfred_workflow_version', b'')
+        if not version:
+            path = os.path.join(os.path.dirname(__file__), 'version')
+            if os.path.exists(path):
+                with open(path, 'rb') as fp:
+                    version = fp.read().strip()
+
+        parts = list(args) + [self.generation, version]
+        for name in self.variables:
+            parts.append(_bytes(name) + b'=' + _bytes(os.getenv(name, b'')))
+        return sha1(b'\0'.join([_bytes(s) for s in parts])).hexdigest()
+
+    def get(self, key):
+        """Return cached response for `key`.
+
+        Args:
+            key (str): Key from `key()`.
+
+        Returns:
+            str: JSON response or `None` if there is no usable response.
+        """
+        path = os.path.join(self.dirpath, key + SUFFIX)
+        data = None
+        try:
+            with open(path, 'rb') as fp:
+                created, data = fp.read().split(b'\n', 1)
+            if time() - float(created) > self.max_age:
+                data = None
+            else:
+                # Update mtime, which eviction is based on
+                os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            pass
+
+        self._count(HIT if data is not None else MISS)
+        return data
+
+    def put(self, key, data):
+        """Save response `data` for `key` and evict old responses.
+
+        Args:
+            key (str): Key from `key()`.
+            data (str): JSON response.
+        """
+        self._makedir()
+        created = repr(time()).encode('utf-8')
+        _write(os.path.join(self.dirpath, key + SUFFIX),
+               created + b'\n' + _bytes(data))
+
+        paths = [os.path.join(self.dirpath, name)
+                 for name in os.listdir(self.dirpath)
+                 if name.endswith(SUFFIX)]
+        if len(paths) > self.max_entries:
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:-self.max_entries]:
+                try:
+                    os.unlink(path)
+                except OSError:  # deleted by another process
+                    pass
+
+    def serve(self, args):
+        """Write cached response for `args` to stdout and exit.
+
+        Returns (without writing anything) if there is no usable
+        response.
+
+        Args:
+            args (list): Script arguments, i.e. `sys.argv[1:]`.
+        """
+        data = self.get(self.key(args))
+        if data is not None:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+            sys.exit(0)
+
+    def _count(self, event):
+        """Append `event` (`HIT` or `MISS`) to `stats.log`."""
+        path = os.path.join(self.dirpath, 'stats.log')
+        try:
+            if os.path.getsize(path) > MAX_STATS_SIZE:
+                os.rename(path, path + '.1')
+        except OSError:  # no log yet or renamed by another process
+            pass
+
+        try:
+            # Appends of a single byte don't overwrite each other
+            with open(path, 'ab') as fp:
+                fp.write(event)
+        except (IOError, OSError):  # cache directory doesn't exist yet
+            pass
+
+    def _makedir(self):
+        """Create cache directory if it doesn't exist."""
+        if not os.path.exists(self.dirpath):
+            os.makedirs(self.dirpath)
+
+
+def _bytes(s):
+    """Return UTF-8 bytestring of `s`."""
+    if isinstance(s, bytes):
+        return s
+    return s.encode('utf-8')
@@ -0,0 +1,183 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-23
+#
+
+"""Cache of which paths exist.
+
+DFX's lists often contain files that have since been deleted or are
+on volumes that aren't mounted, which the Script Filter mustn't show.
+Instead of calling `os.path.exists()` for every result on every
+keystroke, `PathCache` remembers the result for each path.
+
+Paths that exist are re-checked after `POSITIVE_TTL` seconds, missing
+ones after `NEGATIVE_TTL` seconds. The watcher refreshes all paths
+in bulk with `PathCache.refresh()` shortly before their results
+expire, so while it's running, the Script Filter normally doesn't
+have to check any. Otherwise, the Script Filter only re-checks the
+paths of the entries that match the query.
+
+The cache only needs saving if a path has appeared or disappeared,
+or if paths were refreshed in bulk. Re-checking a single path that
+hasn't changed doesn't count, so the Script Filter doesn't rewrite
+the cache on every run.
+
+Paths on a volume in `/Volumes` that isn't mounted are all marked
+missing after checking the mount point once.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+from time import time
+
+# Seconds to trust that a path exists. Must be longer than the
+# watcher's refresh margin (`MAX_CACHE_AGE` in `dfx.py`), or every
+# refresh re-checks every path
+POSITIVE_TTL = 30
+
+# Seconds to trust that a path is missing
+NEGATIVE_TTL = 30
+
+# Where macOS mounts volumes other than the boot volume
+VOLUMES_DIR = '/Volumes/'
+
+
+def volume(path):
+    """Return mount point of the volume in `/Volumes` `path` is on.
+
+    Args:
+        path (unicode): Absolute path.
+
+    Returns:
+        unicode: Mount point or `None` if `path` isn't in `/Volumes`.
+    """
+    if not path.startswith(VOLUMES_DIR):
+        return None
+    name = path[len(VOLUMES_DIR):].split('/', 1)[0]
+    if not name:
+        return None
+    return VOLUMES_DIR + name
+
+
+class PathCache(object):
+    """Whether paths exist, with separate TTLs for either result.
+
+    Attributes:
+        data (dict): `{path: (exists, checked)}`. Save it (e.g. with
+            `Workflow.cache_data()`) to use the results in another
+            process.
+        changed (bool): `True` if a path has appeared or disappeared
+            or paths have been refreshed since the `PathCache` was
+            created.
+        positive_ttl (int): Seconds to trust that a path exists.
+        negative_ttl (int): Seconds to trust that a path is missing.
+    """
+
+    def __init__(self, data=None, positive_ttl=POSITIVE_TTL,
+                 negative_ttl=NEGATIVE_TTL):
+        """Create new `PathCache`.
+
+        Args:
+            data (dict, optional): `data` of a previous `PathCache`.
+            positive_ttl (int, optional): Seconds to trust that a path
+                exists.
+            negative_ttl (int, optional): Seconds to trust that a path
+                is missing.
+        """
+        self.data = data or {}
+        self.changed = False
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        # Whether volumes are mounted. Only checked once per instance
+        self._mounted = {}
+
+    def exists(self, path):
+        """Return whether `path` exists.
+
+        The filesystem is only checked if the cached result has expired.
+
+        Args:
+            path (unicode): Absolute path.
+
+        Returns:
+            bool: `True` if `path` exists.
+        """
+        cached = self.data.get(path)
+        if cached is not None:
+            exists, checked = cached
+            ttl = self.positive_ttl if exists else self.negative_ttl
+            if time() - checked < ttl:
+                return exists
+
+        return self._check(path, time())
+
+    def refresh(self, paths, force=False, margin=0):
+        """Check `paths` and forget all other paths.
+
+        Paths on volumes that have been unmounted are marked missing,
+        even if their cached results haven't expired.
+
+        Args:
+            paths (iterable): Absolute paths.
+            force (bool, optional): Check all paths, not just those
+                whose cached result has expired.
+            margin (int, optional): Also check paths whose cached
+                result expires within this many seconds.
+
+        Returns:
+            int: Number of paths checked.
+        """
+        now = time()
+        # Volumes may have been (un)mounted since last refresh
+        self._mounted = {}
+        data = {}
+        n = 0
+        for path in paths:
+            cached = self.data.get(path)
+            if cached is not None and not force:
+                exists, checked = cached
+                ttl = self.positive_ttl if exists else self.negative_ttl
+                mount = volume(path) if exists else None
+                if (now - checked < ttl - margin and
+                        (mount is None or self._is_mounted(mount))):
+                    data[path] = cached
+                    continue
+
+            self._check(path, now)
+            data[path] = self.data[path]
+            n += 1
+
+        # Re-checked paths have new timestamps
+        if n or len(data) != len(self.data):
+            self.changed = True
+        self.data = data
+        return n
+
+    def _is_mounted(self, mount):
+        """Return whether a volume is mounted at `mount`."""
+        mounted = self._mounted.get(mount)
+        if mounted is None:
+            mounted = self._mounted[mount] = os.path.ismount(mount)
+        return mounted
+
+    def _check(self, path, now):
+        """Check whether `path` exists and cache the result.
+
+        Only sets `changed` if the result is new or different.
+        """
+        mount = volume(path)
+        if mount is not None and not self._is_mounted(mount):
+            exists = False
+        else:
+            exists = os.path.exists(path)
+
+        cached = self.data.get(path)
+        if cached is None or cached[0] != exists:
+            self.changed = True
+        self.data[path] = (exists, now)
+        return exists
@@ -0,0 +1,582 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-19
+#
+
+"""SQLite-backed stores for DFX entries and indexed files.
+
+`EntryStore` is an alternative to pickling the whole list of entries
+with `Workflow.cache_data()`. The updater adds new entries and removes
+old ones in a single transaction, and as the database uses
+write-ahead logging, the Script Filter can read it while it's
+being updated.
+
+`FileIndex` holds the files in and under DFX's favourite folders.
+`FileIndex.scan()` only lists directories whose mtime has changed
+since the last scan.
+
+Each entry's search keys (name, diacritic-folded name, capitals and
+initials) are indexed with an FTS5 trigram index if the SQLite
+library supports it. `EntryStore.search()` returns entries whose keys
+contain every query word, i.e. candidates for `MATCH_STARTSWITH`,
+`MATCH_ATOM`, `MATCH_SUBSTRING`, `MATCH_CAPITALS` and `MATCH_INITIALS`,
+which should then be scored with `Workflow.filter()`. Words shorter
+than a trigram (or all words, if there's no FTS5) are matched with
+`LIKE` instead. Entries that aren't returned can still match a query
+via `MATCH_ALLCHARS`, which the index can't help with.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from fnmatch import fnmatch
+import os
+import sqlite3
+from time import time
+
+from listing import scan
+
+from workflow.workflow import (
+    INITIALS,
+    fold_to_ascii,
+    split_on_delimiters,
+)
+
+# Maximum number of files returned by `FileIndex.search()`
+MAX_CANDIDATES = 500
+
+# Words shorter than this can't be looked up in a trigram index
+MIN_FTS_LENGTH = 3
+
+# Stored as `user_version`. Databases with a different version are
+# deleted and re-created
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    -- bitmask of entry types
+    type INTEGER NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    pretty_path TEXT NOT NULL,
+    keys TEXT NOT NULL,
+    -- position in DFX's list
+    rank INTEGER NOT NULL,
+    -- when entry was first and last seen by the updater
+    added REAL NOT NULL,
+    checked REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_rank ON entries (rank);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search
+USING fts5(keys, tokenize='trigram');
+"""
+
+# Columns returned by `EntryStore.search()` and `EntryStore.all()`
+COLUMNS = 'type, path, name, pretty_path'
+
+# Stored as `user_version` of `FileIndex` databases
+FILE_SCHEMA_VERSION = 1
+
+FILE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    -- directory's mtime when it was listed
+    mtime REAL NOT NULL,
+    listed REAL NOT NULL,
+    -- last scan that reached the directory
+    seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    dir INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    keys TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Number of directories `FileIndex.scan()` lists per transaction
+SCAN_BATCH_SIZE = 100
+
+
+def search_keys(name):
+    """Return text to match query words against.
+
+    Contains every form of `name` that `Workflow.filter()` matches a
+    query against, so an entry that doesn't contain a query word
+    can't match it (except via `MATCH_ALLCHARS`).
+
+    Args:
+        name (unicode): Entry name.
+
+    Returns:
+        unicode: Lowercase keys separated by newlines.
+    """
+    keys = []
+    for text in (name, fold_to_ascii(name)):
+        atoms = [s.lower() for s in split_on_delimiters(text)]
+        for key in (text.lower(),
+                    ''.join([c for c in text if c in INITIALS]).lower(),
+                    ''.join([s[0] for s in atoms if s])):
+            if key and key not in keys:
+                keys.append(key)
+
+    return '\n'.join(keys)
+
+
+def _like_pattern(word):
+    """Return `LIKE` pattern that matches text containing `word`."""
+    for c in '\\%_':
+        word = word.replace(c, '\\' + c)
+    return '%{0}%'.format(word)
+
+
+def _fts_phrase(word):
+    """Return FTS5 phrase that matches text containing `word`."""
+    return '"{0}"'.format(word.replace('"', '""'))
+
+
+def _ignored(name, patterns):
+    """Return `True` if `name` matches any of glob `patterns`."""
+    for pattern in patterns:
+        if fnmatch(name, pattern):
+            return True
+    return False
+
+
+class Database(object):
+    """Base class for SQLite databases with a trigram search index.
+
+    The database is opened (and created if necessary) on first use.
+    Subclasses set the schema and version, and must have a `meta`
+    table and a `keys` column in the table the `search` index
+    belongs to.
+
+    Attributes:
+        filepath (unicode): Path to database file.
+    """
+
+    #: SQL to create tables
+    schema = None
+    #: Databases with a different `user_version` are re-created
+    version = None
+    #: Tables to drop when re-creating the database
+    tables = ()
+
+    def __init__(self, filepath):
+        """Create new `Database`.
+
+        Args:
+            filepath (unicode): Path to database file.
+        """
+        self.filepath = filepath
+        self._conn = None
+        self._fts = None
+
+    @property
+    def conn(self):
+        """Connection to database.
+
+        Returns:
+            sqlite3.Connection: Open connection.
+        """
+        if self._conn is None:
+            conn = sqlite3.connect(self.filepath, timeout=5)
+            # Readers don't block the writer and vice versa
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != self.version:
+                conn.executescript(
+                    ''.join(['DROP TABLE IF EXISTS {0}; '.format(t)
+                             for t in self.tables + ('search', 'meta')]) +
+                    'PRAGMA user_version = {0};'.format(self.version))
+            conn.executescript(self.schema)
+            self._conn = conn
+
+        return self._conn
+
+    @property
+    def fts(self):
+        """Whether the trigram full-text index is available.
+
+        Returns:
+            bool: `True` if SQLite supports FTS5 with trigrams.
+        """
+        if self._fts is None:
+            try:
+                self.conn.executescript(FTS_SCHEMA)
+                self._fts = True
+            except sqlite3.OperationalError:  # no FTS5 or trigrams
+                self._fts = False
+
+        return self._fts
+
+    @property
+    def updated(self):
+        """Time of last update.
+
+        Returns:
+            float: UNIX timestamp or `None` if database has never
+                been updated.
+        """
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'updated'").fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _match(self, query):
+        """Return SQL conditions for rows whose keys contain `query`.
+
+        Args:
+            query (unicode): Search query.
+
+        Returns:
+            tuple: `(where, params)`. `where` is a list of SQL
+                conditions and `params` their parameters.
+        """
+        words = [s.strip().lower() for s in query.split(' ') if s.strip()]
+        fts = self.fts
+        where = []
+        params = []
+
+        phrases = [_fts_phrase(w) for w in words
+                   if fts and len(w) >= MIN_FTS_LENGTH]
+        if phrases:
+            where.append(
+                'id IN (SELECT rowid FROM search WHERE search MATCH ?)')
+            params.append(' AND '.join(phrases))
+
+        for word in words:
+            if not fts or len(word) < MIN_FTS_LENGTH:
+                where.append("keys LIKE ? ESCAPE '\\'")
+                params.append(_like_pattern(word))
+
+        return where, params
+
+    def close(self):
+        """Close database connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class EntryStore(Database):
+    """DFX entries in an SQLite database.
+
+    The database is opened (and created if necessary) on first use.
+
+    Attributes:
+        filepath (unicode): Path to database file.
+    """
+
+    schema = SCHEMA
+    version = SCHEMA_VERSION
+    tables = ('entries',)
+
+    def update(self, entries):
+        """Replace stored entries with `entries`.
+
+        Entries that are already stored are updated in place, new ones
+        are inserted and ones no longer in `entries` are deleted. The
+        changes are made in a single transaction.
+
+        Args:
+            entries (list): `(type, path, name, pretty_path)` tuples,
+                e.g. `DfxEntry` objects, in DFX order. Paths must be
+                unique.
+
+        Returns:
+            tuple: `(added, removed)` number of entries.
+        """
+        now = time()
+        fts = self.fts
+        added = 0
+        with self.conn as conn:
+            for rank, (typ, path, name, pretty_path) in enumerate(entries):
+                cursor = conn.execute(
+                    'UPDATE entries SET type = ?, rank = ?, checked = ? '
+                    'WHERE path = ?', (typ, rank, now, path))
+                if cursor.rowcount:
+                    continue
+
+                keys = search_keys(name)
+                cursor = conn.execute(
+                    'INSERT INTO entries (type, path, name, pretty_path, '
+                    'keys, rank, added, checked) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (typ, path, name, pretty_path, keys, rank, now, now))
+                if fts:
+                    conn.execute(
+                        'INSERT INTO search (rowid, keys) VALUES (?, ?)',
+                        (cursor.lastrowid, keys))
+                added += 1
+
+            ids = [(row[0],) for row in conn.execute(
+                   'SELECT id FROM entries WHERE checked < ?', (now,))]
+            if fts:
+                conn.executemany('DELETE FROM search WHERE rowid = ?', ids)
+            conn.executemany('DELETE FROM entries WHERE id = ?', ids)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('updated', ?)", (now,))
+
+        return added, len(ids)
+
+    def all(self, mask=0):
+        """Return all stored entries.
+
+        Args:
+            mask (int, optional): Only return entries whose type has
+                one of these bits set. 0 means all entries.
+
+        Returns:
+            list: `(type, path, name, pretty_path)` tuples in DFX order.
+        """
+        return self._select([], [], mask, 0)
+
+    def search(self, query, mask=0, limit=0):
+        """Return entries whose search keys contain every word of `query`.
+
+        Entries with shorter names, which score higher in
+        `Workflow.filter()`, are returned first.
+
+        Args:
+            query (unicode): Search query.
+            mask (int, optional): Only return entries whose type has
+                one of these bits set. 0 means all entries.
+            limit (int, optional): Maximum number of entries to return.
+                0 means no limit.
+
+        Returns:
+            list: `(type, path, name, pretty_path)` tuples.
+        """
+        where, params = self._match(query)
+        return self._select(where, params, mask, limit,
+                            order='length(name), rank')
+
+    def _select(self, where, params, mask, limit, order='rank'):
+        """Return entries matching SQL conditions.
+
+        Args:
+            where (list): SQL conditions.
+            params (list): Parameters of `where`.
+            mask (int): Type bitmask. 0 means all types.
+            limit (int): Maximum number of entries. 0 means no limit.
+            order (str, optional): SQL `ORDER BY` clause. Default is
+                DFX order.
+
+        Returns:
+            list: `(type, path, name, pretty_path)` tuples.
+        """
+        where = list(where)
+        params = list(params)
+        if mask:
+            where.append('type & ? != 0')
+            params.append(mask)
+
+        sql = 'SELECT {0} FROM entries'.format(COLUMNS)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY ' + order
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        return self.conn.execute(sql, params).fetchall()
+
+
+class FileIndex(Database):
+    """Files in and under a set of directories, in an SQLite database.
+
+    The database is opened (and created if necessary) on first use.
+
+    Attributes:
+        filepath (unicode): Path to database file.
+    """
+
+    schema = FILE_SCHEMA
+    version = FILE_SCHEMA_VERSION
+    tables = ('dirs', 'files')
+
+    @property
+    def stats(self):
+        """Statistics of the last scan.
+
+        Returns:
+            dict: See `scan()`. Empty if the index has never been
+                scanned.
+        """
+        return dict(self.conn.execute(
+            "SELECT key, value FROM meta "
+            "WHERE key NOT IN ('updated', 'ignore')"))
+
+    def scan(self, roots, ignore=(), progress=None):
+        """Add the contents of `roots` to the index.
+
+        Directories whose mtime hasn't changed since they were last
+        listed aren't listed again (but their subdirectories are
+        checked), unless `ignore` has changed. Directories and files
+        that no longer exist, or are no longer under `roots`, are
+        removed.
+
+        Symlinks to directories aren't followed.
+
+        Args:
+            roots (list): Directories to index.
+            ignore (list, optional): Glob patterns. Files and
+                directories whose name matches any of them are not
+                indexed.
+            progress (callable, optional): Called with the statistics
+                so far after every `SCAN_BATCH_SIZE` directories.
+
+        Returns:
+            dict: Statistics: `listed` and `skipped` (unchanged)
+                directories, `files` in listed directories, `total`
+                files in the index and `duration` of scan in seconds.
+        """
+        start = time()
+        stats = {'listed': 0, 'skipped': 0, 'files': 0}
+        conn = self.conn
+        fts = self.fts
+        visited = set()
+        stack = list(reversed(roots))
+        patterns = '\n'.join(ignore)
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = 'ignore'").fetchone()
+        relist = row is None or row[0] != patterns
+
+        while stack:
+            dirpath = stack.pop()
+            if dirpath in visited:
+                continue
+            visited.add(dirpath)
+
+            try:
+                mtime = os.stat(dirpath).st_mtime
+            except OSError:  # deleted or no permission
+                continue
+
+            row = conn.execute('SELECT id, mtime, listed FROM dirs '
+                               'WHERE path = ?', (dirpath,)).fetchone()
+            # Don't trust listings made in the same tick as the mtime
+            if (not relist and row is not None and row[1] == mtime and
+                    row[2] - mtime >= 1):
+                conn.execute('UPDATE dirs SET seen = ? WHERE id = ?',
+                             (start, row[0]))
+                children = [r[0] for r in conn.execute(
+                            'SELECT path FROM files '
+                            'WHERE dir = ? AND is_dir = 1', (row[0],))]
+                stats['skipped'] += 1
+
+            else:
+                listed = time()
+                try:
+                    entries = [e for e in scan(dirpath, False)
+                               if not _ignored(e.name, ignore)]
+                except OSError:
+                    continue
+
+                if row is not None:
+                    dir_id = row[0]
+                    self._delete_files('dir = ?', (dir_id,))
+                    conn.execute('UPDATE dirs SET mtime = ?, listed = ?, '
+                                 'seen = ? WHERE id = ?',
+                                 (mtime, listed, start, dir_id))
+                else:
+                    dir_id = conn.execute(
+                        'INSERT INTO dirs (path, mtime, listed, seen) '
+                        'VALUES (?, ?, ?, ?)',
+                        (dirpath, mtime, listed, start)).lastrowid
+
+                for e in entries:
+                    keys = search_keys(e.name)
+                    file_id = conn.execute(
+                        'INSERT INTO files (dir, path, name, is_dir, keys) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (dir_id, e.path, e.name, e.is_dir, keys)).lastrowid
+                    if fts:
+                        conn.execute(
+                            'INSERT INTO search (rowid, keys) VALUES (?, ?)',
+                            (file_id, keys))
+
+                children = [e.path for e in entries if e.is_dir]
+                stats['listed'] += 1
+                stats['files'] += len(entries)
+
+            stack.extend(reversed(children))
+
+            if not (stats['listed'] + stats['skipped']) % SCAN_BATCH_SIZE:
+                conn.commit()
+                if progress is not None:
+                    progress(dict(stats, duration=time() - start))
+
+        # Remove directories that weren't reached
+        with conn:
+            self._delete_files(
+                'dir IN (SELECT id FROM dirs WHERE seen < ?)', (start,))
+            conn.execute('DELETE FROM dirs WHERE seen < ?', (start,))
+
+            stats['total'] = conn.execute(
+                'SELECT COUNT(*) FROM files').fetchone()[0]
+            stats['duration'] = time() - start
+            conn.executemany(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                list(stats.items()) + [('updated', start),
+                                       ('ignore', patterns)])
+
+        return stats
+
+    def search(self, query, limit=MAX_CANDIDATES):
+        """Return files whose search keys contain every word of `query`.
+
+        Files with shorter names, which score higher in
+        `Workflow.filter()`, are returned first.
+
+        Args:
+            query (unicode): Search query.
+            limit (int, optional): Maximum number of files to return.
+                0 means no limit.
+
+        Returns:
+            list: `(path, name, is_dir)` tuples.
+        """
+        where, params = self._match(query)
+        sql = 'SELECT path, name, is_dir FROM files'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY length(name)'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        return [(path, name, bool(is_dir)) for path, name, is_dir
+                in self.conn.execute(sql, params)]
+
+    def _delete_files(self, where, params):
+        """Delete files matching SQL condition `where`."""
+        if self.fts:
+            self.conn.execute(
+                'DELETE FROM search WHERE rowid IN '
+                '(SELECT id FROM files WHERE {0})'.format(where), params)
+        self.conn.execute('DELETE FROM files WHERE ' + where, params)
@@ -0,0 +1,275 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-26
+#
+
+"""How often paths are used, for ranking results.
+
+`UsageTable` keeps a usage count per path in a file of fixed-size
+records: an open-addressing hash table keyed by a hash of the path.
+Recording a use rewrites only the path's record (and the header if it
+is a new path), so the cost doesn't depend on how many paths there are.
+
+Counts decay exponentially, halving every `HALF_LIFE` seconds. Each
+record stores the count and the time it was last updated, and the
+decay is calculated when the count is read or incremented, so old
+records never have to be rewritten.
+
+When more than `MAX_LOAD` of the slots are used, the table is
+rewritten with twice as many slots, and records whose counts have
+decayed below `MIN_COUNT` are dropped.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+from hashlib import sha1
+import os
+import struct
+from time import time
+
+from workflow.workflow import LockFile, atomic_writer
+
+# Counts halve in this many seconds
+HALF_LIFE = 14 * 24 * 3600
+
+# Records with lower (decayed) counts are dropped when the table grows
+MIN_COUNT = 0.1
+
+# Smallest number of slots in the table
+MIN_SLOTS = 256
+
+# Grow the table when this fraction of the slots is used
+MAX_LOAD = 0.5
+
+# Changed whenever the file format changes
+MAGIC = b'DFXU'
+VERSION = 1
+
+# Magic, version, number of slots, number of used slots
+HEADER = struct.Struct(b'<4sIII')
+
+# Key (hash of path), count and time count was last updated. Key 0
+# marks an empty slot
+RECORD = struct.Struct(b'<Qdd')
+
+
+def path_key(path):
+    """Return key of `path` in a `UsageTable`.
+
+    Args:
+        path (unicode): Path.
+
+    Returns:
+        int: Non-zero 64-bit hash of `path`.
+    """
+    key = struct.unpack(b'<Q', sha1(path.encode('utf-8')).digest()[:8])[0]
+    return key or 1
+
+
+def decay(count, updated, now, half_life=HALF_LIFE):
+    """Return `count` decayed from time `updated` to time `now`.
+
+    Args:
+        count (float): Count at time `updated`.
+        updated (float): UNIX timestamp.
+        now (float): UNIX timestamp.
+        half_life (int, optional): Seconds for count to halve.
+
+    Returns:
+        float: Decayed count.
+    """
+    return count * 0.5 ** (max(now - updated, 0) / float(half_life))
+
+
+class UsageTable(object):
+    """Decaying usage counts of paths in a file.
+
+    Attributes:
+        filepath (unicode): Path to table file.
+        half_life (int): Seconds for counts to halve.
+    """
+
+    def __init__(self, filepath, half_life=HALF_LIFE):
+        """Create new `UsageTable`.
+
+        Args:
+            filepath (unicode): Path to table file. Created when the
+                first use is recorded.
+            half_life (int, optional): Seconds for counts to halve.
+        """
+        self.filepath = filepath
+        self.half_life = half_life
+        self._records = None
+
+    @property
+    def records(self):
+        """Records read from the file.
+
+        The file is read once, on first access.
+
+        Returns:
+            dict: `{key: (count, updated)}`.
+        """
+        if self._records is None:
+            self._records = {}
+            try:
+                with open(self.filepath, 'rb') as fp:
+                    data = fp.read()
+            except (IOError, OSError):  # no uses recorded yet
+                return self._records
+
+            header = _read_header(data, len(data))
+            if header is not None:
+                for i in range(header[0]):
+                    key, count, updated = RECORD.unpack_from(
+                        data, HEADER.size + i * RECORD.size)
+                    if key:
+                        self._records[key] = (count, updated)
+
+        return self._records
+
+    def count(self, path, now=None):
+        """Return the decayed usage count of `path`.
+
+        Args:
+            path (unicode): Path.
+            now (float, optional): Time to decay count to. Defaults
+                to current time.
+
+        Returns:
+            float: Count. 0 if `path` has never been used.
+        """
+        record = self.records.get(path_key(path))
+        if record is None:
+            return 0.0
+        if now is None:
+            now = time()
+        return decay(record[0], record[1], now, self.half_life)
+
+    def add(self, path, n=1, now=None):
+        """Record `n` uses of `path`.
+
+        Only the path's record and the header are written, unless the
+        table has to grow.
+
+        Args:
+            path (unicode): Path.
+            n (float, optional): Number of uses.
+            now (float, optional): Time of use. Defaults to current
+                time.
+
+        Returns:
+            float: New count.
+        """
+        if now is None:
+            now = time()
+        key = path_key(path)
+
+        dirpath = os.path.dirname(self.filepath)
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+
+        with LockFile(self.filepath, timeout=2):
+            count = self._increment(key, n, now)
+            if count is None:
+                self._grow(now)
+                count = self._increment(key, n, now)
+
+        if self._records is not None:
+            self._records[key] = (count, now)
+
+        return count
+
+    def _increment(self, key, n, now):
+        """Add `n` to count of `key` in place.
+
+        Must be called with the table locked.
+
+        Returns:
+            float: New count or `None` if the table doesn't exist,
+                is invalid or is full.
+        """
+        try:
+            fp = open(self.filepath, 'r+b')
+        except (IOError, OSError):  # doesn't exist
+            return None
+
+        with fp:
+            size = os.fstat(fp.fileno()).st_size
+            header = _read_header(fp.read(HEADER.size), size)
+            if header is None:
+                return None
+
+            slots, used = header
+            i = key % slots
+            while True:
+                offset = HEADER.size + i * RECORD.size
+                fp.seek(offset)
+                k, count, updated = RECORD.unpack(fp.read(RECORD.size))
+                if k == key or not k:
+                    break
+                i = (i + 1) % slots
+
+            if k:
+                count = decay(count, updated, now, self.half_life) + n
+            elif used + 1 > slots * MAX_LOAD:
+                return None
+            else:
+                count = n
+                fp.seek(0)
+                fp.write(HEADER.pack(MAGIC, VERSION, slots, used + 1))
+
+            fp.seek(offset)
+            fp.write(RECORD.pack(key, count, now))
+
+        return count
+
+    def _grow(self, now):
+        """Re-create table with enough slots, dropping decayed records.
+
+        Must be called with the table locked.
+        """
+        self._records = None
+        records = dict((k, (c, u)) for k, (c, u) in self.records.items()
+                       if decay(c, u, now, self.half_life) >= MIN_COUNT)
+
+        # Leave room for the record being added
+        slots = MIN_SLOTS
+        while len(records) + 1 > slots * MAX_LOAD:
+            slots *= 2
+
+        table = [None] * slots
+        for key, record in records.items():
+            i = key % slots
+            while table[i] is not None:
+                i = (i + 1) % slots
+            table[i] = (key,) + record
+
+        with atomic_writer(self.filepath, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, VERSION, slots, len(records)))
+            empty = RECORD.pack(0, 0, 0)
+            for row in table:
+                fp.write(RECORD.pack(*row) if row else empty)
+
+        self._records = dict(records)
+
+
+def _read_header(data, size):
+    """Return `(slots, used)` from table header or `None` if invalid.
+
+    Args:
+        data (str): Start of table file.
+        size (int): Size of table file.
+    """
+    if len(data) < HEADER.size:
+        return None
+    magic, version, slots, used = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or not slots:
+        return None
+    if size < HEADER.size + slots * RECORD.size:  # truncated
+        return None
+    return slots, used
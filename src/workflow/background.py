@@ -8,18 +8,23 @@
 # Created on 2014-04-06
 #
 
-"""Run background tasks."""
+"""Run background tasks and watch files for changes."""
 
 from __future__ import print_function, unicode_literals
 
+import errno
 import sys
 import os
+import select
 import subprocess
 import pickle
+import time
 
 from workflow import Workflow
 
-__all__ = ['is_running', 'run_in_background']
+__all__ = ['is_running', 'run_in_background', 'lower_priority',
+           'get_watcher', 'Watcher', 'KqueueWatcher', 'InotifyWatcher',
+           'PollingWatcher']
 
 _wf = None
 
@@ -96,6 +101,12 @@ def is_running(name):
     return False
 
 
+def _flush_logs():
+    """Write any buffered log messages to the log file."""
+    for handler in wf().logger.handlers:
+        handler.flush()
+
+
 def _background(stdin='/dev/null', stdout='/dev/null',
                 stderr='/dev/null'):  # pragma: no cover
     """Fork the current process into a background daemon.
@@ -108,6 +119,8 @@ def _background(stdin='/dev/null', stdout='/dev/null',
     :type stderr: filepath
 
     """
+    # Write buffered log messages, or both processes will write them
+    _flush_logs()
     # Do first fork.
     try:
         pid = os.fork()
@@ -122,6 +135,7 @@ def _background(stdin='/dev/null', stdout='/dev/null',
     os.umask(0)
     os.setsid()
     # Do second fork.
+    _flush_logs()
     try:
         pid = os.fork()
         if pid > 0:
@@ -182,7 +196,8 @@ def run_in_background(name, args, **kwargs):
     # Call this script
     cmd = ['/usr/bin/python', __file__, name]
     wf().logger.debug('Calling {0!r} ...'.format(cmd))
-    retcode = subprocess.call(cmd)
+    with wf().metrics.span('spawn_{0}'.format(name)):
+        retcode = subprocess.call(cmd)
     if retcode:  # pragma: no cover
         wf().logger.error('Failed to call task in background')
     else:
@@ -190,6 +205,430 @@ def run_in_background(name, args, **kwargs):
     return retcode
 
 
+# `setiopolicy_np()` arguments from OS X's <sys/resource.h>
+IOPOL_TYPE_DISK = 0
+IOPOL_SCOPE_PROCESS = 0
+IOPOL_THROTTLE = 3
+
+
+def lower_priority(niceness=10):
+    """Lower the CPU and disk I/O priority of the current process.
+
+    .. versionadded:: 1.24
+
+    Call this at the start of a long-running background task, so it
+    doesn't slow down the user's foreground apps (or Alfred).
+
+    The process's niceness is increased by ``niceness``. On OS X, its
+    disk I/O is throttled with ``setiopolicy_np()``. On Linux, its I/O
+    scheduling class is set to idle with ``ionice``, if installed.
+
+    :param niceness: amount to increase niceness by
+    :type niceness: ``int``
+    :returns: ``True`` if I/O priority was lowered, else ``False``
+    :rtype: ``Boolean``
+
+    """
+    log = wf().logger
+    try:
+        os.nice(niceness)
+    except OSError as err:  # pragma: no cover
+        log.warning('Could not change niceness: %s', err)
+
+    if sys.platform == 'darwin':
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS,
+                               IOPOL_THROTTLE) == 0:
+            return True
+        err = _get_errno()
+        log.warning('Could not throttle I/O: %s', os.strerror(err))
+        return False
+
+    try:
+        retcode = subprocess.call(['ionice', '-c', '3', '-p',
+                                   str(os.getpid())])
+    except OSError:  # not installed
+        return False
+    return retcode == 0
+
+
+def _stat(path):
+    """Return values that change when ``path`` changes.
+
+    :param path: path to file or directory
+    :type path: ``unicode``
+    :returns: ``(mtime, size, inode)`` or ``None`` if ``path`` doesn't
+        exist
+    :rtype: ``tuple``
+
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class Watcher(object):
+    """Watch files and directories for changes.
+
+    .. versionadded:: 1.24
+
+    A path has changed if it has been created, deleted or replaced,
+    or its modification time or size has changed. For a directory, that
+    means a file was added to, removed from or renamed in it.
+
+    Subclasses only wait for the operating system to report that
+    something *may* have changed. :meth:`wait` then compares the
+    paths with their state when they were last checked, so
+    unrelated events don't count.
+
+    Use :func:`get_watcher` to get the best watcher for the system.
+
+    :param paths: files and directories to watch. They needn't exist.
+    :type paths: ``list``
+
+    """
+
+    #: Name of the backend
+    backend = None
+
+    def __init__(self, paths):
+        """Create new :class:`Watcher`."""
+        self.paths = [os.path.abspath(p) for p in paths]
+        self._state = dict((p, _stat(p)) for p in self.paths)
+
+    def changed(self):
+        """Return paths that have changed since last call.
+
+        :returns: changed paths
+        :rtype: ``list``
+
+        """
+        changed = []
+        for path in self.paths:
+            state = _stat(path)
+            if state != self._state[path]:
+                self._state[path] = state
+                changed.append(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """Block until any of the watched paths changes.
+
+        :param timeout: maximum time to wait in seconds. ``None`` means
+            wait forever.
+        :type timeout: ``float``
+        :returns: changed paths. Empty if ``timeout`` expired.
+        :rtype: ``list``
+
+        """
+        if timeout is not None:
+            timeout = time.time() + timeout
+
+        while True:
+            changed = self.changed()
+            if changed:
+                return changed
+
+            remaining = None
+            if timeout is not None:
+                remaining = timeout - time.time()
+                if remaining <= 0:
+                    return []
+
+            self._wait(remaining)
+
+    def _wait(self, timeout):
+        """Block until something may have changed or for ``timeout``."""
+        raise NotImplementedError()
+
+    def close(self):
+        """Stop watching. Releases any system resources."""
+
+    def _directories(self):
+        """Return existing directories to watch for events.
+
+        Files are watched via their parent directory, so replacing a
+        file (e.g. by an atomic save) is noticed. Missing paths are
+        watched via their nearest existing ancestor.
+
+        """
+        dirs = []
+        for path in self.paths:
+            if not os.path.isdir(path):
+                path = os.path.dirname(path)
+            while not os.path.isdir(path) and path != os.path.dirname(path):
+                path = os.path.dirname(path)
+            if path not in dirs:
+                dirs.append(path)
+        return dirs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """:class:`Watcher` that checks the paths every ``interval`` seconds.
+
+    .. versionadded:: 1.24
+
+    Works everywhere, but changes are noticed up to ``interval`` seconds
+    late.
+
+    :param paths: files and directories to watch
+    :type paths: ``list``
+    :param interval: seconds between checks
+    :type interval: ``float``
+
+    """
+
+    backend = 'poll'
+
+    def __init__(self, paths, interval=1.0):
+        """Create new :class:`PollingWatcher`."""
+        super(PollingWatcher, self).__init__(paths)
+        self.interval = interval
+
+    def _wait(self, timeout):
+        """Sleep for ``interval`` seconds or ``timeout``."""
+        if timeout is None or timeout > self.interval:
+            timeout = self.interval
+        time.sleep(timeout)
+
+
+# inotify(7) event flags
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# Events that may mean a watched path has changed
+INOTIFY_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+                  IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+                  IN_MOVE_SELF)
+
+_libc = None
+
+
+def _inotify_libc():
+    """Return C library with inotify functions or ``None``."""
+    global _libc
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+        _libc = False
+        name = ctypes.util.find_library('c')
+        if name:
+            libc = ctypes.CDLL(name, use_errno=True)
+            if hasattr(libc, 'inotify_init1'):
+                _libc = libc
+    return _libc or None
+
+
+class InotifyWatcher(Watcher):
+    """:class:`Watcher` that uses Linux's inotify API (via :mod:`ctypes`).
+
+    .. versionadded:: 1.24
+
+    :param paths: files and directories to watch
+    :type paths: ``list``
+
+    """
+
+    backend = 'inotify'
+
+    def __init__(self, paths):
+        """Create new :class:`InotifyWatcher`."""
+        self._libc = _inotify_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = _get_errno()
+            raise OSError(err, os.strerror(err))
+
+        super(InotifyWatcher, self).__init__(paths)
+        self._arm()
+
+    def _arm(self):
+        """Add watches for directories.
+
+        Re-adding a watched directory is a no-op, so this is called
+        after every event to watch directories that have been created.
+
+        """
+        for path in self._directories():
+            if isinstance(path, unicode):
+                path = path.encode('utf-8')
+            # Fails if directory was deleted since. It's a missing path
+            # and will be picked up next time
+            self._libc.inotify_add_watch(self._fd, path, INOTIFY_EVENTS)
+
+    def _wait(self, timeout):
+        """Wait for inotify events."""
+        try:
+            ready = select.select([self._fd], [], [], timeout)[0]
+        except select.error as err:
+            if err.args[0] != errno.EINTR:
+                raise
+            return
+
+        if ready:
+            # Events are only a signal to check the paths, so just
+            # empty the queue
+            try:
+                while os.read(self._fd, 65536):
+                    pass
+            except OSError as err:
+                if err.errno != errno.EAGAIN:
+                    raise
+            self._arm()
+
+    def close(self):
+        """Close inotify file descriptor."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _get_errno():
+    """Return C ``errno`` of last :mod:`ctypes` call."""
+    import ctypes
+    return ctypes.get_errno()
+
+
+# kqueue vnode events that may mean a watched path has changed
+KQUEUE_EVENTS = ('NOTE_WRITE', 'NOTE_DELETE', 'NOTE_RENAME',
+                 'NOTE_EXTEND', 'NOTE_ATTRIB')
+
+# Open files for event notification only (macOS), so watching them
+# doesn't prevent volumes from being unmounted
+O_EVTONLY = 0x8000 if sys.platform == 'darwin' else os.O_RDONLY
+
+
+class KqueueWatcher(Watcher):
+    """:class:`Watcher` that uses BSD/macOS kqueue.
+
+    .. versionadded:: 1.24
+
+    Watches the paths themselves and their directories. As kqueue
+    watches open files, not paths, everything is re-opened after each
+    event, so replaced files are watched, too.
+
+    :param paths: files and directories to watch
+    :type paths: ``list``
+
+    """
+
+    backend = 'kqueue'
+
+    def __init__(self, paths):
+        """Create new :class:`KqueueWatcher`."""
+        if not hasattr(select, 'kqueue'):
+            raise OSError(errno.ENOSYS, 'kqueue is not available')
+
+        super(KqueueWatcher, self).__init__(paths)
+        self._kq = select.kqueue()
+        self._fds = []
+        self._fflags = 0
+        for name in KQUEUE_EVENTS:
+            self._fflags |= getattr(select, 'KQ_' + name)
+        self._arm()
+
+    def _arm(self):
+        """(Re-)open and register all paths and their directories."""
+        self._release()
+        targets = self._directories() + [p for p in self.paths
+                                         if os.path.isfile(p)]
+        events = []
+        for path in targets:
+            try:
+                fd = os.open(path, O_EVTONLY)
+            except OSError:  # deleted in the meantime
+                continue
+            self._fds.append(fd)
+            events.append(select.kevent(
+                fd, filter=select.KQ_FILTER_VNODE,
+                flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                fflags=self._fflags))
+
+        if events:
+            self._kq.control(events, 0, 0)
+
+    def _wait(self, timeout):
+        """Wait for kqueue events."""
+        if self._kq.control(None, 1, timeout):
+            self._arm()
+
+    def _release(self):
+        """Close watched files. Their events are removed automatically."""
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def close(self):
+        """Close kqueue and watched files."""
+        self._release()
+        self._kq.close()
+
+
+#: Watcher classes by name of backend, in order of preference
+WATCHERS = (
+    ('kqueue', KqueueWatcher),
+    ('inotify', InotifyWatcher),
+    ('poll', PollingWatcher),
+)
+
+
+def get_watcher(paths, backend=None):
+    """Return a :class:`Watcher` for ``paths``.
+
+    .. versionadded:: 1.24
+
+    :param paths: files and directories to watch
+    :type paths: ``list``
+    :param backend: name of backend to use (``kqueue``, ``inotify`` or
+        ``poll``). By default, the first one that works is used.
+    :type backend: ``unicode``
+    :returns: watcher for ``paths``
+    :rtype: :class:`Watcher`
+
+    Use it as a context manager to release its resources::
+
+        with get_watcher(paths) as watcher:
+            while True:
+                for path in watcher.wait():
+                    print('{0} changed'.format(path))
+
+    """
+    for name, cls in WATCHERS:
+        if backend is not None and name != backend:
+            continue
+        try:
+            return cls(paths)
+        except OSError as err:
+            if backend is not None:
+                raise
+            wf().logger.debug('{0} watcher unavailable : {1}'.format(
+                              name, err))
+
+    raise ValueError('Unknown backend : {0!r}'.format(backend))
+
+
 def main(wf):  # pragma: no cover
     """Run command in a background process.
 
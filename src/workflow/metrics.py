@@ -0,0 +1,253 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-05
+#
+
+"""Time and count the stages of a workflow run.
+
+.. versionadded:: 1.24
+
+An instance of :class:`Metrics` is available at
+:attr:`Workflow.metrics <workflow.workflow.Workflow.metrics>`. Wrap
+the stages you're interested in in :meth:`Metrics.span` and add counts
+with :meth:`Metrics.count`::
+
+    with wf.metrics.span('load'):
+        data = load_data()
+    wf.metrics.count('items', len(data))
+
+When the workflow exits, the timings and counts are appended as one JSON
+record to a rolling file in the workflow's cache directory. Use the
+``workflow:metrics`` :ref:`magic argument <magic-arguments>` to view
+percentiles of the last :data:`SUMMARY_RUNS` recorded runs, or e.g.
+``workflow:metrics 20`` for the last 20.
+
+Metrics are off by default, in which case :meth:`Metrics.span` returns a
+shared no-op context manager and :meth:`Metrics.count` returns
+immediately. Turn them on with the ``workflow:metricson`` magic argument
+or by setting the ``WORKFLOW_METRICS`` environment variable to ``1``.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import time
+
+#: Environment variable to turn metrics on with
+METRICS_ENVVAR = 'WORKFLOW_METRICS'
+
+#: Size in bytes at which the metrics file is rolled over
+MAX_FILE_SIZE = 512 * 1024
+
+#: Default number of runs :meth:`Metrics.summary` is calculated over
+SUMMARY_RUNS = 100
+
+#: Percentiles calculated by :meth:`Metrics.summary`
+PERCENTILES = (50, 90, 99)
+
+
+class _NullSpan(object):
+    """Span that does nothing. Returned when metrics are off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_null_span = _NullSpan()
+
+# Shared `Metrics` objects. See `get_metrics()`
+_instances = {}
+
+
+class Span(object):
+    """Context manager that adds its run time to a :class:`Metrics` stage.
+
+    Use :meth:`Metrics.span` to create a :class:`Span`.
+
+    :param metrics: object to add timing to
+    :type metrics: :class:`Metrics`
+    :param name: name of stage
+    :type name: ``unicode``
+
+    """
+
+    def __init__(self, metrics, name):
+        """Create new :class:`Span` object."""
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        """Start timer."""
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        """Stop timer and record time."""
+        self.metrics.add_time(self.name, time.time() - self.start)
+
+
+class Metrics(object):
+    """Timings and counts for the current run.
+
+    :param filepath: path to the JSON-lines file records are
+        saved to.
+    :type filepath: ``unicode``
+    :param enabled: whether to record anything.
+    :type enabled: ``Boolean``
+
+    """
+
+    def __init__(self, filepath, enabled=False):
+        """Create new :class:`Metrics` object."""
+        self.filepath = filepath
+        self.enabled = enabled
+        self.timings = {}
+        self.counts = {}
+
+    def span(self, name):
+        """Return a context manager that times stage ``name``.
+
+        If a stage is timed more than once, the times are added together.
+
+        :param name: name of stage, e.g. ``filter``
+        :type name: ``unicode``
+        :returns: :class:`Span` or no-op context manager if metrics
+            are off.
+
+        """
+        if not self.enabled:
+            return _null_span
+        return Span(self, name)
+
+    def add_time(self, name, seconds):
+        """Add ``seconds`` to the time of stage ``name``."""
+        if self.enabled:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        """Add ``n`` to counter ``name``, e.g. number of items or bytes."""
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @property
+    def record(self):
+        """Record for this run.
+
+        :returns: ``dict`` with keys ``time``, ``timings`` and ``counts``.
+        :rtype: ``dict``
+
+        """
+        return {'time': time.time(),
+                'timings': self.timings,
+                'counts': self.counts}
+
+    def save(self):
+        """Append :attr:`record` to :attr:`filepath`.
+
+        Does nothing if metrics are off or nothing was recorded. The
+        file is rolled over when it reaches :const:`MAX_FILE_SIZE`.
+
+        """
+        if not self.enabled or not (self.timings or self.counts):
+            return
+
+        if (os.path.exists(self.filepath) and
+                os.path.getsize(self.filepath) > MAX_FILE_SIZE):
+            os.rename(self.filepath, self.filepath + '.1')
+
+        with open(self.filepath, 'ab') as file_obj:
+            file_obj.write(json.dumps(self.record, sort_keys=True) + '\n')
+
+        self.timings = {}
+        self.counts = {}
+
+    def history(self, runs=SUMMARY_RUNS):
+        """Return the last ``runs`` saved records, oldest first.
+
+        :param runs: number of records to return
+        :type runs: ``int``
+        :returns: ``list`` of records (see :attr:`record`)
+
+        """
+        lines = []
+        for path in (self.filepath + '.1', self.filepath):
+            if os.path.exists(path):
+                with open(path, 'rb') as file_obj:
+                    lines.extend(file_obj.read().splitlines())
+
+        records = []
+        for line in lines[-runs:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:  # truncated line
+                continue
+
+        return records
+
+    def summary(self, runs=SUMMARY_RUNS, percentiles=PERCENTILES):
+        """Calculate percentiles of timings and counts over recent runs.
+
+        :param runs: number of recent runs to summarise
+        :type runs: ``int``
+        :param percentiles: percentiles to calculate
+        :type percentiles: ``tuple`` of ``int``
+        :returns: ``dict`` with keys ``runs`` (number of records
+            summarised), ``timings`` and ``counts``. The latter two map
+            stage/counter names to ``{percentile: value}`` dicts.
+            Timings are in seconds.
+        :rtype: ``dict``
+
+        """
+        records = self.history(runs)
+        values = {}
+        for r in records:
+            for key in ('timings', 'counts'):
+                for name, value in r.get(key, {}).items():
+                    values.setdefault((key, name), []).append(value)
+
+        summary = {'runs': len(records), 'timings': {}, 'counts': {}}
+        for (key, name), vals in values.items():
+            vals.sort()
+            summary[key][name] = dict(
+                (p, _percentile(vals, p)) for p in percentiles)
+
+        return summary
+
+
+#: Shared :class:`Metrics` that records nothing. Used when metrics are off
+null_metrics = Metrics(None)
+
+
+def get_metrics(filepath, enabled=False):
+    """Return the :class:`Metrics` object for ``filepath``.
+
+    All :class:`~workflow.workflow.Workflow` objects in a process share
+    the same :class:`Metrics`, so stages timed via, e.g.,
+    :mod:`~workflow.background` are saved with the main workflow's record.
+
+    :param filepath: path to the file records are saved to
+    :type filepath: ``unicode``
+    :param enabled: whether to record anything (only used when the
+        object is created).
+    :type enabled: ``Boolean``
+    :returns: :class:`Metrics` instance
+
+    """
+    if filepath not in _instances:
+        _instances[filepath] = Metrics(filepath, enabled)
+    return _instances[filepath]
+
+
+def _percentile(values, p):
+    """Return ``p``-th percentile of sorted ``values`` (nearest rank)."""
+    i = int(round(p / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(i, len(values) - 1))]
@@ -0,0 +1,910 @@
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-12
+#
+
+"""Batch scoring engine for :meth:`Workflow.filter() <workflow.workflow.Workflow.filter>`.
+
+.. versionadded:: 1.24
+
+:meth:`~workflow.workflow.Workflow.filter` normally scores one item at a
+time, re-processing each search key (lowercasing, diacritic folding,
+splitting into atoms) for every item and every query word.
+
+A :class:`KeyIndex` does that work once for a whole list of keys, storing
+the results in columns. :func:`batch_score` then applies each
+``MATCH_*`` rule to all remaining candidates in turn. The scores and
+ordering are identical to the item-by-item implementation.
+
+Pass a :class:`KeyIndex` to :meth:`~workflow.workflow.Workflow.filter`
+via its ``index`` argument::
+
+    index = KeyIndex([key(item) for item in items])
+    results = wf.filter(query, items, key, index=index)
+
+Build the index once and keep it (it can be pickled, e.g. with
+:meth:`~workflow.workflow.Workflow.cache_data`) to get the most benefit.
+
+Before any rules are applied, keys that don't contain every character
+of a query word are rejected by comparing 63-bit character signatures
+(see :func:`signature`), which are stored in the index.
+
+For long lists, also build trigram posting lists with
+``KeyIndex.build(trigrams=True)``. For query words of at least
+:const:`TRIGRAM_LENGTH` characters, only keys that contain all of the
+word's trigrams are tested against the other rules, instead of every
+key in the index. ``MATCH_ALLCHARS`` can't use the posting lists (the
+characters needn't be adjacent), so if that rule is enabled, the
+remaining keys are still checked against it.
+
+The engine is pure Python. :mod:`numpy`'s vectorised string functions
+(``numpy.char``) call the string methods once per element, and were
+slower than testing the columns in plain loops.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import copy
+import heapq
+import string
+import time
+
+from workflow import (
+    DEADLINE_INTERVAL,
+    INITIALS,
+    MATCH_ALL,
+    MATCH_ALLCHARS,
+    MATCH_ATOM,
+    MATCH_CAPITALS,
+    MATCH_INITIALS,
+    MATCH_INITIALS_CONTAIN,
+    MATCH_INITIALS_STARTSWITH,
+    MATCH_STARTSWITH,
+    MATCH_SUBSTRING,
+    fold_memo,
+    fold_to_ascii,
+    isascii,
+    split_on_delimiters,
+)
+
+#: Characters that have their own bit in a :func:`signature`. All other
+#: characters share the remaining bits.
+SIGNATURE_CHARS = string.ascii_lowercase + string.digits
+
+# Bits of the characters in `SIGNATURE_CHARS`
+_signature_bits = dict((c, 1 << i) for i, c in enumerate(SIGNATURE_CHARS))
+
+# Bits shared by all other characters (so signatures fit in a
+# 64-bit `int` on Python 2)
+_shared_bits = 63 - len(SIGNATURE_CHARS)
+
+# Rules applied by `batch_score()`, in order:
+# (rule, column, test, column whose length is used in score, base score)
+RULES = (
+    (MATCH_STARTSWITH, 'lower', 'startswith', 'text', 100.0),
+    (MATCH_CAPITALS, 'capitals', 'startswith', 'capitals', 100.0),
+    (MATCH_ATOM, 'atoms', 'contains', 'text', 100.0),
+    (MATCH_INITIALS_STARTSWITH, 'initials', 'startswith', 'initials', 100.0),
+    (MATCH_INITIALS_CONTAIN, 'initials', 'contains', 'initials', 95.0),
+    (MATCH_SUBSTRING, 'lower', 'contains', 'text', 90.0),
+)
+
+#: Rules that are cheap to apply to every key. They are also the first
+#: rules applied, so a key they match won't score differently with the
+#: remaining rules. See :meth:`CompiledQuery.restrict`.
+CHEAP_RULES = MATCH_STARTSWITH | MATCH_CAPITALS | MATCH_ATOM
+
+#: Length of the n-grams in trigram posting lists
+TRIGRAM_LENGTH = 3
+
+# Columns trigram posting lists are built for and the rules that only
+# match keys that contain all the query's trigrams in that column
+TRIGRAM_COLUMNS = (
+    ('lower', MATCH_STARTSWITH | MATCH_ATOM | MATCH_SUBSTRING),
+    ('capitals', MATCH_CAPITALS),
+    ('initials', MATCH_INITIALS),
+)
+
+#: Minimum number of keys for :meth:`Workflow.filter()
+#: <workflow.workflow.Workflow.filter>` to use :func:`parallel_score`
+#: (if it's called with ``processes``)
+PARALLEL_MIN_KEYS = 100000
+
+# Arguments of the current `parallel_score()` call. Set before the
+# worker processes are forked, so they inherit the index instead of
+# receiving a pickled copy
+_job = {}
+
+
+def signature(text):
+    """Return a bitmask of the characters in ``text``.
+
+    Each character in :const:`SIGNATURE_CHARS` has its own bit, so
+    for those characters, ``signature(a) & signature(b) == signature(a)``
+    if and only if ``set(a) <= set(b)``. Other characters may share a
+    bit with each other, so a match must be confirmed.
+
+    Args:
+        text (unicode): Lowercase text.
+
+    Returns:
+        int: Signature of ``text``.
+    """
+    sig = 0
+    for c in set(text):
+        bit = _signature_bits.get(c)
+        if bit is None:
+            bit = 1 << (len(SIGNATURE_CHARS) + ord(c) % _shared_bits)
+        sig |= bit
+    return sig
+
+
+def trigrams(text):
+    """Return set of trigrams (3-character substrings) in ``text``.
+
+    Args:
+        text (unicode): Lowercase text.
+
+    Returns:
+        set: Trigrams. Empty if ``text`` is shorter than
+            :const:`TRIGRAM_LENGTH`.
+    """
+    n = TRIGRAM_LENGTH
+    return set([text[i:i + n] for i in range(len(text) - n + 1)])
+
+
+def _intersect(postings, grams):
+    """Return set of rows that contain all ``grams``.
+
+    Args:
+        postings (dict): Trigram posting lists of one column.
+        grams (set): Trigrams to look up.
+
+    Returns:
+        set: Rows that appear in the posting lists of every trigram.
+    """
+    lists = []
+    for gram in grams:
+        rows = postings.get(gram)
+        if not rows:
+            return set()
+        lists.append(rows)
+
+    lists.sort(key=len)
+    result = set(lists[0])
+    for rows in lists[1:]:
+        result.intersection_update(rows)
+        if not result:
+            break
+
+    return result
+
+
+class Columns(object):
+    """Pre-processed search keys. Created by :meth:`KeyIndex.columns`.
+
+    Each attribute is a list with one entry per key.
+
+    Attributes:
+        text (list): Keys (diacritic-folded if ``fold`` is ``True``).
+        lower (list): Lowercase ``text``.
+        capitals (list): Lowercase capital letters and digits of ``text``.
+        atoms (list): Lowercase "words" of ``text`` separated and
+            surrounded by spaces, e.g. ``" how i met your mother "``.
+        initials (list): First letters of atoms, e.g. ``"himym"``.
+        signatures (list): :func:`signature` of ``lower``.
+        trigrams (dict): Trigram posting lists or ``None`` if they
+            haven't been built. Maps names of columns in
+            :const:`TRIGRAM_COLUMNS` to ``{trigram: [row, ...]}`` dicts.
+    """
+
+    # Class attribute, so columns pickled before posting lists were
+    # added still load
+    trigrams = None
+
+    def __init__(self, values, fold=False):
+        """Create new :class:`Columns` from list of ``values``.
+
+        Args:
+            values (list): Search keys (Unicode).
+            fold (bool, optional): Fold diacritics to ASCII.
+        """
+        if fold:
+            values = [fold_to_ascii(v) for v in values]
+
+        self.text = values
+        self.lower = []
+        self.capitals = []
+        self.atoms = []
+        self.initials = []
+        self.signatures = []
+
+        for value in values:
+            self.lower.append(value.lower())
+            self.signatures.append(signature(self.lower[-1]))
+            self.capitals.append(
+                ''.join([c for c in value if c in INITIALS]).lower())
+            atoms = [s.lower() for s in split_on_delimiters(value)]
+            self.atoms.append(' {0} '.format(' '.join(atoms)))
+            self.initials.append(''.join([s[0] for s in atoms if s]))
+
+    def build_trigrams(self):
+        """Build trigram posting lists for :const:`TRIGRAM_COLUMNS`."""
+        self.trigrams = {}
+        for name, _ in TRIGRAM_COLUMNS:
+            postings = self.trigrams[name] = {}
+            for i, text in enumerate(getattr(self, name)):
+                for gram in trigrams(text):
+                    if gram in postings:
+                        postings[gram].append(i)
+                    else:
+                        postings[gram] = [i]
+
+    def candidates(self, word):
+        """Return rows that could match ``word`` or ``None``.
+
+        ``MATCH_ALLCHARS`` is ignored: rows that aren't returned may
+        still match ``word`` by that rule.
+
+        Args:
+            word (QueryWord): Query word.
+
+        Returns:
+            set: Rows that contain all the trigrams of ``word`` in the
+                columns its rules test, or ``None`` if every row is a
+                candidate (no posting lists or ``word`` is too short).
+        """
+        if self.trigrams is None or not word.trigrams:
+            return None
+
+        rows = set()
+        for name, rules in TRIGRAM_COLUMNS:
+            if word.match_on & rules:
+                rows.update(_intersect(self.trigrams[name], word.trigrams))
+
+        return rows
+
+
+class KeyIndex(object):
+    """Search keys of a list of items, pre-processed for :func:`batch_score`.
+
+    The columns for folded and unfolded keys are built the first time
+    they're needed.
+
+    Attributes:
+        values (list): Search keys with whitespace stripped.
+    """
+
+    def __init__(self, keys):
+        """Create new :class:`KeyIndex` for search ``keys``.
+
+        Args:
+            keys (iterable): Search keys (Unicode), one per item
+                and in the same order as the items.
+        """
+        self.values = [k.strip() for k in keys]
+        self._columns = {}
+
+    def __len__(self):
+        """Number of keys in index."""
+        return len(self.values)
+
+    def columns(self, fold):
+        """Return :class:`Columns` for folded or unfolded keys.
+
+        Args:
+            fold (bool): Whether to return columns for keys with
+                diacritics folded to ASCII.
+
+        Returns:
+            Columns: Pre-processed keys.
+        """
+        if fold not in self._columns:
+            self._columns[fold] = Columns(self.values, fold)
+        return self._columns[fold]
+
+    def take(self, rows):
+        """Return a new :class:`KeyIndex` containing only ``rows``.
+
+        Columns that have already been built are copied, not rebuilt.
+        Trigram posting lists are not copied.
+
+        Args:
+            rows (list): Indices of keys to keep, in the order to keep them.
+
+        Returns:
+            KeyIndex: Index of the selected keys.
+        """
+        index = KeyIndex([])
+        index.values = [self.values[i] for i in rows]
+        for fold, cols in self._columns.items():
+            new = Columns([])
+            for name, column in cols.__dict__.items():
+                if name != 'trigrams':
+                    setattr(new, name, [column[i] for i in rows])
+            index._columns[fold] = new
+        return index
+
+    def build(self, fold=True, trigrams=False):
+        """Build columns now instead of on first use.
+
+        Call this before caching an index so that the columns are
+        cached, too.
+
+        Args:
+            fold (bool, optional): Also build folded columns.
+            trigrams (bool, optional): Also build trigram posting lists.
+                Only worth it for thousands of keys.
+
+        Returns:
+            KeyIndex: ``self``
+        """
+        folds = [False, True] if fold else [False]
+        for fold in folds:
+            cols = self.columns(fold)
+            if trigrams and cols.trigrams is None:
+                cols.build_trigrams()
+        return self
+
+    def prime(self):
+        """Add the index's folded keys to the diacritic-folding memo.
+
+        Folded keys are stored (and cached) with the index. Priming
+        :data:`~workflow.workflow.fold_memo` from a cached index means
+        :func:`~workflow.workflow.fold_to_ascii` doesn't have to fold
+        them again, e.g. when the same keys are filtered without the
+        index.
+
+        Returns:
+            KeyIndex: ``self``
+        """
+        cols = self._columns.get(True)
+        if cols is not None:
+            fold_memo.update((v, f) for v, f in zip(self.values, cols.text)
+                             if v != f)
+        return self
+
+
+def _select(cols, name, test, needle, candidates):
+    """Split ``candidates`` into those that pass ``test`` and those that don't.
+
+    Args:
+        cols (Columns): Columns to test.
+        name (unicode): Name of column to test.
+        test (unicode): ``startswith`` or ``contains``.
+        needle (unicode): Text to look for.
+        candidates (list): Indices of keys to test.
+
+    Returns:
+        tuple: ``(hits, misses)`` lists of indices.
+    """
+    column = getattr(cols, name)
+    hits = []
+    misses = []
+    if test == 'startswith':
+        for i in candidates:
+            if column[i].startswith(needle):
+                hits.append(i)
+            else:
+                misses.append(i)
+    else:
+        for i in candidates:
+            if needle in column[i]:
+                hits.append(i)
+            else:
+                misses.append(i)
+
+    return hits, misses
+
+
+def allchars_score(query, text):
+    """Score ``text`` on how close together the characters of ``query`` are.
+
+    This is the ``MATCH_ALLCHARS`` rule. The score is ``100 / (end + 1)``,
+    where ``text[:end]`` is the shortest start of ``text`` that contains
+    ``query`` as a subsequence. ``end`` is found greedily with
+    :meth:`unicode.find`, so unlike the ``.*?a.*?b.*?c`` regular
+    expression this rule used to use, it never backtracks.
+
+    The score is the same as the regular expression's. Its formula,
+    ``100 / ((1 + start) * (end - start + 1))``, looks like it rewards
+    tight windows, but the pattern starts with ``.*?``, so every match
+    starts at 0. Starting a window later never scores higher either:
+    the greedy end from a later ``start`` is at least as far along, so
+    ``(1 + start) * (end - start + 1)`` is never smaller than ``end + 1``.
+
+    Args:
+        query (unicode): Lowercase query word.
+        text (unicode): Lowercase search key.
+
+    Returns:
+        float: Score or 0 if ``query`` isn't a subsequence of ``text``.
+    """
+    find = text.find
+    pos = 0
+    for c in query:
+        pos = find(c, pos)
+        if pos < 0:
+            return 0
+        pos += 1
+
+    return 100.0 / (pos + 1)
+
+
+class QueryWord(object):
+    """A single word of a :class:`CompiledQuery`.
+
+    Attributes:
+        text (unicode): Lowercase word.
+        fold (bool): Whether search keys are folded to ASCII for this word.
+        match_on (int): ``MATCH_*`` rules to apply.
+        signature (int): :func:`signature` of ``text``.
+        unsigned (list): Characters of ``text`` that share a signature
+            bit with other characters.
+        atom (unicode): ``text`` surrounded by spaces for matching
+            against :attr:`Columns.atoms`.
+        trigrams (set): :func:`trigrams` of ``text``.
+    """
+
+    def __init__(self, word, match_on, fold_diacritics):
+        """Create new :class:`QueryWord`.
+
+        Args:
+            word (unicode): Query word.
+            match_on (int): ``MATCH_*`` rules to apply.
+            fold_diacritics (bool): Fold search keys if ``word`` is ASCII.
+        """
+        self.text = word.lower()
+        self.fold = bool(fold_diacritics and isascii(self.text))
+        self.match_on = match_on
+        self.signature = signature(self.text)
+        self.unsigned = [c for c in set(self.text)
+                         if c not in _signature_bits]
+        self.atom = ' {0} '.format(self.text)
+        self.trigrams = trigrams(self.text)
+
+    def score(self, value, lower):
+        """Score a single search key against this word.
+
+        Args:
+            value (unicode): Search key, folded if :attr:`fold` is ``True``.
+            lower (unicode): Lowercase ``value``.
+
+        Returns:
+            tuple: ``(score, rule)``. ``score`` is 0 if key doesn't match.
+        """
+        query = self.text
+        match_on = self.match_on
+
+        # pre-filter any items that do not contain all characters
+        # of ``query`` to save on running several more expensive tests
+        for c in query:
+            if c not in lower:
+                return (0, None)
+
+        # item starts with query
+        if match_on & MATCH_STARTSWITH and lower.startswith(query):
+            score = 100.0 - (len(value) // len(query))
+
+            return (score, MATCH_STARTSWITH)
+
+        # query matches capitalised letters in item,
+        # e.g. of = OmniFocus
+        if match_on & MATCH_CAPITALS:
+            initials = ''.join([c for c in value if c in INITIALS])
+            if initials.lower().startswith(query):
+                score = 100.0 - (len(initials) // len(query))
+
+                return (score, MATCH_CAPITALS)
+
+        # split the item into "atoms", i.e. words separated by
+        # spaces or other non-word characters
+        if (match_on & MATCH_ATOM or
+                match_on & MATCH_INITIALS_CONTAIN or
+                match_on & MATCH_INITIALS_STARTSWITH):
+            atoms = [s.lower() for s in split_on_delimiters(value)]
+            # initials of the atoms
+            initials = ''.join([s[0] for s in atoms if s])
+
+        if match_on & MATCH_ATOM:
+            # is `query` one of the atoms in item?
+            # similar to substring, but scores more highly, as it's
+            # a word within the item
+            if query in atoms:
+                score = 100.0 - (len(value) // len(query))
+
+                return (score, MATCH_ATOM)
+
+        # `query` matches start (or all) of the initials of the
+        # atoms, e.g. ``himym`` matches "How I Met Your Mother"
+        # *and* "how i met your mother" (the ``capitals`` rule only
+        # matches the former)
+        if (match_on & MATCH_INITIALS_STARTSWITH and
+                initials.startswith(query)):
+            score = 100.0 - (len(initials) // len(query))
+
+            return (score, MATCH_INITIALS_STARTSWITH)
+
+        # `query` is a substring of initials, e.g. ``doh`` matches
+        # "The Dukes of Hazzard"
+        elif (match_on & MATCH_INITIALS_CONTAIN and
+                query in initials):
+            score = 95.0 - (len(initials) // len(query))
+
+            return (score, MATCH_INITIALS_CONTAIN)
+
+        # `query` is a substring of item
+        if match_on & MATCH_SUBSTRING and query in lower:
+            score = 90.0 - (len(value) // len(query))
+
+            return (score, MATCH_SUBSTRING)
+
+        # finally, assign a score based on how close together the
+        # characters in `query` are in item.
+        if match_on & MATCH_ALLCHARS:
+            score = allchars_score(query, lower)
+            if score:
+                return (score, MATCH_ALLCHARS)
+
+        # Nothing matched
+        return (0, None)
+
+
+class CompiledQuery(object):
+    """A search query prepared for scoring many search keys.
+
+    Everything about the query that doesn't depend on the item being
+    scored (splitting into words, lowercasing, the diacritic-folding
+    decision, character signatures) is done once when the
+    :class:`CompiledQuery` is created.
+
+    Pass it to :meth:`Workflow.filter() <workflow.workflow.Workflow.filter>`
+    instead of a string, or call :meth:`score` yourself::
+
+        cq = CompiledQuery('of', match_on=MATCH_ALL ^ MATCH_ALLCHARS)
+        score, rule = cq.score('OmniFocus')
+
+    Raises :class:`ValueError` if ``query`` is empty or only whitespace.
+
+    Attributes:
+        query (unicode): The original query.
+        match_on (int): ``MATCH_*`` rules applied.
+        words (list): :class:`QueryWord` for each space-separated word.
+    """
+
+    def __init__(self, query, match_on=MATCH_ALL, fold_diacritics=True):
+        """Create new :class:`CompiledQuery`.
+
+        Args:
+            query (unicode): Search query. Each space-separated word
+                must match.
+            match_on (int, optional): ``MATCH_*`` rules to apply.
+            fold_diacritics (bool, optional): Fold search keys to ASCII
+                for query words that are ASCII.
+        """
+        if not query:
+            raise ValueError('Empty `query`')
+
+        query = query.strip()
+
+        if not query:
+            raise ValueError('`query` contains only whitespace')
+
+        self.query = query
+        self.match_on = match_on
+        self.words = [QueryWord(s.strip(), match_on, fold_diacritics)
+                      for s in query.split(' ') if s.strip()]
+
+    def score(self, value):
+        """Score a single search key against all words of the query.
+
+        Args:
+            value (unicode): Search key (whitespace is stripped).
+
+        Returns:
+            tuple: ``(score, rule)``. ``score`` is the sum of the scores
+                of the words or 0 if any word doesn't match. ``rule`` is
+                the rule that matched the last word.
+        """
+        value = value.strip()
+        if not value:
+            return (0, None)
+
+        keys = {}
+        total = 0
+        rule = None
+        for word in self.words:
+            key = keys.get(word.fold)
+            if key is None:
+                text = fold_to_ascii(value) if word.fold else value
+                key = keys[word.fold] = (text, text.lower())
+
+            score, rule = word.score(*key)
+            if not score:  # Skip items that don't match part of the query
+                return (0, None)
+            total += score
+
+        return (total, rule)
+
+    def restrict(self, match_on):
+        """Return a copy of the query that only applies some rules.
+
+        Args:
+            match_on (int): ``MATCH_*`` rules to keep. Rules the query
+                doesn't already apply are ignored.
+
+        Returns:
+            CompiledQuery: New query.
+        """
+        match_on &= self.match_on
+        cq = copy.copy(self)
+        cq.match_on = match_on
+        cq.words = []
+        for word in self.words:
+            word = copy.copy(word)
+            word.match_on = match_on
+            cq.words.append(word)
+
+        return cq
+
+
+def _score_word(index, word, candidates, posted=None):
+    """Score ``candidates`` against a single query word.
+
+    Args:
+        index (KeyIndex): Keys to score.
+        word (QueryWord): Word to score keys against.
+        candidates (list): Indices of keys to score.
+        posted (set, optional): Keys that contain the word's trigrams
+            (see :meth:`Columns.candidates`). Only these are tested
+            against the rules other than ``MATCH_ALLCHARS``.
+
+    Returns:
+        dict: ``{index: (score, rule)}`` for all candidates that
+            pass the pre-filter. Score may be 0.
+    """
+    query = word.text
+    cols = index.columns(word.fold)
+    n = len(query)
+    results = {}
+
+    # pre-filter any items that do not contain all characters
+    # of ``query`` to save on running several more expensive tests
+    sig = word.signature
+    sigs = cols.signatures
+    candidates = [i for i in candidates if sigs[i] & sig == sig]
+
+    # confirm characters that share a signature bit
+    for c in word.unsigned:
+        candidates = _select(cols, 'lower', 'contains', c, candidates)[0]
+
+    # keys without the word's trigrams can only match `MATCH_ALLCHARS`
+    rest = []
+    if posted is not None:
+        rest = [i for i in candidates if i not in posted]
+        candidates = [i for i in candidates if i in posted]
+
+    for rule, name, test, length, base in RULES:
+        if not candidates:
+            break
+        if not word.match_on & rule:
+            continue
+
+        needle = word.atom if rule == MATCH_ATOM else query
+        hits, candidates = _select(cols, name, test, needle, candidates)
+        column = getattr(cols, length)
+        for i in hits:
+            results[i] = (base - (len(column[i]) // n), rule)
+
+    # finally, assign a score based on how close together the
+    # characters in `query` are in item.
+    candidates += rest
+    if word.match_on & MATCH_ALLCHARS and candidates:
+        lower = cols.lower
+        for i in candidates:
+            score = allchars_score(query, lower[i])
+            if score:
+                results[i] = (score, MATCH_ALLCHARS)
+
+    return results
+
+
+def postings(index, query):
+    """Return the rows of ``index`` that contain each word's trigrams.
+
+    Args:
+        index (KeyIndex): Keys to score.
+        query (CompiledQuery): Search query.
+
+    Returns:
+        list: Result of :meth:`Columns.candidates` for each word of
+            ``query``.
+    """
+    return [index.columns(word.fold).candidates(word) for word in query.words]
+
+
+def batch_score(index, query, rows=None, posted=None):
+    """Score all keys in ``index`` against ``query``.
+
+    Args:
+        index (KeyIndex): Keys to score.
+        query (CompiledQuery): Search query.
+        rows (list, optional): Only score the keys at these indices
+            (in ascending order). Keys must not be empty.
+        posted (list, optional): Result of :func:`postings`. Pass it
+            when scoring ``index`` in chunks, so the posting lists
+            aren't intersected again for each chunk.
+
+    Returns:
+        list: ``(index, score, rule)`` tuples for every key that matches
+            all words of ``query``, in index order. ``rule`` is the rule
+            that matched the last word.
+    """
+    if posted is None:
+        posted = postings(index, query)
+
+    candidates = rows
+    scores = {}
+    rules = {}
+
+    for word, posting in zip(query.words, posted):
+        if posting is not None and not word.match_on & MATCH_ALLCHARS:
+            # Keys without the word's trigrams can't match it
+            if candidates is None:
+                candidates = sorted(posting)
+            else:
+                candidates = [i for i in candidates if i in posting]
+            posting = None
+        elif candidates is None:
+            candidates = [i for i, v in enumerate(index.values) if v]
+
+        results = _score_word(index, word, candidates, posting)
+        # Items must match every word
+        candidates = [i for i in candidates if results.get(i, (0,))[0]]
+        for i in candidates:
+            score, rules[i] = results[i]
+            scores[i] = scores.get(i, 0) + score
+
+    return [(i, scores[i], rules.get(i)) for i in candidates]
+
+
+def progressive_score(index, query, cheap, deadline, rows=None):
+    """Score keys against ``cheap``, then the rest against ``query``.
+
+    The keys that don't match ``cheap`` are scored against ``query``
+    in chunks of :const:`~workflow.workflow.DEADLINE_INTERVAL` keys
+    until ``deadline``.
+
+    Args:
+        index (KeyIndex): Keys to score.
+        query (CompiledQuery): Search query.
+        cheap (CompiledQuery): ``query`` restricted to the first rules
+            (see :meth:`CompiledQuery.restrict`).
+        deadline (float): Time (as returned by :func:`time.time`) to stop
+            scoring keys against ``query``.
+        rows (list, optional): Only score the keys at these indices.
+            See :func:`batch_score`.
+
+    Returns:
+        tuple: ``(matches, complete)``. ``matches`` is a list like the one
+            returned by :func:`batch_score`, but not in index order.
+            ``complete`` is ``False`` if ``deadline`` passed before all
+            keys were scored.
+    """
+    matches = batch_score(index, cheap, rows)
+    matched = set([i for i, _, _ in matches])
+    if rows is None:
+        rows = [i for i, v in enumerate(index.values) if v]
+    pending = [i for i in rows if i not in matched]
+    posted = postings(index, query)
+
+    for start in range(0, len(pending), DEADLINE_INTERVAL):
+        if time.time() > deadline:
+            return matches, False
+        matches.extend(batch_score(index, query,
+                                   pending[start:start + DEADLINE_INTERVAL],
+                                   posted))
+
+    return matches, True
+
+
+def _top(index, matches, limit, min_score, ascending):
+    """Return the ``matches`` that may be among the first ``limit`` results.
+
+    Matches are ranked like :meth:`Workflow.filter()
+    <workflow.workflow.Workflow.filter>` does. As that compares the
+    items themselves if the keys are the same, all matches that tie
+    with the last one are also returned.
+    """
+    if min_score:
+        matches = [m for m in matches if m[1] > min_score]
+
+    if not limit or len(matches) <= limit:
+        return matches
+
+    values = index.values
+    keys = [(100.0 / score, values[i].lower(), score)
+            for i, score, _ in matches]
+    if ascending:
+        cutoff = heapq.nlargest(limit, keys)[-1]
+        return [m for m, key in zip(matches, keys) if key >= cutoff]
+
+    cutoff = heapq.nsmallest(limit, keys)[-1]
+    return [m for m, key in zip(matches, keys) if key <= cutoff]
+
+
+def _score_shard(bounds):
+    """Score the keys in ``range(*bounds)`` in a worker process."""
+    index, query, cheap, deadline, top = _job['args']
+    values = index.values
+    rows = [i for i in range(*bounds) if values[i]]
+
+    if cheap is not None:
+        matches, complete = progressive_score(index, query, cheap, deadline,
+                                              rows)
+    else:
+        matches, complete = batch_score(index, query, rows), True
+
+    if top is not None:
+        matches = _top(index, matches, *top)
+
+    return matches, complete
+
+
+def parallel_score(index, query, processes, cheap=None, deadline=None,
+                   top=None):
+    """Score keys in ``index`` in several processes.
+
+    The index is split into one shard per process. The worker
+    processes are forked after ``index`` is stored in a module
+    variable, so they share its columns with this process instead of
+    each receiving a pickled copy. Only the matches are sent back.
+    Requires a platform where :mod:`multiprocessing` forks (e.g. macOS
+    with Python 2).
+
+    Args:
+        index (KeyIndex): Keys to score.
+        query (CompiledQuery): Search query.
+        processes (int): Number of worker processes.
+        cheap (CompiledQuery, optional): Score keys progressively
+            (see :func:`progressive_score`).
+        deadline (float, optional): Required if ``cheap`` is set.
+        top (tuple, optional): ``(limit, min_score, ascending)``. Only
+            return each shard's matches that may be among the first
+            ``limit`` results with a score higher than ``min_score``
+            (when sorted like :meth:`Workflow.filter()
+            <workflow.workflow.Workflow.filter>` does).
+
+    Returns:
+        tuple: ``(matches, complete)`` like :func:`progressive_score`.
+    """
+    # Only imported if needed, as it's slow to import
+    import multiprocessing
+
+    n = len(index)
+    if not n:
+        return [], True
+
+    size = -(-n // processes)
+    shards = [(start, min(start + size, n)) for start in range(0, n, size)]
+
+    _job['args'] = (index, query, cheap, deadline, top)
+    pool = multiprocessing.Pool(len(shards))
+    try:
+        results = pool.map(_score_shard, shards)
+    finally:
+        pool.close()
+        pool.join()
+        _job.clear()
+
+    matches = []
+    complete = True
+    for shard, done in results:
+        matches.extend(shard)
+        complete = complete and done
+
+    return matches, complete
@@ -36,6 +36,9 @@ import web
 
 RELEASES_BASE = 'https://api.github.com/repos/{0}/releases'
 
+# Subdirectory of cache directory API responses are cached in
+HTTP_CACHE_DIR = 'http'
+
 
 _wf = None
 
@@ -194,10 +197,15 @@ class Version(object):
         return "Version('{0}')".format(str(self))
 
 
-def download_workflow(url):
+def download_workflow(url, sha256=None):
     """Download workflow at ``url`` to a local temporary file.
 
+    The file is streamed to disk, not held in memory.
+
     :param url: URL to .alfredworkflow file in GitHub repo
+    :param sha256: Expected SHA-256 hash (hex) of the file. If set and
+        the downloaded file doesn't match, :class:`ValueError` is raised.
+    :type sha256: ``str``
     :returns: path to downloaded file
 
     """
@@ -212,14 +220,26 @@ def download_workflow(url):
     wf().logger.debug(
         'Downloading updated workflow from `%s` to `%s` ...', url, local_path)
 
-    response = web.get(url)
-
-    with open(local_path, 'wb') as output:
-        output.write(response.content)
+    response = web.get(url, stream=True)
+    response.raise_for_status()
+    digest = response.save_to_path(local_path, sha256)
+    wf().logger.debug('SHA-256 of `%s` : %s', filename, digest)
 
     return local_path
 
 
+def http_cache():
+    """Return cache of GitHub API responses.
+
+    .. versionadded:: 1.24
+
+    :returns: :class:`~workflow.web.HTTPCache` in workflow's cache
+        directory
+
+    """
+    return web.HTTPCache(wf().cachefile(HTTP_CACHE_DIR))
+
+
 def build_api_url(slug):
     """Generate releases URL from GitHub slug.
 
@@ -308,14 +328,15 @@ def get_valid_releases(github_slug, prereleases=False):
 
     wf().logger.debug('Retrieving releases list from `%s` ...', api_url)
 
-    def retrieve_releases():
-        wf().logger.info(
-            'Retrieving releases for `%s` ...', github_slug)
-        return web.get(api_url).json()
+    # The API response is cached on disk. GitHub allows it to be used
+    # for 60 seconds, after which it is revalidated with its ETag. If
+    # there are no new releases, GitHub answers "304 Not Modified"
+    # without a body (and it doesn't count against the rate limit)
+    wf().logger.info('Retrieving releases for `%s` ...', github_slug)
+    response = web.get(api_url, cache=http_cache())
+    wf().logger.debug('Releases from cache : %s', response.from_cache)
 
-    slug = github_slug.replace('/', '-')
-    for release in wf().cached_data('gh-releases-{0}'.format(slug),
-                                    retrieve_releases):
+    for release in response.json():
 
         wf().logger.debug('Release : %r', release)
 
@@ -10,13 +10,21 @@
 """Lightweight HTTP library with a requests-like interface."""
 
 import codecs
+import cookielib
+from cStringIO import StringIO
+from email.utils import mktime_tz, parsedate_tz
+import hashlib
+import httplib
 import json
+import mimetools
 import mimetypes
 import os
 import random
 import re
 import socket
 import string
+import threading
+import time
 import unicodedata
 import urllib
 import urllib2
@@ -26,6 +34,16 @@ import zlib
 
 USER_AGENT = u'Alfred-Workflow/1.19 (+http://www.deanishe.net/alfred-workflow)'
 
+# Maximum number of threads :func:`get_many` and :func:`request_many`
+# fetch URLs with
+MAX_WORKERS = 8
+
+# Bytes read at a time when saving or caching responses
+CHUNK_SIZE = 65536
+
+# Maximum number of idle connections a :class:`Session` keeps per host
+MAX_POOL_CONNECTIONS = 4
+
 # Valid characters for multipart form data boundaries
 BOUNDARY_CHARS = string.digits + string.ascii_letters
 
@@ -101,6 +119,184 @@ class NoRedirectHandler(urllib2.HTTPRedirectHandler):
         return None
 
 
+class ConnectionPool(object):
+    """Idle HTTP(S) connections, per host.
+
+    .. versionadded:: 1.24
+
+    Thread-safe.
+
+    """
+
+    def __init__(self, max_connections=MAX_POOL_CONNECTIONS):
+        """Create new :class:`ConnectionPool`.
+
+        :param max_connections: Maximum number of idle connections to
+            keep per host. Others are closed.
+        :type max_connections: ``int``
+
+        """
+        self.max_connections = max_connections
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return an idle connection for ``key`` or ``None``.
+
+        :param key: ``(scheme, host)`` tuple
+        :returns: :class:`httplib.HTTPConnection` or ``None``
+
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        return None
+
+    def put(self, key, conn):
+        """Add idle connection ``conn`` to the pool.
+
+        :param key: ``(scheme, host)`` tuple
+        :param conn: connection whose last response has been read
+        :type conn: :class:`httplib.HTTPConnection`
+
+        """
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_connections:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class _PooledResponse(object):
+    """Wrapper of :class:`httplib.HTTPResponse` for a pooled connection.
+
+    Calls ``release`` when the response has been read to the end or
+    closed, with ``True`` if the connection can be re-used.
+
+    """
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._done(not self._response.will_close)
+        return data
+
+    # Called by :class:`socket._fileobject`
+    recv = read
+
+    def close(self):
+        # Unread data would be read as the next response
+        self._done(False)
+        self._response.close()
+
+    def _done(self, reusable):
+        release, self._release = self._release, None
+        if release is not None:
+            release(reusable)
+
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+    """Handler that re-uses connections from a :class:`ConnectionPool`.
+
+    .. versionadded:: 1.24
+
+    Used by :class:`Session`. A connection is returned to the pool
+    once its response has been read to the end.
+
+    """
+
+    def __init__(self, pool, debuglevel=0, context=None):
+        """Create new :class:`KeepAliveHandler`.
+
+        :param pool: pool to take connections from
+        :type pool: :class:`ConnectionPool`
+
+        """
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        self._context = context
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open_pooled(httplib.HTTPConnection, req)
+
+    def https_open(self, req):
+        return self._open_pooled(httplib.HTTPSConnection, req)
+
+    def _open_pooled(self, conn_class, req):
+        """Open ``req`` on a pooled connection. See :meth:`do_open`."""
+        if req._tunnel_host:  # proxied HTTPS: use a new connection
+            if conn_class is httplib.HTTPSConnection:
+                return self.do_open(conn_class, req, context=self._context)
+            return self.do_open(conn_class, req)
+
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        key = (conn_class.__name__, host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((k.title(), v) for k, v in headers.items())
+
+        conn = self.pool.get(key)
+        if conn is not None:
+            conn.timeout = req.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(req.timeout)
+            try:
+                r = self._send(conn, req, headers)
+            except (socket.error, httplib.HTTPException):
+                # Server closed the idle connection
+                conn.close()
+                conn = None
+
+        if conn is None:
+            if conn_class is httplib.HTTPSConnection:
+                conn = conn_class(host, timeout=req.timeout,
+                                  context=self._context)
+            else:
+                conn = conn_class(host, timeout=req.timeout)
+            try:
+                r = self._send(conn, req, headers)
+            except socket.error as err:
+                conn.close()
+                raise urllib2.URLError(err)
+
+        def release(reusable):
+            if reusable:
+                self.pool.put(key, conn)
+            else:
+                conn.close()
+
+        fp = socket._fileobject(_PooledResponse(r, release), close=True)
+        resp = urllib2.addinfourl(fp, r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+    def _send(self, conn, req, headers):
+        """Send ``req`` on ``conn`` and return response."""
+        conn.request(req.get_method(), req.get_selector(), req.data,
+                     headers)
+        return conn.getresponse(buffering=True)
+
+
 # Adapted from https://gist.github.com/babakness/3901174
 class CaseInsensitiveDictionary(dict):
     """Dictionary with caseless key search.
@@ -186,12 +382,23 @@ class Response(object):
 
     """
 
-    def __init__(self, request, stream=False):
+    def __init__(self, request, stream=False, opener=None, timeout=None,
+                 raw=None):
         """Call `request` with :mod:`urllib2` and process results.
 
         :param request: :class:`urllib2.Request` instance
         :param stream: Whether to stream response or retrieve it all at once
         :type stream: ``bool``
+        :param opener: Opener to open ``request`` with. If ``None``,
+            :func:`urllib2.urlopen` is used.
+        :type opener: :class:`urllib2.OpenerDirector`
+        :param timeout: Socket timeout in seconds. If ``None``, the
+            global default timeout is used.
+        :type timeout: ``float``
+        :param raw: Response to ``request`` that has already been
+            received (e.g. from :class:`HTTPCache`). If set, ``request``
+            isn't opened.
+        :type raw: :class:`urllib.addinfourl`
 
         """
         self.request = request
@@ -206,10 +413,21 @@ class Response(object):
         self._content = None
         self._content_loaded = False
         self._gzipped = False
+        self.from_cache = False
+
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+
+        if opener is not None:
+            open_url = opener.open
+        else:
+            open_url = urllib2.urlopen
 
         # Execute query
         try:
-            self.raw = urllib2.urlopen(request)
+            if raw is None:
+                raw = open_url(request, timeout=timeout)
+            self.raw = raw
         except urllib2.HTTPError as err:
             self.error = err
             try:
@@ -292,8 +510,7 @@ class Response(object):
 
             # Decompress gzipped content
             if self._gzipped:
-                decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
-                self._content = decoder.decompress(self.raw.read())
+                self._content = ''.join(self._iter_decoded(CHUNK_SIZE))
 
             else:
                 self._content = self.raw.read()
@@ -352,34 +569,71 @@ class Response(object):
             if data:  # pragma: no cover
                 yield data
 
-        def generate():
+        chunks = self._iter_decoded(chunk_size)
 
-            if self._gzipped:
-                decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decode_unicode and self.encoding:
+            chunks = decode_stream(chunks, self)
 
-            while True:
-                chunk = self.raw.read(chunk_size)
-                if not chunk:
-                    break
+        return chunks
 
-                if self._gzipped:
-                    chunk = decoder.decompress(chunk)
+    def _iter_decoded(self, chunk_size):
+        """Read and decompress response body.
 
-                yield chunk
+        Gzipped data are decompressed incrementally, and no chunk is
+        longer than ``chunk_size``, however well the data compress.
 
-        chunks = generate()
+        :param chunk_size: Number of bytes to read at a time
+        :type chunk_size: ``int``
+        :returns: iterator of :class:`str`
 
-        if decode_unicode and self.encoding:
-            chunks = decode_stream(chunks, self)
+        """
+        decoder = None
+        if self._gzipped:
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
 
-        return chunks
+        while True:
+            chunk = self.raw.read(chunk_size)
+            if not chunk:
+                break
 
-    def save_to_path(self, filepath):
+            if decoder is None:
+                yield chunk
+                continue
+
+            while chunk:
+                data = decoder.decompress(chunk, chunk_size)
+                if data:
+                    yield data
+                chunk = decoder.unconsumed_tail
+
+        # Data still buffered in the decoder
+        if decoder is not None:
+            data = decoder.flush()
+            if data:
+                yield data
+
+    def save_to_path(self, filepath, sha256=None, chunk_size=CHUNK_SIZE):
         """Save retrieved data to file at ``filepath``.
 
         .. versionadded: 1.9.6
 
+        The data are streamed to disk ``chunk_size`` bytes at a time,
+        so only one chunk is held in memory. The file is only created
+        (or replaced) once all data have been written.
+
+        .. versionchanged:: 1.24
+            Added ``sha256`` and ``chunk_size``. Returns SHA-256 hash.
+
         :param filepath: Path to save retrieved data.
+        :param sha256: Expected SHA-256 hash (hex) of the data. If the
+            saved data don't match, :class:`ValueError` is raised and
+            no file is saved.
+        :type sha256: ``str``
+        :param chunk_size: Number of bytes to read at a time
+        :type chunk_size: ``int``
+        :returns: SHA-256 hash (hex) of the data, calculated as they
+            are saved.
+        :rtype: ``str``
 
         """
         filepath = os.path.abspath(filepath)
@@ -389,9 +643,26 @@ class Response(object):
 
         self.stream = True
 
-        with open(filepath, 'wb') as fileobj:
-            for data in self.iter_content():
-                fileobj.write(data)
+        digest = hashlib.sha256()
+        temp = filepath + '.download'
+        try:
+            with open(temp, 'wb') as fileobj:
+                for data in self.iter_content(chunk_size):
+                    digest.update(data)
+                    fileobj.write(data)
+
+            digest = digest.hexdigest()
+            if sha256 is not None and digest != sha256.lower():
+                raise ValueError('SHA-256 of data from {0} is {1}, '
+                                 'expected {2}'.format(self.url, digest,
+                                                       sha256))
+
+            os.rename(temp, filepath)
+        finally:
+            if os.path.exists(temp):
+                os.unlink(temp)
+
+        return digest
 
     def raise_for_status(self):
         """Raise stored error if one occurred.
@@ -454,7 +725,7 @@ class Response(object):
 
 def request(method, url, params=None, data=None, headers=None, cookies=None,
             files=None, auth=None, timeout=60, allow_redirects=False,
-            stream=False):
+            stream=False, session=None, cache=None):
     """Initiate an HTTP(S) request. Returns :class:`Response` object.
 
     :param method: 'GET' or 'POST'
@@ -468,18 +739,26 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
     :type data: :class:`dict` or :class:`str`
     :param headers: HTTP headers
     :type headers: :class:`dict`
-    :param cookies: cookies to send to server
+    :param cookies: cookies to send to server. If set, the cookies of
+        ``session`` aren't sent.
     :type cookies: :class:`dict`
     :param files: files to upload (see below).
     :type files: :class:`dict`
     :param auth: username, password
     :type auth: ``tuple``
-    :param timeout: connection timeout limit in seconds
+    :param timeout: connection timeout limit in seconds. Only applies
+        to this request.
     :type timeout: ``int``
     :param allow_redirects: follow redirections
     :type allow_redirects: ``Boolean``
     :param stream: Stream content instead of fetching it all at once.
     :type stream: ``bool``
+    :param session: Session to re-use connections of and store
+        cookies in.
+    :type session: :class:`Session`
+    :param cache: Cache to answer GET requests from (see
+        :class:`HTTPCache`). Defaults to the cache of ``session``.
+    :type cache: :class:`HTTPCache`
     :returns: :class:`Response` object
 
 
@@ -496,12 +775,13 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
       will be used.
 
     """
-    # TODO: cookies
-    socket.setdefaulttimeout(timeout)
-
     # Default handlers
     openers = []
 
+    if session is not None:
+        openers.append(urllib2.HTTPCookieProcessor(session.cookies))
+        openers.append(KeepAliveHandler(session.pool))
+
     if not allow_redirects:
         openers.append(NoRedirectHandler())
 
@@ -512,18 +792,28 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
         auth_manager = urllib2.HTTPBasicAuthHandler(password_manager)
         openers.append(auth_manager)
 
-    # Install our custom chain of openers
+    # Custom chain of openers for this request only. Installing it
+    # (or setting the default socket timeout) would affect requests
+    # in other threads
     opener = urllib2.build_opener(*openers)
-    urllib2.install_opener(opener)
 
     if not headers:
         headers = CaseInsensitiveDictionary()
     else:
         headers = CaseInsensitiveDictionary(headers)
 
+    if session is not None:
+        for k, v in session.headers.items():
+            if k not in headers:
+                headers[k] = v
+
     if 'user-agent' not in headers:
         headers['user-agent'] = USER_AGENT
 
+    if cookies:
+        headers['cookie'] = '; '.join(['{0}={1}'.format(k, v)
+                                       for k, v in cookies.items()])
+
     # Accept gzip-encoded content
     encodings = [s.strip() for s in
                  headers.get('accept-encoding', '').split(',')]
@@ -563,12 +853,27 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
         query = urllib.urlencode(str_dict(params), doseq=True)
         url = urlparse.urlunsplit((scheme, netloc, path, query, fragment))
 
+    if cache is None and session is not None:
+        cache = session.cache
+
     req = urllib2.Request(url, data, headers)
-    return Response(req, stream)
+    if cache is not None and method == 'GET' and auth is None:
+        # Add the session's cookies now, so the cache can see them.
+        # (The credentials in ``auth`` are only sent after a ``401``,
+        # so those requests bypass the cache altogether.)
+        if session is not None:
+            session.cookies.add_cookie_header(req)
+        response = cache.fetch(req, stream, opener, timeout)
+    else:
+        response = Response(req, stream, opener, timeout)
+    if session is not None:
+        session.save_cookies()
+    return response
 
 
 def get(url, params=None, headers=None, cookies=None, auth=None,
-        timeout=60, allow_redirects=True, stream=False):
+        timeout=60, allow_redirects=True, stream=False, session=None,
+        cache=None):
     """Initiate a GET request. Arguments as for :func:`request`.
 
     :returns: :class:`Response` instance
@@ -576,18 +881,469 @@ def get(url, params=None, headers=None, cookies=None, auth=None,
     """
     return request('GET', url, params, headers=headers, cookies=cookies,
                    auth=auth, timeout=timeout, allow_redirects=allow_redirects,
-                   stream=stream)
+                   stream=stream, session=session, cache=cache)
 
 
 def post(url, params=None, data=None, headers=None, cookies=None, files=None,
-         auth=None, timeout=60, allow_redirects=False, stream=False):
+         auth=None, timeout=60, allow_redirects=False, stream=False,
+         session=None):
     """Initiate a POST request. Arguments as for :func:`request`.
 
     :returns: :class:`Response` instance
 
     """
     return request('POST', url, params, data, headers, cookies, files, auth,
-                   timeout, allow_redirects, stream)
+                   timeout, allow_redirects, stream, session)
+
+
+class Session(object):
+    """Re-use connections and keep cookies across requests.
+
+    .. versionadded:: 1.24
+
+    Requests made with a session's :meth:`request`, :meth:`get` and
+    :meth:`post` methods (or by passing ``session`` to the module
+    functions) use persistent HTTP/1.1 connections, which are kept in
+    a pool per host. Subsequent requests to the same host skip the TCP
+    (and TLS) handshake. A connection is only returned to the pool once
+    its response has been read, so read or close every response.
+
+    Cookies set by servers are stored in :attr:`cookies` and sent with
+    subsequent requests. If ``cookie_file`` is set, they are also
+    saved to that file and loaded from it, so they persist between
+    runs of your workflow.
+
+    A session can be used by several threads at once (e.g. with
+    :func:`get_many`)::
+
+        with web.Session() as session:
+            r = session.get('https://api.example.com/login')
+            rs = web.get_many(urls, session=session)
+
+    :ivar headers: headers to send with every request
+    :vartype headers: :class:`CaseInsensitiveDictionary`
+    :ivar cookies: session's cookies
+    :vartype cookies: :class:`cookielib.CookieJar`
+    :ivar pool: idle connections
+    :vartype pool: :class:`ConnectionPool`
+    :ivar cache: cache to answer GET requests from or ``None``
+    :vartype cache: :class:`HTTPCache`
+
+    """
+
+    def __init__(self, headers=None, cookie_file=None,
+                 max_connections=MAX_POOL_CONNECTIONS, cache=None):
+        """Create new :class:`Session`.
+
+        :param headers: headers to send with every request
+        :type headers: :class:`dict`
+        :param cookie_file: file to save cookies in
+        :type cookie_file: ``unicode``
+        :param max_connections: idle connections to keep per host
+        :type max_connections: ``int``
+        :param cache: cache to answer GET requests from
+        :type cache: :class:`HTTPCache`
+
+        """
+        self.headers = CaseInsensitiveDictionary(headers or {})
+        self.cookie_file = cookie_file
+        if cookie_file:
+            self.cookies = cookielib.LWPCookieJar(cookie_file)
+            if os.path.exists(cookie_file):
+                self.cookies.load(ignore_discard=True)
+        else:
+            self.cookies = cookielib.CookieJar()
+        self.pool = ConnectionPool(max_connections)
+        self.cache = cache
+
+    def request(self, method, url, **kwargs):
+        """Make a request in this session. Arguments as for :func:`request`.
+
+        :returns: :class:`Response` instance
+
+        """
+        return request(method, url, session=self, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Make a GET request in this session. Arguments as for :func:`get`.
+
+        :returns: :class:`Response` instance
+
+        """
+        return get(url, session=self, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Make a POST request in this session. Arguments as for :func:`post`.
+
+        :returns: :class:`Response` instance
+
+        """
+        return post(url, session=self, **kwargs)
+
+    def save_cookies(self):
+        """Save cookies to ``cookie_file`` (if set)."""
+        if self.cookie_file:
+            self.cookies.save(ignore_discard=True)
+
+    def close(self):
+        """Close idle connections and save cookies."""
+        self.pool.close()
+        self.save_cookies()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _cache_control(headers):
+    """Return directives in ``Cache-Control`` header of ``headers``.
+
+    :param headers: HTTP headers
+    :type headers: :class:`mimetools.Message`
+    :returns: ``{directive: value}``. ``value`` is an empty string
+        for directives without one.
+    :rtype: ``dict``
+
+    """
+    directives = {}
+    for part in (headers.getheader('cache-control') or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def _freshness_lifetime(headers):
+    """Return number of seconds response is fresh for after receipt.
+
+    Based on ``max-age`` in ``Cache-Control`` or ``Expires``, less
+    ``Age``. 0 if the response must be revalidated.
+
+    """
+    cc = _cache_control(headers)
+    if 'no-cache' in cc:
+        return 0
+
+    try:
+        age = int(headers.getheader('age') or 0)
+    except ValueError:
+        age = 0
+
+    if 'max-age' in cc:
+        try:
+            return max(int(cc['max-age']) - age, 0)
+        except ValueError:
+            return 0
+
+    expires = parsedate_tz(headers.getheader('expires') or '')
+    date = parsedate_tz(headers.getheader('date') or '')
+    if expires is None or date is None:
+        return 0
+    return max(mktime_tz(expires) - mktime_tz(date) - age, 0)
+
+
+def _cacheable(headers):
+    """Return ``True`` if response with ``headers`` may be cached.
+
+    Responses that can't be revalidated are only worth caching if
+    they're fresh for some time.
+
+    """
+    cc = _cache_control(headers)
+    if 'no-store' in cc or 'private' in cc:
+        return False
+    if (headers.getheader('vary') or '').strip() == '*':
+        return False
+    return bool(headers.getheader('etag') or
+                headers.getheader('last-modified') or
+                _freshness_lifetime(headers))
+
+
+def _private(req):
+    """Return ``True`` if ``req`` carries credentials.
+
+    Responses to requests with an ``Authorization`` or ``Cookie`` header
+    may be specific to the user, so they're neither cached nor answered
+    from the cache.
+
+    """
+    return req.has_header('Authorization') or req.has_header('Cookie')
+
+
+def _vary(headers, req):
+    """Return values of the request headers named in ``Vary``.
+
+    :returns: ``{header: value}`` of ``req``'s headers named in the
+        ``Vary`` header of response ``headers``
+    :rtype: ``dict``
+
+    """
+    names = [s.strip().capitalize()
+             for s in (headers.getheader('vary') or '').split(',')]
+    return dict([(name, req.get_header(name)) for name in names if name])
+
+
+class HTTPCache(object):
+    """Cache of HTTP responses on disk.
+
+    .. versionadded:: 1.24
+
+    Pass an :class:`HTTPCache` to :func:`get` (or :class:`Session`) to
+    keep responses to GET requests. A cached response is returned
+    without contacting the server while it is fresh according to its
+    ``Cache-Control: max-age`` or ``Expires`` header. After that, it is
+    revalidated with a conditional request (``If-None-Match`` and/or
+    ``If-Modified-Since``), and if the server answers ``304 Not
+    Modified``, the cached body is returned.
+
+    Responses with ``Cache-Control: no-store``, ``Cache-Control:
+    private`` or ``Vary: *`` are not cached, nor are responses without
+    validators (``ETag`` or ``Last-Modified``) that aren't fresh for
+    any time. Requests with an ``Authorization`` or ``Cookie`` header
+    (including cookies of a :class:`Session`) bypass the cache. A
+    cached response is only used for requests whose headers named in
+    its ``Vary`` header have the same values as the request it was
+    stored for. Send ``Cache-Control: no-cache`` to revalidate a fresh
+    response.
+
+    Responses returned from the cache (including after a ``304``) have
+    :attr:`Response.from_cache` set to ``True``. All bodies of
+    cacheable responses are read from disk, so they can be streamed
+    like any other response.
+
+    Each response is saved in its own file, so the cache is safe to use
+    from several processes or threads.
+
+    :ivar dirpath: directory responses are saved in
+    :vartype dirpath: ``unicode``
+
+    """
+
+    def __init__(self, dirpath):
+        """Create new :class:`HTTPCache`.
+
+        :param dirpath: directory to save responses in. Created if it
+            doesn't exist.
+        :type dirpath: ``unicode``
+
+        """
+        self.dirpath = dirpath
+
+    def fetch(self, req, stream=False, opener=None, timeout=None):
+        """Return :class:`Response` to ``req`` from cache or server.
+
+        Arguments as for :class:`Response`.
+
+        :returns: :class:`Response` instance
+
+        """
+        if _private(req):
+            return Response(req, stream, opener, timeout)
+
+        url = req.get_full_url()
+        path = self._path(url)
+        entry = self._load(path)
+
+        # Stored response is for a request with other values of the
+        # headers it varies on
+        if (entry is not None and
+                entry[0].get('vary', {}) != _vary(entry[1], req)):
+            entry = None
+
+        if entry is not None:
+            meta, headers = entry
+            # Client may ask for fresh responses to be revalidated
+            cc = req.get_header('Cache-control') or ''
+            revalidate = 'no-cache' in cc or 'max-age=0' in cc
+            age = time.time() - meta['stored']
+            if not revalidate and age < _freshness_lifetime(headers):
+                return self._response(req, path, meta, stream)
+
+            etag = headers.getheader('etag')
+            if etag:
+                req.add_header('If-none-match', etag)
+            modified = headers.getheader('last-modified')
+            if modified:
+                req.add_header('If-modified-since', modified)
+
+        response = Response(req, stream, opener, timeout)
+
+        if response.status_code == 304 and entry is not None:
+            # Update stored headers with those of 304 response
+            update = response.error.info()
+            response.error.read()
+            response.error.close()
+            for name in update.keys():
+                if name.lower() not in ('content-length', 'transfer-encoding'):
+                    headers[name] = update[name]
+            meta['stored'] = time.time()
+            meta['headers'] = ''.join(headers.headers).decode('latin-1')
+            self._save(path, meta, self._body(path))
+            return self._response(req, path, meta, stream)
+
+        if response.status_code != 200 or response.error:
+            return response
+
+        # Credentials may have been added by a handler of ``opener``
+        headers = response.raw.info()
+        if _private(req) or not _cacheable(headers):
+            return response
+
+        meta = {
+            'url': response.url,
+            'code': response.status_code,
+            'stored': time.time(),
+            'headers': ''.join(headers.headers).decode('latin-1'),
+            'vary': _vary(headers, req),
+        }
+        self._save(path, meta, response.raw)
+        response.raw.close()
+        return self._response(req, path, meta, stream, from_cache=False)
+
+    def clear(self):
+        """Delete all cached responses."""
+        if not os.path.exists(self.dirpath):
+            return
+        for name in os.listdir(self.dirpath):
+            if name.endswith('.http'):
+                os.unlink(os.path.join(self.dirpath, name))
+
+    def _path(self, url):
+        """Return path of cache file for ``url``."""
+        key = hashlib.sha1(url).hexdigest()
+        return os.path.join(self.dirpath, key + '.http')
+
+    def _load(self, path):
+        """Return ``(meta, headers)`` of cached response or ``None``."""
+        try:
+            with open(path, 'rb') as fp:
+                meta = json.loads(fp.readline())
+        except (IOError, OSError, ValueError):
+            return None
+        data = meta['headers'].encode('latin-1')
+        headers = mimetools.Message(StringIO(data))
+        return meta, headers
+
+    def _body(self, path):
+        """Return file object of cached body."""
+        fp = open(path, 'rb')
+        fp.readline()  # metadata
+        return fp
+
+    def _save(self, path, meta, body):
+        """Atomically save ``meta`` and contents of file ``body``."""
+        if not os.path.exists(self.dirpath):
+            os.makedirs(self.dirpath)
+
+        temp = '{0}.{1}.temp'.format(path, os.getpid())
+        try:
+            with open(temp, 'wb') as fp:
+                fp.write(json.dumps(meta) + b'\n')
+                while True:
+                    data = body.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    fp.write(data)
+            os.rename(temp, path)
+        finally:
+            body.close()
+            if os.path.exists(temp):
+                os.unlink(temp)
+
+    def _response(self, req, path, meta, stream, from_cache=True):
+        """Return :class:`Response` to ``req`` read from cache."""
+        data = meta['headers'].encode('latin-1')
+        headers = mimetools.Message(StringIO(data))
+        raw = urllib.addinfourl(self._body(path), headers, meta['url'],
+                                meta['code'])
+        response = Response(req, stream, raw=raw)
+        response.from_cache = from_cache
+        return response
+
+
+def request_many(requests, workers=MAX_WORKERS):
+    """Make several HTTP(S) requests concurrently.
+
+    .. versionadded:: 1.24
+
+    The requests are made by a pool of up to ``workers`` threads.
+    Each request's ``timeout`` only applies to that request.
+
+    :param requests: Arguments for :func:`request`. Each is a
+        :class:`dict` of keyword arguments, which must include
+        ``method`` and ``url``.
+    :type requests: ``list``
+    :param workers: Maximum number of requests to make at once.
+    :type workers: ``int``
+    :returns: :class:`Response` objects in the same order as ``requests``.
+        If a request raises an exception (e.g. the connection times out),
+        its item is the exception instead.
+    :rtype: ``list``
+
+    """
+    results = [None] * len(requests)
+    pending = list(reversed(list(enumerate(requests))))
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                i, kwargs = pending.pop()
+
+            try:
+                results[i] = request(**kwargs)
+            except Exception as err:
+                results[i] = err
+
+    threads = [threading.Thread(target=work)
+               for _ in range(min(workers, len(requests)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+
+    return results
+
+
+def get_many(urls, params=None, headers=None, cookies=None, auth=None,
+             timeout=60, allow_redirects=True, stream=False,
+             workers=MAX_WORKERS, session=None):
+    """Fetch several URLs concurrently. Other arguments as for :func:`get`.
+
+    .. versionadded:: 1.24
+
+    The URLs are fetched by up to ``workers`` threads with
+    :func:`request_many`. ``timeout`` applies to each request
+    separately.
+
+    :param urls: URLs to fetch
+    :type urls: ``list``
+    :param workers: Maximum number of URLs to fetch at once.
+    :type workers: ``int``
+    :returns: :class:`Response` objects in the same order as ``urls``
+    :rtype: ``list``
+    :raises: the exception raised by the first request that failed,
+        after all requests have finished. Use :func:`request_many`
+        to get the responses to the other requests, too.
+
+    """
+    requests = [dict(method='GET', url=url, params=params, headers=headers,
+                     cookies=cookies, auth=auth, timeout=timeout,
+                     allow_redirects=allow_redirects, stream=stream,
+                     session=session)
+                for url in urls]
+
+    results = request_many(requests, workers)
+    for r in results:
+        if isinstance(r, Exception):
+            raise r
+
+    return results
 
 
 def encode_multipart_formdata(fields, files):
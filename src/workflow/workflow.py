@@ -26,6 +26,8 @@ from contextlib import contextmanager
 import cPickle
 from copy import deepcopy
 import errno
+import heapq
+import inspect
 import json
 import logging
 import logging.handlers
@@ -408,6 +410,22 @@ DUMB_PUNCTUATION = {
 #: Characters that indicate the beginning of a "word" in CamelCase
 INITIALS = string.ascii_uppercase + string.digits
 
+#: Number of recently-folded strings remembered by :func:`fold_to_ascii`
+FOLD_MEMO_SIZE = 5000
+
+#: Number of items :meth:`Workflow.filter` scores between checks of
+#: its ``deadline``
+DEADLINE_INTERVAL = 500
+
+# Finds first non-ASCII character. Faster than trying to encode
+# to ASCII, which raises an exception
+_non_ascii = re.compile('[^\x00-\x7f]').search
+
+# UTF-16 surrogates. Characters outside the BMP are stored as surrogate
+# pairs on narrow builds of Python and can't be folded one
+# code unit at a time
+_surrogates = re.compile('[\ud800-\udfff]')
+
 #: Split on non-letters, numbers
 split_on_delimiters = re.compile('[^a-zA-Z0-9]').split
 
@@ -433,6 +451,22 @@ MATCH_ALLCHARS = 64
 MATCH_ALL = 127
 
 
+####################################################################
+# Used by `Workflow.logger`
+####################################################################
+
+#: Log level used if none is configured and Alfred's debugger is closed
+DEFAULT_LOG_LEVEL = logging.INFO
+
+#: Environment variable to override the log level with, e.g. ``DEBUG``
+LOG_LEVEL_ENVVAR = 'WORKFLOW_LOG_LEVEL'
+
+#: Number of log records buffered in memory before they're written
+#: to the log file. Records of level ``ERROR`` or higher are written
+#: immediately.
+LOG_BUFFER_SIZE = 500
+
+
 ####################################################################
 # Used by `Workflow.check_update`
 ####################################################################
@@ -441,10 +475,32 @@ MATCH_ALL = 127
 DEFAULT_UPDATE_FREQUENCY = 1
 
 
+####################################################################
+# Used by `workflow:profile*` magic arguments
+####################################################################
+
+#: Number of runs profiled after ``workflow:profileon`` if no number
+#: is given (e.g. ``workflow:profileon 20``)
+PROFILE_RUNS = 10
+
+#: Number of functions shown by ``workflow:profiledump``
+PROFILE_TOP = 40
+
+
 ####################################################################
 # Lockfile and Keychain access errors
 ####################################################################
 
+def _accepts_value(func):
+    """Return ``True`` if magic argument callback ``func`` takes a value."""
+    try:
+        spec = inspect.getargspec(func)
+    except TypeError:  # not a Python function
+        return False
+    args = spec.args[1:] if inspect.ismethod(func) else spec.args
+    return bool(args or spec.varargs)
+
+
 class AcquisitionError(Exception):
     """Raised if a lock cannot be acquired."""
 
@@ -488,11 +544,163 @@ def isascii(text):
     :rtype: ``Boolean``
 
     """
-    try:
-        text.encode('ascii')
-    except UnicodeEncodeError:
-        return False
-    return True
+    return not _non_ascii(text)
+
+
+class TranslationTable(dict):
+    """Lazily-populated table for :meth:`unicode.translate`.
+
+    The replacement for each character is calculated with ``func`` the
+    first time the character is looked up, and remembered.
+
+    :param func: function that returns the replacement for a single
+        character
+    :type func: ``callable``
+
+    """
+
+    def __init__(self, func):
+        """Create new :class:`TranslationTable`."""
+        super(TranslationTable, self).__init__()
+        self.func = func
+
+    def __missing__(self, key):
+        """Calculate and store replacement for ordinal ``key``."""
+        value = self[key] = self.func(unichr(key))
+        return value
+
+
+class LRUMemo(object):
+    """Remember the results of a function of one argument.
+
+    The most recent ``size`` to ``2 * size`` results are kept. Results
+    are kept in two generations of :class:`dict`: when the current
+    generation is full, it becomes the old generation and the previous
+    old generation is discarded. Results found in the old generation are
+    moved to the current one. This approximates least-recently-used
+    eviction without the overhead of :class:`~collections.OrderedDict`.
+
+    :param func: function to memoise
+    :type func: ``callable``
+    :param size: number of results per generation
+    :type size: ``int``
+
+    """
+
+    def __init__(self, func, size):
+        """Create new :class:`LRUMemo`."""
+        self.func = func
+        self.size = size
+        self.clear()
+
+    def __call__(self, key):
+        """Return ``func(key)``, calling ``func`` only if necessary."""
+        try:
+            return self.recent[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self.old.pop(key)
+        except KeyError:
+            value = self.func(key)
+
+        if len(self.recent) >= self.size:
+            self.old = self.recent
+            self.recent = {}
+
+        self.recent[key] = value
+        return value
+
+    def __len__(self):
+        """Number of remembered results."""
+        return len(self.recent) + len(self.old)
+
+    def clear(self):
+        """Forget all results."""
+        self.recent = {}
+        self.old = {}
+
+    def items(self):
+        """Return remembered ``(key, result)`` pairs, oldest first.
+
+        Pass them to :meth:`update` to restore the memo, e.g. after
+        loading them from the cache.
+
+        """
+        return self.old.items() + self.recent.items()
+
+    def update(self, items):
+        """Add ``(key, result)`` pairs to memo."""
+        for key, value in items:
+            if len(self.recent) >= self.size:
+                self.old = self.recent
+                self.recent = {}
+            self.recent[key] = value
+
+
+def _fold_char(char):
+    """Return ASCII equivalent of a single character or ``''``."""
+    char = ASCII_REPLACEMENTS.get(char, char)
+    return unicode(unicodedata.normalize('NFKD',
+                   char).encode('ascii', 'ignore'))
+
+
+#: :meth:`unicode.translate` table for :func:`fold_to_ascii`
+ASCII_TABLE = TranslationTable(_fold_char)
+
+#: :meth:`unicode.translate` table for :func:`dumbify_punctuation`
+DUMB_TABLE = TranslationTable(lambda c: DUMB_PUNCTUATION.get(c, c))
+
+
+def _fold(text):
+    """Fold ``text`` to ASCII without using the memo."""
+    if _surrogates.search(text):
+        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+        return unicode(unicodedata.normalize('NFKD',
+                       text).encode('ascii', 'ignore'))
+
+    # NFKD only decomposes, and canonical re-ordering never moves
+    # ASCII characters, so each character can be folded on its own
+    return text.translate(ASCII_TABLE)
+
+
+#: Memo of strings folded by :func:`fold_to_ascii`
+fold_memo = LRUMemo(_fold, FOLD_MEMO_SIZE)
+
+
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent.
+
+    Implements :meth:`Workflow.fold_to_ascii`. Characters are converted
+    with :const:`ASCII_TABLE`, and recent results are remembered in
+    :data:`fold_memo`.
+
+    :param text: text to convert
+    :type text: ``unicode``
+    :returns: text containing only ASCII characters
+    :rtype: ``unicode``
+
+    """
+    if isascii(text):
+        return text
+    return fold_memo(text)
+
+
+def dumbify_punctuation(text):
+    """Convert non-ASCII punctuation to closest ASCII equivalent.
+
+    Implements :meth:`Workflow.dumbify_punctuation`.
+
+    :param text: text to convert
+    :type text: ``unicode``
+    :returns: text with only ASCII punctuation
+    :rtype: ``unicode``
+
+    """
+    if isascii(text):
+        return text
+    return text.translate(DUMB_TABLE)
 
 
 ####################################################################
@@ -795,6 +1003,52 @@ class Item(object):
         return root
 
 
+class LazyLogHandler(logging.Handler):
+    """Log handler that creates the real handlers on first use.
+
+    .. versionadded:: 1.24
+
+    Opening the log file and creating the formatters is deferred until a
+    record actually passes the logger's level check, so Script Filter
+    runs that log nothing don't touch the log file at all.
+
+    :param factory: callable that returns a sequence of
+        :class:`~logging.Handler` instances to delegate records to.
+    :type factory: ``callable``
+
+    """
+
+    def __init__(self, factory):
+        """Create new :class:`LazyLogHandler` object."""
+        logging.Handler.__init__(self)
+        self._factory = factory
+        self._handlers = None
+
+    @property
+    def handlers(self):
+        """Handlers records are passed to. Created on first access."""
+        if self._handlers is None:
+            self._handlers = list(self._factory())
+        return self._handlers
+
+    def emit(self, record):
+        """Pass ``record`` to the real handlers."""
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush(self):
+        """Flush the real handlers (if they've been created)."""
+        for handler in self._handlers or []:
+            handler.flush()
+
+    def close(self):
+        """Close the real handlers (if they've been created)."""
+        for handler in self._handlers or []:
+            handler.close()
+        logging.Handler.close(self)
+
+
 class LockFile(object):
     """Context manager to create lock files."""
 
@@ -1092,14 +1346,18 @@ class Workflow(object):
         self._info = None
         self._info_loaded = False
         self._logger = None
+        self._metrics = None
+        # `(metrics on, runs to profile)`. See `_instrumentation()`
+        self._instrument = None
         self._items = []
         self._alfred_env = None
         # Version number of the workflow
         self._version = UNSET
         # Version from last workflow run
         self._last_version_run = UNSET
-        # Cache for regex patterns created for filter keys
-        self._search_pattern_cache = {}
+        #: ``False`` if the last call to :meth:`filter` ran out of time
+        #: before applying every rule (see its ``deadline`` argument)
+        self.filter_complete = True
         # Magic arguments
         #: The prefix for all magic arguments. Default is ``workflow:``
         self.magic_prefix = 'workflow:'
@@ -1109,7 +1367,10 @@ class Workflow(object):
         #: what the user should enter (prefixed with :attr:`magic_prefix`)
         #: and the value is a callable that will be called when the argument
         #: is entered. If you would like to display a message in Alfred, the
-        #: function should return a ``unicode`` string.
+        #: function should return a ``unicode`` string. If the callable
+        #: accepts an argument, the user may follow the magic argument with
+        #: a value (e.g. ``workflow:profileon 20``), which is passed to it
+        #: as a ``unicode`` string.
         #:
         #: By default, the magic arguments documented
         #: :ref:`here <magic-arguments>` are registered.
@@ -1160,6 +1421,8 @@ class Workflow(object):
                                       ``3`` = Never
         alfred_version                Alfred version number, e.g. ``'2.4'``
         alfred_version_build          Alfred build number, e.g. ``277``
+        alfred_debug                  Set to ``1`` if Alfred's debugger is
+                                      open (Alfred 3+)
         alfred_workflow_bundleid      Bundle ID, e.g.
                                       ``net.deanishe.alfred-mailto``
         alfred_workflow_cache         Path to workflow's cache directory
@@ -1170,8 +1433,8 @@ class Workflow(object):
                                       workflow configuration sheet/info.plist
         ============================  =========================================
 
-        **Note:** all values are Unicode strings except ``version_build`` and
-        ``theme_subtext``, which are integers.
+        **Note:** all values are Unicode strings except ``version_build``,
+        ``theme_subtext`` and ``debug``, which are integers.
 
         :returns: ``dict`` of Alfred's environmental variables without the
             ``alfred_`` prefix, e.g. ``preferences``, ``workflow_data``.
@@ -1190,6 +1453,7 @@ class Workflow(object):
                 'alfred_theme_subtext',
                 'alfred_version',
                 'alfred_version_build',
+                'alfred_debug',
                 'alfred_workflow_bundleid',
                 'alfred_workflow_cache',
                 'alfred_workflow_data',
@@ -1200,7 +1464,8 @@ class Workflow(object):
             value = os.getenv(key)
 
             if isinstance(value, str):
-                if key in ('alfred_version_build', 'alfred_theme_subtext'):
+                if key in ('alfred_version_build', 'alfred_theme_subtext',
+                           'alfred_debug'):
                     value = int(value)
                 else:
                     value = self.decode(value)
@@ -1325,8 +1590,18 @@ class Workflow(object):
         if len(args) and self._capture_args:
             for name in self.magic_arguments:
                 key = '{0}{1}'.format(self.magic_prefix, name)
+                func = self.magic_arguments[name]
                 if key in args:
-                    msg = self.magic_arguments[name]()
+                    msg = func()
+                    continue
+
+                # Value passed in the same argument, e.g. as Alfred
+                # passes ``workflow:profileon 20``
+                for arg in args:
+                    if (arg.startswith(key + ' ') and
+                            _accepts_value(func)):
+                        msg = func(arg[len(key):].strip())
+                        break
 
             if msg:
                 self.logger.debug(msg)
@@ -1488,12 +1763,62 @@ class Workflow(object):
         """
         return self.cachefile('%s.log' % self.bundleid)
 
+    @property
+    def debugging(self):
+        """Whether Alfred's debugger is open.
+
+        .. versionadded:: 1.24
+
+        :returns: ``True`` if Alfred's debugger is open
+        :rtype: ``Boolean``
+
+        """
+        return self.alfred_env.get('debug') == 1
+
+    @property
+    def log_level(self):
+        """Level of :attr:`logger`.
+
+        .. versionadded:: 1.24
+
+        The level is taken from the ``WORKFLOW_LOG_LEVEL`` environment
+        variable, the ``__workflow_log_level`` setting or, if neither
+        is set, is ``DEBUG`` when Alfred's debugger is open and ``INFO``
+        otherwise.
+
+        :returns: a :mod:`logging` level, e.g. ``logging.INFO``
+        :rtype: ``int``
+
+        """
+        level = os.getenv(LOG_LEVEL_ENVVAR)
+        if not level:
+            try:
+                level = self.settings.get('__workflow_log_level')
+            except (IOError, OSError, ValueError):  # invalid settings file
+                level = None
+
+        if level:
+            if not isinstance(level, int):
+                level = logging.getLevelName(level.upper())
+            if isinstance(level, int):
+                return level
+
+        if self.debugging:
+            return logging.DEBUG
+
+        return DEFAULT_LOG_LEVEL
+
     @property
     def logger(self):
         """Logger that logs to both console and a log file.
 
         Use :meth:`open_log` to open the log file in Console.
 
+        The handlers are only created when the first record is logged,
+        and records written to the log file are buffered in memory and
+        written when the workflow exits (or an error is logged). See
+        :attr:`log_level` for how to set the level.
+
         :returns: an initialised :class:`~logging.Logger`
 
         """
@@ -1504,25 +1829,11 @@ class Workflow(object):
         logger = logging.getLogger('workflow')
 
         if not len(logger.handlers):  # Only add one set of handlers
+            logger.addHandler(LazyLogHandler(self._log_handlers))
 
-            fmt = logging.Formatter(
-                '%(asctime)s %(filename)s:%(lineno)s'
-                ' %(levelname)-8s %(message)s',
-                datefmt='%H:%M:%S')
-
-            logfile = logging.handlers.RotatingFileHandler(
-                self.logfile,
-                maxBytes=1024 * 1024,
-                backupCount=1)
-            logfile.setFormatter(fmt)
-            logger.addHandler(logfile)
-
-            console = logging.StreamHandler()
-            console.setFormatter(fmt)
-            logger.addHandler(console)
-
-        logger.setLevel(logging.DEBUG)
+        # Set before reading the level, as `settings` also logs
         self._logger = logger
+        logger.setLevel(self.log_level)
 
         return self._logger
 
@@ -1536,6 +1847,96 @@ class Workflow(object):
         """
         self._logger = logger
 
+    def _log_handlers(self):
+        """Create handlers for :attr:`logger`.
+
+        Called by :class:`LazyLogHandler` when the first record is logged.
+
+        :returns: file and console handlers
+        :rtype: ``list``
+
+        """
+        fmt = logging.Formatter(
+            '%(asctime)s %(filename)s:%(lineno)s'
+            ' %(levelname)-8s %(message)s',
+            datefmt='%H:%M:%S')
+
+        logfile = logging.handlers.RotatingFileHandler(
+            self.logfile,
+            maxBytes=1024 * 1024,
+            backupCount=1,
+            delay=True)
+        logfile.setFormatter(fmt)
+
+        # Buffer file writes. `logging` flushes the buffer at exit.
+        buffered = logging.handlers.MemoryHandler(LOG_BUFFER_SIZE,
+                                                  logging.ERROR,
+                                                  logfile)
+
+        console = logging.StreamHandler()
+        console.setFormatter(fmt)
+
+        return [buffered, console]
+
+    @property
+    def metrics(self):
+        """Timings and counts of the stages of this run.
+
+        .. versionadded:: 1.24
+
+        Metrics are recorded if the ``WORKFLOW_METRICS`` environment
+        variable is ``1`` or they've been turned on with the
+        ``workflow:metricson`` :ref:`magic argument <magic-arguments>`.
+        The record is saved to ``metrics.jsonl`` in :attr:`cachedir`
+        when :meth:`run` finishes. If metrics are off, this is a shared
+        :class:`~workflow.metrics.Metrics` that does nothing.
+
+        :returns: :class:`~workflow.metrics.Metrics` instance
+
+        """
+        if not self._metrics:
+            from metrics import get_metrics, null_metrics
+
+            if self._instrumentation()[0]:
+                self._metrics = get_metrics(self.cachefile('metrics.jsonl'),
+                                            True)
+            else:
+                self._metrics = null_metrics
+
+        return self._metrics
+
+    def _instrumentation(self):
+        """Return whether metrics are on and how many runs to profile.
+
+        Checked once per run. The settings are only read if they've
+        been loaded already or saved before, so a workflow that doesn't
+        use settings doesn't read (or create) anything to find out that
+        metrics and profiling are off.
+
+        :returns: ``(metrics on, runs to profile)``
+        :rtype: ``tuple``
+
+        """
+        if self._instrument is None:
+            from metrics import METRICS_ENVVAR
+
+            enabled = os.getenv(METRICS_ENVVAR) == '1'
+            runs = 0
+            path = self._settings_path or os.path.join(
+                self.alfred_env.get('workflow_data') or self._default_datadir,
+                'settings.json')
+            if self._settings or os.path.exists(path):
+                try:
+                    enabled = (enabled or
+                               self.settings.get('__workflow_metrics', False))
+                    runs = self.settings.get('__workflow_profile_runs', 0)
+                except (IOError, OSError, ValueError):  # invalid settings
+                    pass
+
+            self._instrument = (enabled, runs)
+
+        return self._instrument
+
     @property
     def settings_path(self):
         """Path to settings file within workflow's data directory.
@@ -1795,10 +2196,13 @@ class Workflow(object):
 
         if (age < max_age or max_age == 0) and os.path.exists(cache_path):
 
-            with open(cache_path, 'rb') as file_obj:
-                self.logger.debug('Loading cached data from : %s',
-                                  cache_path)
-                return serializer.load(file_obj)
+            with self.metrics.span('cache_load'):
+                with open(cache_path, 'rb') as file_obj:
+                    self.logger.debug('Loading cached data from : %s',
+                                      cache_path)
+                    data = serializer.load(file_obj)
+                    self.metrics.count('cache_bytes', file_obj.tell())
+                    return data
 
         if not data_func:
             return None
@@ -1869,7 +2273,8 @@ class Workflow(object):
 
     def filter(self, query, items, key=lambda x: x, ascending=False,
                include_score=False, min_score=0, max_results=0,
-               match_on=MATCH_ALL, fold_diacritics=True):
+               match_on=MATCH_ALL, fold_diacritics=True, index=None,
+               deadline=None, processes=0, boost=None, valid=None):
         """Fuzzy search filter. Returns list of ``items`` that match ``query``.
 
         ``query`` is case-insensitive. Any item that does not contain the
@@ -1881,7 +2286,7 @@ class Workflow(object):
             a :class:`ValueError` will be raised.
 
         :param query: query to test items against
-        :type query: ``unicode``
+        :type query: ``unicode`` or :class:`~workflow.search.CompiledQuery`
         :param items: iterable of items to test
         :type items: ``list`` or ``tuple``
         :param key: function to get comparison key from ``items``.
@@ -1905,6 +2310,24 @@ class Workflow(object):
         :param fold_diacritics: Convert search keys to ASCII-only
             characters if ``query`` only contains ASCII characters.
         :type fold_diacritics: ``Boolean``
+        :param index: Pre-processed search keys of ``items``. If set,
+            ``key`` is ignored and ``items`` are scored with the batch
+            engine (see below).
+        :type index: :class:`~workflow.search.KeyIndex`
+        :param deadline: Time (as returned by :func:`time.time`) after
+            which to stop applying the slower rules (see below).
+        :type deadline: ``float``
+        :param processes: If greater than 1, score large lists in this
+            many processes (requires ``index``, see below).
+        :type processes: ``int``
+        :param boost: Function to get an amount to add to an item's
+            score when ranking it, e.g. based on how often it's used
+            (see below).
+        :type boost: ``callable``
+        :param valid: Function that returns ``False`` for matching items
+            that mustn't be returned, e.g. files that have been deleted
+            (see below).
+        :type valid: ``callable``
         :returns: list of ``items`` matching ``query`` or list of
             ``(item, score, rule)`` `tuples` if ``include_score`` is ``True``.
             ``rule`` is the ``MATCH_*`` rule that matched the item.
@@ -1933,12 +2356,14 @@ class Workflow(object):
             of item search key (case-insensitive).
         8. :const:`MATCH_ALLCHARS` : Matches if all characters in
             ``query`` appear in item search key in the same order
-            (case-insensitive).
+            (case-insensitive). The score is higher the nearer the
+            start of the key the characters are (see
+            :func:`~workflow.search.allchars_score`).
         9. :const:`MATCH_ALL` : Combination of all the above.
 
 
-        :const:`MATCH_ALLCHARS` is considerably slower than the other
-        tests and provides much less accurate results.
+        :const:`MATCH_ALLCHARS` is slower than the other tests and
+        provides much less accurate results.
 
         **Examples:**
 
@@ -1965,171 +2390,290 @@ class Workflow(object):
         If ``query`` contains non-ASCII characters, search keys will not be
         altered.
 
-        """
-        if not query:
-            raise ValueError('Empty `query`')
+        **Batch scoring**
 
-        # Remove preceding/trailing spaces
-        query = query.strip()
+        .. versionadded:: 1.24
 
-        if not query:
-            raise ValueError('`query` contains only whitespace')
+        Filtering a long list is considerably faster if you pass an
+        ``index`` built from the items' search keys::
 
-        # Use user override if there is one
-        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
-                                            fold_diacritics)
+            from workflow.search import KeyIndex
+            index = KeyIndex([key(item) for item in items])
+            results = wf.filter(query, items, key, index=index)
 
-        results = []
+        The results are identical. Keep the index (e.g. in the cache)
+        alongside ``items`` to avoid re-building it. See
+        :mod:`workflow.search` for details.
 
-        for item in items:
-            skip = False
-            score = 0
-            words = [s.strip() for s in query.split(' ')]
-            value = key(item).strip()
-            if value == '':
-                continue
-            for word in words:
-                if word == '':
-                    continue
-                s, rule = self._filter_item(value, word, match_on,
-                                            fold_diacritics)
+        **Compiled queries**
 
-                if not s:  # Skip items that don't match part of the query
-                    skip = True
-                score += s
+        .. versionadded:: 1.24
 
-            if skip:
-                continue
+        ``query`` is parsed into a :class:`~workflow.search.CompiledQuery`
+        once per call. If you filter several lists with the same query,
+        compile it yourself and pass that instead::
 
-            if score:
-                # use "reversed" `score` (i.e. highest becomes lowest) and
-                # `value` as sort key. This means items with the same score
-                # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), score),
-                                (item, score, rule)))
+            from workflow.search import CompiledQuery
+            cq = CompiledQuery(query, match_on=MATCH_ALL ^ MATCH_ALLCHARS)
+            apps = wf.filter(cq, apps, key)
+            files = wf.filter(cq, files, key)
 
-        # sort on keys, then discard the keys
-        results.sort(reverse=ascending)
-        results = [t[1] for t in results]
+        ``match_on`` and ``fold_diacritics`` are ignored when ``query`` is
+        a :class:`~workflow.search.CompiledQuery` (the user's diacritic
+        folding setting is not applied either).
 
-        if min_score:
-            results = [r for r in results if r[1] > min_score]
+        **Deadline**
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        .. versionadded:: 1.24
 
-        # return list of ``(item, score, rule)``
-        if include_score:
-            return results
-        # just return list of items
-        return [t[0] for t in results]
+        If you pass a ``deadline``, :meth:`filter` first applies the cheap
+        rules (:const:`MATCH_STARTSWITH`, :const:`MATCH_CAPITALS` and
+        :const:`MATCH_ATOM`) to all items, then the remaining rules to the
+        items that didn't match. If ``deadline`` passes during the second
+        pass, the matches found so far are returned and
+        :attr:`filter_complete` is set to ``False``. Items that are
+        returned always have the same score as without a deadline, but
+        some matching items may be missing.
 
-    def _filter_item(self, value, query, match_on, fold_diacritics):
-        """Filter ``value`` against ``query`` using rules ``match_on``.
+        The cheap pass is always completed, however long it takes. To show
+        the full results, set :attr:`Workflow3.rerun
+        <workflow.workflow3.Workflow3.rerun>` and filter again without
+        a deadline when your Script Filter is re-run::
 
-        :returns: ``(score, rule)``
+            results = wf.filter(query, items, key,
+                                deadline=time.time() + 0.2)
+            if not wf.filter_complete:
+                wf.rerun = 0.1
+                wf.setvar('filter_query', query)
+
+        **Parallel scoring**
+
+        .. versionadded:: 1.24
+
+        If you pass an ``index`` with at least
+        :const:`~workflow.search.PARALLEL_MIN_KEYS` keys and ``processes``
+        greater than 1, the index is split into that many shards, which
+        are scored by :func:`~workflow.search.parallel_score` in separate
+        processes. If ``max_results`` is set, each process only returns
+        its best matches. The results are identical to scoring in one
+        process.
+
+        Starting the processes takes time, so this is only faster for
+        very long lists.
+
+        **Boosting**
+
+        .. versionadded:: 1.24
+
+        ``boost`` is called with each matching item that scores higher
+        than ``min_score``, and the number it returns is added to the
+        item's score before the results are ranked. Return ``0`` to
+        leave an item's rank alone. The scores returned with
+        ``include_score`` are boosted, too, so you can merge the results
+        of several calls by score.
+
+        Boosts are calculated while ``min_score`` is applied, so
+        boosting doesn't add another pass over the results, and the
+        best ``max_results`` are still selected without sorting all
+        of them.
+
+        **Validating results**
+
+        .. versionadded:: 1.24
+
+        ``valid`` is called with matching items in order of rank until
+        ``max_results`` valid items have been found, so only the items
+        that would be returned (and the invalid ones among them) are
+        checked. Use it instead of removing invalid items from the
+        results, which would leave fewer than ``max_results``.
 
         """
-        query = query.lower()
+        from search import CHEAP_RULES, CompiledQuery
+
+        if not isinstance(query, CompiledQuery):
+            # Use user override if there is one
+            fold_diacritics = self.settings.get(
+                '__workflow_diacritic_folding', fold_diacritics)
+            query = CompiledQuery(query, match_on, fold_diacritics)
+
+        # Rules to apply in a first pass if there's a deadline
+        cheap = None
+        if deadline is not None and query.match_on & ~CHEAP_RULES:
+            cheap = query.restrict(CHEAP_RULES)
+
+        self.filter_complete = True
+        with self.metrics.span('filter'):
+            if index is not None:
+                # Boosts may promote results that aren't in a shard's
+                # top, and invalid results mustn't take up its places
+                top = None
+                if boost is None and valid is None:
+                    top = (max_results, min_score, ascending)
+                results = self._filter_batch(query, items, index, cheap,
+                                             deadline, processes, top)
+            else:
+                results = self._filter(query, items, key, cheap, deadline)
 
-        if not isascii(query):
-            fold_diacritics = False
+            if not self.filter_complete:
+                self.metrics.count('filter_deadline_missed')
 
-        if fold_diacritics:
-            value = self.fold_to_ascii(value)
+            return self._rank_results(results, ascending, include_score,
+                                      min_score, max_results, boost, valid)
 
-        # pre-filter any items that do not contain all characters
-        # of ``query`` to save on running several more expensive tests
-        if not set(query) <= set(value.lower()):
+    def _filter(self, query, items, key, cheap=None, deadline=None):
+        """Score ``items`` one at a time.
 
-            return (0, None)
+        If ``cheap`` is set, items are scored against it first, and
+        items that don't match are then scored against ``query`` until
+        ``deadline``.
+
+        :returns: ``list`` of unsorted results for :meth:`_rank_results`.
+
+        """
+        results = []
+        pending = []
+        n = 0
 
-        # item starts with query
-        if match_on & MATCH_STARTSWITH and value.lower().startswith(query):
-            score = 100.0 - (len(value) / len(query))
+        for item in items:
+            n += 1
+            value = key(item).strip()
+            score, rule = (cheap or query).score(value)
+
+            if score:
+                # use "reversed" `score` (i.e. highest becomes lowest) and
+                # `value` as sort key. This means items with the same score
+                # will be sorted in alphabetical not reverse alphabetical order
+                results.append(((100.0 / score, value.lower(), score),
+                                (item, score, rule)))
+            elif cheap is not None:
+                pending.append((item, value))
+
+        for i, (item, value) in enumerate(pending):
+            if not i % DEADLINE_INTERVAL and time.time() > deadline:
+                self.filter_complete = False
+                break
+
+            score, rule = query.score(value)
+            if score:
+                results.append(((100.0 / score, value.lower(), score),
+                                (item, score, rule)))
 
-            return (score, MATCH_STARTSWITH)
+        self.metrics.count('filter_items', n)
 
-        # query matches capitalised letters in item,
-        # e.g. of = OmniFocus
-        if match_on & MATCH_CAPITALS:
-            initials = ''.join([c for c in value if c in INITIALS])
-            if initials.lower().startswith(query):
-                score = 100.0 - (len(initials) / len(query))
+        return results
 
-                return (score, MATCH_CAPITALS)
+    def _filter_batch(self, query, items, index, cheap=None, deadline=None,
+                      processes=0, top=None):
+        """Score ``items`` with :func:`~workflow.search.batch_score`.
 
-        # split the item into "atoms", i.e. words separated by
-        # spaces or other non-word characters
-        if (match_on & MATCH_ATOM or
-                match_on & MATCH_INITIALS_CONTAIN or
-                match_on & MATCH_INITIALS_STARTSWITH):
-            atoms = [s.lower() for s in split_on_delimiters(value)]
-            # print('atoms : %s  -->  %s' % (value, atoms))
-            # initials of the atoms
-            initials = ''.join([s[0] for s in atoms if s])
+        If ``cheap`` is set, all items are scored against it first, and
+        items that don't match are then scored against ``query`` in
+        chunks until ``deadline``. Long lists are scored with
+        :func:`~workflow.search.parallel_score` if ``processes`` is
+        greater than 1.
 
-        if match_on & MATCH_ATOM:
-            # is `query` one of the atoms in item?
-            # similar to substring, but scores more highly, as it's
-            # a word within the item
-            if query in atoms:
-                score = 100.0 - (len(value) / len(query))
+        :returns: ``list`` of unsorted results for :meth:`_rank_results`.
 
-                return (score, MATCH_ATOM)
+        """
+        import search
+
+        if not isinstance(items, (list, tuple)):
+            items = list(items)
+
+        if len(items) != len(index):
+            raise ValueError('`index` has {0} keys, but there are {1} '
+                             'items'.format(len(index), len(items)))
+
+        complete = True
+        if processes > 1 and len(index) >= search.PARALLEL_MIN_KEYS:
+            self.metrics.count('filter_parallel')
+            matches, complete = search.parallel_score(
+                index, query, processes, cheap, deadline, top)
+        elif cheap is not None:
+            matches, complete = search.progressive_score(index, query,
+                                                         cheap, deadline)
+        else:
+            matches = search.batch_score(index, query)
 
-        # `query` matches start (or all) of the initials of the
-        # atoms, e.g. ``himym`` matches "How I Met Your Mother"
-        # *and* "how i met your mother" (the ``capitals`` rule only
-        # matches the former)
-        if (match_on & MATCH_INITIALS_STARTSWITH and
-                initials.startswith(query)):
-            score = 100.0 - (len(initials) / len(query))
+        if not complete:
+            self.filter_complete = False
 
-            return (score, MATCH_INITIALS_STARTSWITH)
+        results = []
+        for i, score, rule in matches:
+            if score:
+                value = index.values[i]
+                results.append(((100.0 / score, value.lower(), score),
+                                (items[i], score, rule)))
 
-        # `query` is a substring of initials, e.g. ``doh`` matches
-        # "The Dukes of Hazzard"
-        elif (match_on & MATCH_INITIALS_CONTAIN and
-                query in initials):
-            score = 95.0 - (len(initials) / len(query))
+        self.metrics.count('filter_items', len(items))
 
-            return (score, MATCH_INITIALS_CONTAIN)
+        return results
 
-        # `query` is a substring of item
-        if match_on & MATCH_SUBSTRING and query in value.lower():
-            score = 90.0 - (len(value) / len(query))
+    def _rank_results(self, results, ascending, include_score, min_score,
+                      max_results, boost=None, valid=None):
+        """Sort and prune results of :meth:`_filter`.
 
-            return (score, MATCH_SUBSTRING)
+        :returns: final results of :meth:`filter`
 
-        # finally, assign a score based on how close together the
-        # characters in `query` are in item.
-        if match_on & MATCH_ALLCHARS:
-            search = self._search_for_query(query)
-            match = search(value)
-            if match:
-                score = 100.0 / ((1 + match.start()) *
-                                 (match.end() - match.start() + 1))
+        """
+        if boost is not None:
+            ranked = []
+            for t in results:
+                item, score, rule = t[1]
+                if min_score and score <= min_score:
+                    continue
+                extra = boost(item)
+                if extra:
+                    score += extra
+                    t = ((100.0 / score, t[0][1], score), (item, score, rule))
+                ranked.append(t)
+            results = ranked
+        elif min_score:
+            results = [t for t in results if t[1][1] > min_score]
+
+        # sort on keys, then discard the keys. Only the best
+        # ``max_results`` need sorting
+        if valid is not None:
+            results = self._valid_results(results, ascending, max_results,
+                                          valid)
+        elif max_results and len(results) > max_results:
+            if ascending:
+                results = heapq.nlargest(max_results, results)
+            else:
+                results = heapq.nsmallest(max_results, results)
+        else:
+            results.sort(reverse=ascending)
+        results = [t[1] for t in results]
 
-                return (score, MATCH_ALLCHARS)
+        # return list of ``(item, score, rule)``
+        if include_score:
+            return results
+        # just return list of items
+        return [t[0] for t in results]
 
-        # Nothing matched
-        return (0, None)
+    def _valid_results(self, results, ascending, max_results, valid):
+        """Return best ``max_results`` of ``results`` that are ``valid``.
 
-    def _search_for_query(self, query):
-        if query in self._search_pattern_cache:
-            return self._search_pattern_cache[query]
+        Items are checked in order of rank, and only until enough valid
+        ones have been found.
 
-        # Build pattern: include all characters
-        pattern = []
-        for c in query:
-            # pattern.append('[^{0}]*{0}'.format(re.escape(c)))
-            pattern.append('.*?{0}'.format(re.escape(c)))
-        pattern = ''.join(pattern)
-        search = re.compile(pattern, re.IGNORECASE).search
+        :returns: sorted ``results`` whose items are valid
 
-        self._search_pattern_cache[query] = search
-        return search
+        """
+        if ascending:
+            results.sort(reverse=True)
+            ranked = iter(results)
+        else:
+            heapq.heapify(results)
+            ranked = (heapq.heappop(results) for _ in range(len(results)))
+
+        checked = []
+        for t in ranked:
+            if valid(t[1][0]):
+                checked.append(t)
+                if len(checked) == max_results:
+                    break
+        return checked
 
     def run(self, func, text_errors=False):
         """Call ``func`` to run your workflow.
@@ -2170,7 +2714,10 @@ class Workflow(object):
                 self.check_update()
 
             # Run workflow's entry function/method
-            func(self)
+            if self._instrumentation()[1]:
+                self._run_profiled(func)
+            else:
+                func(self)
 
             # Set last version run to current version after a successful
             # run
@@ -2200,11 +2747,39 @@ class Workflow(object):
             return 1
 
         finally:
+            self.metrics.add_time('run', time.time() - start)
+            self.metrics.save()
             self.logger.debug('Workflow finished in {0:0.3f} seconds.'.format(
                 time.time() - start))
 
         return 0
 
+    def _run_profiled(self, func):
+        """Call ``func`` under :mod:`cProfile` and save the stats.
+
+        Stats are saved in the ``profiles`` subdirectory of
+        :attr:`cachedir`. Called by :meth:`run` while there are profiled
+        runs remaining (see ``workflow:profileon``).
+
+        """
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(func, self)
+        finally:
+            path = os.path.join(
+                self._create(self.cachefile('profiles')),
+                '{0:0.0f}.{1}.prof'.format(time.time() * 1000, os.getpid()))
+            profiler.dump_stats(path)
+            self.logger.debug('Profile saved to : %s', path)
+
+            remaining = self.settings.get('__workflow_profile_runs', 0) - 1
+            if remaining > 0:
+                self.settings['__workflow_profile_runs'] = remaining
+            elif '__workflow_profile_runs' in self.settings:
+                del self.settings['__workflow_profile_runs']
+
     # Alfred feedback methods ------------------------------------------
 
     def add_item(self, title, subtitle='', modifier_subtitles=None, arg=None,
@@ -2280,12 +2855,17 @@ class Workflow(object):
 
     def send_feedback(self):
         """Print stored items to console/Alfred as XML."""
-        root = ET.Element('items')
-        for item in self._items:
-            root.append(item.elem)
-        sys.stdout.write('<?xml version="1.0" encoding="utf-8"?>\n')
-        sys.stdout.write(ET.tostring(root).encode('utf-8'))
-        sys.stdout.flush()
+        with self.metrics.span('render'):
+            root = ET.Element('items')
+            for item in self._items:
+                root.append(item.elem)
+            output = ET.tostring(root).encode('utf-8')
+            sys.stdout.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+        self.metrics.count('items', len(self._items))
+        self.metrics.count('bytes', len(output))
 
     ####################################################################
     # Updating methods
@@ -2701,6 +3281,144 @@ class Workflow(object):
         self.magic_arguments['magic'] = list_magic
         self.magic_arguments['version'] = show_version
 
+        def parse_runs(value):
+            """Return ``value`` as a positive ``int`` or ``None``."""
+            try:
+                runs = int(value)
+            except ValueError:
+                return None
+            return runs if runs > 0 else None
+
+        # Metrics
+        def metrics_on():
+            self.settings['__workflow_metrics'] = True
+            return 'Metrics turned on'
+
+        def metrics_off():
+            self.settings['__workflow_metrics'] = False
+            return 'Metrics turned off'
+
+        def show_metrics(runs=None):
+            """Display percentiles of recent runs in Alfred.
+
+            Summarises the last ``runs`` runs (default
+            :data:`~workflow.metrics.SUMMARY_RUNS`), e.g.
+            ``workflow:metrics 20``.
+
+            """
+            from metrics import get_metrics, SUMMARY_RUNS
+            if runs is None:
+                runs = SUMMARY_RUNS
+            else:
+                runs = parse_runs(runs)
+                if not runs:
+                    return 'Number of runs must be a positive integer'
+
+            metrics = get_metrics(self.cachefile('metrics.jsonl'))
+            summary = metrics.summary(runs)
+            if not summary['runs']:
+                return 'No metrics recorded'
+
+            isatty = sys.stderr.isatty()
+            title = 'Last {0} runs'.format(summary['runs'])
+            rows = [(title, 'p50 / p90 / p99')]
+            for name, pc in sorted(summary['timings'].items()):
+                rows.append((name, ' / '.join(
+                    ['{0:0.1f}ms'.format(pc[p] * 1000)
+                     for p in (50, 90, 99)])))
+            for name, pc in sorted(summary['counts'].items()):
+                rows.append((name, ' / '.join(
+                    ['{0}'.format(pc[p]) for p in (50, 90, 99)])))
+
+            for name, values in rows:
+                self.logger.info('%-20s %s', name, values)
+                if not isatty:
+                    self.add_item(name, values, icon=ICON_INFO)
+
+            if not isatty:
+                self.send_feedback()
+            sys.exit(0)
+
+        self.magic_arguments['metricson'] = metrics_on
+        self.magic_arguments['metricsoff'] = metrics_off
+        self.magic_arguments['metrics'] = show_metrics
+
+        # Profiling
+        def profile_on(runs=None):
+            """Profile the next ``runs`` runs (default :data:`PROFILE_RUNS`).
+
+            E.g. ``workflow:profileon 20``.
+
+            """
+            if runs is None:
+                runs = PROFILE_RUNS
+            else:
+                runs = parse_runs(runs)
+                if not runs:
+                    return 'Number of runs must be a positive integer'
+
+            self.clear_cache(lambda f: f == 'profiles')
+            self.settings['__workflow_profile_runs'] = runs
+            return 'Profiling the next {0} runs'.format(runs)
+
+        def profile_off():
+            if '__workflow_profile_runs' in self.settings:
+                del self.settings['__workflow_profile_runs']
+            return 'Profiling turned off'
+
+        def profile_dump():
+            path = self.dump_profile()
+            if not path:
+                return 'No profiles recorded'
+            if sys.stdout.isatty():
+                with open(path, 'rb') as file_obj:
+                    print(file_obj.read())
+            else:
+                subprocess.call(['open', path])
+            return 'Profile report saved to {0}'.format(path)
+
+        self.magic_arguments['profileon'] = profile_on
+        self.magic_arguments['profileoff'] = profile_off
+        self.magic_arguments['profiledump'] = profile_dump
+
+    def dump_profile(self, top=PROFILE_TOP):
+        """Merge saved profiles and write a report to :attr:`cachedir`.
+
+        .. versionadded:: 1.24
+
+        The stats of all runs profiled since ``workflow:profileon`` are
+        combined and the ``top`` functions by cumulative time are written
+        to ``profile.txt`` in :attr:`cachedir`.
+
+        :param top: number of functions to include in report
+        :type top: ``int``
+        :returns: path to report or ``None`` if there are no profiles
+        :rtype: ``unicode``
+
+        """
+        import pstats
+        from StringIO import StringIO
+
+        dirpath = self.cachefile('profiles')
+        if not os.path.exists(dirpath):
+            return None
+
+        paths = [os.path.join(dirpath, fn)
+                 for fn in sorted(os.listdir(dirpath)) if fn.endswith('.prof')]
+        if not paths:
+            return None
+
+        stream = StringIO()
+        stats = pstats.Stats(*paths, stream=stream)
+        stream.write(b'{0} profiled runs\n'.format(len(paths)))
+        stats.sort_stats('cumulative').print_stats(top)
+
+        path = self.cachefile('profile.txt')
+        with atomic_writer(path, 'wb') as file_obj:
+            file_obj.write(stream.getvalue())
+
+        return path
+
     def clear_cache(self, filter_func=lambda f: True):
         """Delete all files in workflow's :attr:`cachedir`.
 
@@ -2820,11 +3538,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-        text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
-        return unicode(unicodedata.normalize('NFKD',
-                       text).encode('ascii', 'ignore'))
+        return fold_to_ascii(text)
 
     def dumbify_punctuation(self, text):
         """Convert non-ASCII punctuation to closest ASCII equivalent.
@@ -2841,11 +3555,7 @@ class Workflow(object):
         :rtype: ``unicode``
 
         """
-        if isascii(text):
-            return text
-
-        text = ''.join([DUMB_PUNCTUATION.get(c, c) for c in text])
-        return text
+        return dumbify_punctuation(text)
 
     def _delete_directory_contents(self, dirpath, filter_func):
         """Delete all files in a directory.
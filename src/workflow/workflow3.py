@@ -440,6 +440,16 @@ class Workflow3(Workflow):
         return o
 
     def send_feedback(self):
-        """Print stored items to console/Alfred as JSON."""
-        json.dump(self.obj, sys.stdout)
-        sys.stdout.flush()
+        """Print stored items to console/Alfred as JSON.
+
+        Returns:
+            str: The JSON written to stdout, e.g. for caching.
+        """
+        with self.metrics.span('render'):
+            output = json.dumps(self.obj)
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+        self.metrics.count('items', len(self._items))
+        self.metrics.count('bytes', len(output))
+        return output
@@ -0,0 +1,316 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-24
+#
+
+"""Differential tests of `Workflow.filter()`.
+
+`Workflow.filter()` must return exactly the same results (items,
+scores, rules and order) as the original item-by-item implementation
+from Alfred-Workflow 1.23.1, a copy of which is frozen below. Random
+keys are filtered with random queries and every combination of
+`MATCH_*` rules, item by item, with a `KeyIndex` and with a `KeyIndex`
+with trigram posting lists.
+
+With a deadline that has already passed, the results must be exactly
+those of the original with only the cheap rules.
+
+Run with `python -m unittest discover -s tests`.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import random
+import re
+import shutil
+import string
+import sys
+import tempfile
+import time
+import unicodedata
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+from workflow import Workflow3
+from workflow.search import CHEAP_RULES, KeyIndex
+from workflow.workflow import (
+    ASCII_REPLACEMENTS,
+    MATCH_ALL,
+    MATCH_ALLCHARS,
+    MATCH_ATOM,
+    MATCH_CAPITALS,
+    MATCH_INITIALS_CONTAIN,
+    MATCH_INITIALS_STARTSWITH,
+    MATCH_STARTSWITH,
+    MATCH_SUBSTRING,
+)
+
+# Characters keys and queries are made of
+KEY_CHARS = 'abcdexyzABCDEX  ._-/19éüßÆøŁ'
+QUERY_CHARS = 'abcdexyzABé ü.1'
+
+# Number of keys and random queries per combination of rules
+KEYS = 300
+QUERIES = 3
+
+# -------------------------------------------------------------------
+# Original implementation (Alfred-Workflow 1.23.1). Don't change it.
+# Like the original, it uses integer division (Python 2).
+
+INITIALS = string.ascii_uppercase + string.digits
+
+split_on_delimiters = re.compile('[^a-zA-Z0-9]').split
+
+_search_pattern_cache = {}
+
+
+def isascii(text):
+    """Test if ``text`` contains only ASCII characters."""
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def fold_to_ascii(text):
+    """Convert non-ASCII characters to closest ASCII equivalent."""
+    if isascii(text):
+        return text
+    text = ''.join([ASCII_REPLACEMENTS.get(c, c) for c in text])
+    return unicode(unicodedata.normalize('NFKD',
+                   text).encode('ascii', 'ignore'))
+
+
+def search_for_query(query):
+    """Return regex search function for ``query``."""
+    if query in _search_pattern_cache:
+        return _search_pattern_cache[query]
+    pattern = []
+    for c in query:
+        pattern.append('.*?{0}'.format(re.escape(c)))
+    pattern = ''.join(pattern)
+    search = re.compile(pattern, re.IGNORECASE).search
+    _search_pattern_cache[query] = search
+    return search
+
+
+def filter_item(value, query, match_on, fold_diacritics):
+    """Filter ``value`` against ``query`` using rules ``match_on``."""
+    query = query.lower()
+
+    if not isascii(query):
+        fold_diacritics = False
+
+    if fold_diacritics:
+        value = fold_to_ascii(value)
+
+    if not set(query) <= set(value.lower()):
+        return (0, None)
+
+    if match_on & MATCH_STARTSWITH and value.lower().startswith(query):
+        score = 100.0 - (len(value) / len(query))
+        return (score, MATCH_STARTSWITH)
+
+    if match_on & MATCH_CAPITALS:
+        initials = ''.join([c for c in value if c in INITIALS])
+        if initials.lower().startswith(query):
+            score = 100.0 - (len(initials) / len(query))
+            return (score, MATCH_CAPITALS)
+
+    if (match_on & MATCH_ATOM or
+            match_on & MATCH_INITIALS_CONTAIN or
+            match_on & MATCH_INITIALS_STARTSWITH):
+        atoms = [s.lower() for s in split_on_delimiters(value)]
+        initials = ''.join([s[0] for s in atoms if s])
+
+    if match_on & MATCH_ATOM:
+        if query in atoms:
+            score = 100.0 - (len(value) / len(query))
+            return (score, MATCH_ATOM)
+
+    if (match_on & MATCH_INITIALS_STARTSWITH and
+            initials.startswith(query)):
+        score = 100.0 - (len(initials) / len(query))
+        return (score, MATCH_INITIALS_STARTSWITH)
+
+    elif (match_on & MATCH_INITIALS_CONTAIN and
+            query in initials):
+        score = 95.0 - (len(initials) / len(query))
+        return (score, MATCH_INITIALS_CONTAIN)
+
+    if match_on & MATCH_SUBSTRING and query in value.lower():
+        score = 90.0 - (len(value) / len(query))
+        return (score, MATCH_SUBSTRING)
+
+    if match_on & MATCH_ALLCHARS:
+        search = search_for_query(query)
+        match = search(value)
+        if match:
+            score = 100.0 / ((1 + match.start()) *
+                             (match.end() - match.start() + 1))
+            return (score, MATCH_ALLCHARS)
+
+    return (0, None)
+
+
+def original_filter(query, items, key=lambda x: x, ascending=False,
+                    include_score=False, min_score=0, max_results=0,
+                    match_on=MATCH_ALL, fold_diacritics=True):
+    """Fuzzy search filter. Returns list of ``items`` that match ``query``."""
+    query = query.strip()
+    results = []
+
+    for item in items:
+        skip = False
+        score = 0
+        words = [s.strip() for s in query.split(' ')]
+        value = key(item).strip()
+        if value == '':
+            continue
+        for word in words:
+            if word == '':
+                continue
+            s, rule = filter_item(value, word, match_on, fold_diacritics)
+
+            if not s:
+                skip = True
+            score += s
+
+        if skip:
+            continue
+
+        if score:
+            results.append(((100.0 / score, value.lower(), score),
+                            (item, score, rule)))
+
+    results.sort(reverse=ascending)
+    results = [t[1] for t in results]
+
+    if min_score:
+        results = [r for r in results if r[1] > min_score]
+
+    if max_results and len(results) > max_results:
+        results = results[:max_results]
+
+    if include_score:
+        return results
+
+    return [t[0] for t in results]
+
+# -------------------------------------------------------------------
+
+
+def make_key(rnd):
+    """Return a random search key."""
+    return ''.join([rnd.choice(KEY_CHARS)
+                    for _ in range(rnd.randint(0, 30))])
+
+
+def make_query(rnd):
+    """Return a random query of one or more words."""
+    while True:
+        words = [''.join([rnd.choice(QUERY_CHARS)
+                          for _ in range(rnd.randint(1, 5))])
+                 for _ in range(rnd.randint(1, 3))]
+        query = ' '.join(words)
+        if query.strip():
+            return query
+
+
+class FilterTests(unittest.TestCase):
+    """Compare `Workflow.filter()` with the original."""
+
+    def setUp(self):
+        """Create workflow with temporary data and cache directories."""
+        self.tempdir = tempfile.mkdtemp()
+        self._env = {}
+        for name in ('alfred_workflow_data', 'alfred_workflow_cache'):
+            self._env[name] = os.environ.get(name)
+            os.environ[name] = os.path.join(self.tempdir, name)
+
+        self.wf = Workflow3()
+        rnd = random.Random(1)
+        keys = [make_key(rnd) for _ in range(KEYS)]
+        self.items = [(k, i) for i, k in enumerate(keys)]
+        self.indices = (
+            ('item by item', None),
+            ('index', KeyIndex(keys)),
+            ('trigrams', KeyIndex(keys).build(trigrams=True)),
+        )
+
+    def tearDown(self):
+        """Restore environment and delete temporary directory."""
+        for name, value in self._env.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+        shutil.rmtree(self.tempdir)
+
+    def cases(self, seed):
+        """Generate `(query, options)` for every combination of rules."""
+        rnd = random.Random(seed)
+        for match_on in range(1, MATCH_ALL + 1):
+            for _ in range(QUERIES):
+                yield make_query(rnd), dict(
+                    match_on=match_on,
+                    fold_diacritics=rnd.choice([True, False]),
+                    min_score=rnd.choice([0, 0, 30, 80]),
+                    max_results=rnd.choice([0, 0, 1, 10]),
+                    ascending=rnd.choice([True, False]),
+                    include_score=True,
+                )
+
+    def assertSameResults(self, query, opts, name, results, expected):
+        """Fail with a helpful message if results differ."""
+        self.assertEqual(
+            results, expected,
+            '{0}: query={1!r}, options={2!r}: {3} results, expected '
+            '{4}'.format(name, query, opts, len(results), len(expected)))
+
+    def test_complete(self):
+        """Same results as original"""
+        key = lambda x: x[0]  # noqa: E731
+        for query, opts in self.cases(2):
+            expected = original_filter(query, self.items, key, **opts)
+            for name, index in self.indices:
+                results = self.wf.filter(query, self.items, key,
+                                         index=index, **opts)
+                self.assertTrue(self.wf.filter_complete)
+                self.assertSameResults(query, opts, name, results, expected)
+
+                # Deadline that doesn't pass
+                results = self.wf.filter(query, self.items, key,
+                                         index=index,
+                                         deadline=time.time() + 3600, **opts)
+                self.assertTrue(self.wf.filter_complete)
+                self.assertSameResults(query, opts, name + ' + deadline',
+                                       results, expected)
+
+    def test_deadline(self):
+        """Same results as original with cheap rules if deadline passed"""
+        key = lambda x: x[0]  # noqa: E731
+        for query, opts in self.cases(3):
+            cheap = dict(opts, match_on=opts['match_on'] & CHEAP_RULES)
+            expected = original_filter(query, self.items, key, **cheap)
+            for name, index in self.indices:
+                results = self.wf.filter(query, self.items, key,
+                                         index=index,
+                                         deadline=time.time() - 1, **opts)
+                if opts['match_on'] & ~CHEAP_RULES:
+                    self.assertFalse(self.wf.filter_complete,
+                                     '{0}: {1!r}'.format(name, opts))
+                self.assertSameResults(query, opts, name + ' + deadline',
+                                       results, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2016 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2016-11-24
+#
+
+"""Tests for the file watchers in `workflow.background`.
+
+The polling and inotify backends are tested (inotify only on Linux),
+kqueue only where it's available (BSD/macOS).
+
+Run with `python -m unittest discover -s tests`.
+"""
+
+from __future__ import print_function, unicode_literals, absolute_import
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+from workflow import background
+from workflow.background import (
+    InotifyWatcher,
+    KqueueWatcher,
+    PollingWatcher,
+    get_watcher,
+)
+
+# Seconds to wait for changes. Long enough for a slow machine
+TIMEOUT = 2.0
+
+
+def write(path, data):
+    """Write `data` to `path`."""
+    with open(path, 'wb') as fp:
+        fp.write(data)
+
+
+class WatcherTests(object):
+    """Tests run against every backend.
+
+    Subclasses set `backend` and mix in `unittest.TestCase`.
+    """
+
+    backend = None
+
+    def setUp(self):
+        """Create temporary directory with a "plist" and a folder."""
+        self.tempdir = os.path.realpath(tempfile.mkdtemp())
+        self.plist = os.path.join(self.tempdir, 'prefs.plist')
+        self.folder = os.path.join(self.tempdir, 'Favourite')
+        write(self.plist, b'v1')
+        os.mkdir(self.folder)
+
+    def tearDown(self):
+        """Delete temporary directory."""
+        shutil.rmtree(self.tempdir)
+
+    def watcher(self, paths):
+        """Return watcher for `paths`."""
+        return get_watcher(paths, self.backend)
+
+    def test_backend(self):
+        """Requested backend is used"""
+        with self.watcher([self.plist]) as w:
+            self.assertEqual(w.backend, self.backend)
+
+    def test_timeout(self):
+        """Nothing changed"""
+        with self.watcher([self.plist, self.folder]) as w:
+            self.assertEqual(w.wait(0.2), [])
+
+    def test_modified(self):
+        """File modified"""
+        with self.watcher([self.plist, self.folder]) as w:
+            write(self.plist, b'version 2')
+            self.assertEqual(w.wait(TIMEOUT), [self.plist])
+            # Change is only reported once
+            self.assertEqual(w.wait(0.2), [])
+
+    def test_replaced(self):
+        """File atomically replaced"""
+        with self.watcher([self.plist]) as w:
+            temp = self.plist + '.tmp'
+            write(temp, b'v2')
+            os.rename(temp, self.plist)
+            self.assertEqual(w.wait(TIMEOUT), [self.plist])
+
+    def test_deleted(self):
+        """File deleted"""
+        with self.watcher([self.plist]) as w:
+            os.unlink(self.plist)
+            self.assertEqual(w.wait(TIMEOUT), [self.plist])
+
+    def test_created(self):
+        """Missing file created in missing directory"""
+        path = os.path.join(self.tempdir, 'Support', 'RecentItems.plist')
+        with self.watcher([self.plist, path]) as w:
+            os.mkdir(os.path.dirname(path))
+            self.assertEqual(w.wait(0.2), [])
+            write(path, b'v1')
+            self.assertEqual(w.wait(TIMEOUT), [path])
+
+    def test_folder(self):
+        """File added to watched folder"""
+        with self.watcher([self.plist, self.folder]) as w:
+            write(os.path.join(self.folder, 'new.txt'), b'x')
+            self.assertEqual(w.wait(TIMEOUT), [self.folder])
+
+    def test_unrelated(self):
+        """Other files in the same directory are ignored"""
+        with self.watcher([self.plist]) as w:
+            write(os.path.join(self.tempdir, 'other.plist'), b'x')
+            self.assertEqual(w.wait(0.5), [])
+
+
+class PollingWatcherTests(WatcherTests, unittest.TestCase):
+    """Polling backend."""
+
+    backend = 'poll'
+
+    def watcher(self, paths):
+        """Return watcher that polls frequently."""
+        return PollingWatcher(paths, interval=0.05)
+
+
+@unittest.skipIf(background._inotify_libc() is None,
+                 'inotify not available')
+class InotifyWatcherTests(WatcherTests, unittest.TestCase):
+    """inotify backend."""
+
+    backend = 'inotify'
+
+    def test_event(self):
+        """Change made while waiting wakes the watcher at once"""
+        with self.watcher([self.plist]) as w:
+            timer = threading.Timer(0.2, write, (self.plist, b'version 2'))
+            timer.start()
+            start = time.time()
+            try:
+                self.assertEqual(w.wait(TIMEOUT), [self.plist])
+            finally:
+                timer.join()
+            self.assertLess(time.time() - start, 0.2 + 0.5)
+
+
+@unittest.skipUnless(hasattr(background.select, 'kqueue'),
+                     'kqueue not available')
+class KqueueWatcherTests(WatcherTests, unittest.TestCase):
+    """kqueue backend."""
+
+    backend = 'kqueue'
+
+
+class GetWatcherTests(unittest.TestCase):
+    """Choice of backend."""
+
+    def test_unknown(self):
+        """Unknown backend"""
+        with self.assertRaises(ValueError):
+            get_watcher([], 'fsevents')
+
+    def test_default(self):
+        """Best available backend"""
+        with get_watcher([]) as w:
+            if hasattr(background.select, 'kqueue'):
+                self.assertIsInstance(w, KqueueWatcher)
+            elif background._inotify_libc() is not None:
+                self.assertIsInstance(w, InotifyWatcher)
+            else:
+                self.assertIsInstance(w, PollingWatcher)
+
+
+if __name__ == '__main__':
+    unittest.main()